@@ -34,6 +34,13 @@ class GameAdmin(admin.ModelAdmin):
     list_display = ('pk', 'openligadb_match_id', '__str__', 'round', 'kickoff', 'deadline', 'result_str', 'venue')
     list_filter = ['round', 'kickoff', 'deadline', 'venue']
 
+    def save_model(self, request, obj, form, change):
+        # entering a result only writes the result fields
+        if change and form.changed_data and set(form.changed_data) <= {'homegoals', 'awaygoals'}:
+            obj.set_result_goals(obj.homegoals, obj.awaygoals)
+        else:
+            super().save_model(request, obj, form, change)
+
 
 class BetAdmin(admin.ModelAdmin):
     list_display = ('__str__', 'user', 'bettable')
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import weakref
+
+import numpy as np
+from django.utils import timezone
+
+from main.models import Bet, Bettable, Game, MatchdayStatistic, RoundStatistic, Statistic
+from main.scoring import RESULT_BET_TYPES, VOLLTREFFER, classify_goal_diffs, get_scoring_table
+
+# code and points of bets which are not scored (yet), i.e. the game has no result
+NOT_SCORED = -1
+
+
+def goal_diff_codes(scoring_table):
+    """ ScoringTable.codes_by_goal_diffs as array, indexed by the goal differences of bet and result + max_goal_diff """
+    codes = _goal_diff_codes.get(scoring_table)
+    if codes is None:
+        size = 2 * scoring_table.max_goal_diff + 1
+        codes = np.empty((size, size), dtype=np.int8)
+        for (bet_diff, result_diff), code in scoring_table.codes_by_goal_diffs.items():
+            codes[bet_diff + scoring_table.max_goal_diff, result_diff + scoring_table.max_goal_diff] = code
+        _goal_diff_codes[scoring_table] = codes
+    return codes
+
+
+_goal_diff_codes = weakref.WeakKeyDictionary()
+
+
+def score_game_bets(scoring_table, bet_homegoals, bet_awaygoals, result_homegoals, result_awaygoals):
+    """
+        Vectorized counterpart of ScoringTable.score_game_bet(): scores arrays of bet goals against
+        arrays of result goals of the same length in one pass. Negative result goals mean no result.
+        Returns the arrays of result bet type codes and points, NOT_SCORED for bets without a result.
+    """
+    bet_diffs = bet_homegoals.astype(np.int32) - bet_awaygoals
+    result_diffs = result_homegoals.astype(np.int32) - result_awaygoals
+
+    # looked up like ScoringTable.game_bet_code(), goal differences beyond the table are classified one by one
+    max_goal_diff = scoring_table.max_goal_diff
+    in_table = (np.abs(bet_diffs) <= max_goal_diff) & (np.abs(result_diffs) <= max_goal_diff)
+    codes = np.empty(len(bet_diffs), dtype=np.int8)
+    codes[in_table] = goal_diff_codes(scoring_table)[bet_diffs[in_table] + max_goal_diff,
+                                                     result_diffs[in_table] + max_goal_diff]
+    codes[~in_table] = [classify_goal_diffs(bet_diff, result_diff) for bet_diff, result_diff
+                        in zip(bet_diffs[~in_table].tolist(), result_diffs[~in_table].tolist())]
+    codes[(bet_homegoals == result_homegoals) & (bet_awaygoals == result_awaygoals)] = VOLLTREFFER
+
+    points = np.asarray(scoring_table.points_by_code, dtype=np.int16)[codes]
+    unscored = (result_homegoals < 0) | (result_awaygoals < 0)
+    codes[unscored] = NOT_SCORED
+    points[unscored] = NOT_SCORED
+    return codes, points
+
+
+class BetsMatrix:
+    """
+        All game bets as compact integer arrays, one entry per bet: the index of its user in user_ids,
+        the index of its game in game_ids and the bet goals. Results are passed as arrays indexed like game_ids.
+    """
+
+    def __init__(self, bet_ids, user_ids, game_ids, user_indices, game_indices, homegoals_bet, awaygoals_bet):
+        self.bet_ids = bet_ids
+        self.user_ids = user_ids
+        self.game_ids = game_ids
+        self.user_indices = user_indices
+        self.game_indices = game_indices
+        self.homegoals_bet = homegoals_bet
+        self.awaygoals_bet = awaygoals_bet
+
+    @staticmethod
+    def load(bets=None):
+        """ Loads the game bets (of the given queryset) with a single query on their integer goal columns """
+        bets = Bet.objects.all() if bets is None else bets
+        rows = bets \
+            .filter(bettable__kind=Bettable.GAME, homegoals_bet__isnull=False, awaygoals_bet__isnull=False) \
+            .order_by() \
+            .values_list('pk', 'user_id', 'bettable_id', 'homegoals_bet', 'awaygoals_bet')
+        columns = np.array(list(rows), dtype=np.int64).reshape(-1, 5).T
+
+        user_ids, user_indices = np.unique(columns[1], return_inverse=True)
+        game_ids, game_indices = np.unique(columns[2], return_inverse=True)
+        return BetsMatrix(columns[0], user_ids, game_ids, user_indices, game_indices,
+                          columns[3].astype(np.int16), columns[4].astype(np.int16))
+
+    def __len__(self):
+        return len(self.bet_ids)
+
+    def game_results(self):
+        """ Returns the stored results of the games as home and away goals arrays, -1 for no result """
+        results = {pk: (homegoals, awaygoals) for pk, homegoals, awaygoals
+                   in Game.objects.values_list('pk', 'homegoals', 'awaygoals')}
+        homegoals = np.array([results[game_id][0] for game_id in self.game_ids.tolist()], dtype=np.int16)
+        awaygoals = np.array([results[game_id][1] for game_id in self.game_ids.tolist()], dtype=np.int16)
+        return homegoals, awaygoals
+
+    def score(self, result_homegoals, result_awaygoals, scoring_table=None):
+        """ Scores all bets against the given result arrays, returns result bet type codes and points per bet """
+        return score_game_bets(scoring_table or get_scoring_table(),
+                               self.homegoals_bet, self.awaygoals_bet,
+                               result_homegoals[self.game_indices], result_awaygoals[self.game_indices])
+
+    def points_per_user(self, points):
+        """ Sums up the points of the scored bets per user, indexed like user_ids """
+        scored = points != NOT_SCORED
+        return np.bincount(self.user_indices[scored], weights=points[scored],
+                           minlength=len(self.user_ids)).astype(np.int64)
+
+
+def rescore_game_bets(apply_statistics=True):
+    """
+        Re-computes the points of all game bets with the vectorized kernel and bulk updates the changed ones.
+        The deltas are applied to the statistics and the period statistics of the affected users are re-created,
+        unless they are all going to be fully re-calculated anyway.
+        Returns the number of changed bets.
+    """
+    matrix = BetsMatrix.load()
+    if not len(matrix):
+        return 0
+    codes, points = matrix.score(*matrix.game_results())
+
+    stored = {pk: (result_bet_type, old_points) for pk, result_bet_type, old_points in
+              Bet.objects.filter(bettable__kind=Bettable.GAME).values_list('pk', 'result_bet_type', 'points')}
+
+    changed_bets, changes, now = [], [], timezone.now()
+    for bet_id, user_index, code, new_points in zip(matrix.bet_ids.tolist(), matrix.user_indices.tolist(),
+                                                    codes.tolist(), points.tolist()):
+        new_result_bet_type, new_points = \
+            (None, None) if code == NOT_SCORED else (RESULT_BET_TYPES[code], new_points)
+        old_result_bet_type, old_points = stored[bet_id]
+        if (old_result_bet_type, old_points) != (new_result_bet_type, new_points):
+            changed_bets.append(Bet(pk=bet_id, result_bet_type=new_result_bet_type, points=new_points,
+                                    updated_at=now))
+            changes.append((int(matrix.user_ids[user_index]), old_result_bet_type, old_points,
+                            new_result_bet_type, new_points))
+
+    if changed_bets:
+        Bet.objects.bulk_update(changed_bets, ['points', 'result_bet_type', 'updated_at'], batch_size=1000)
+        if apply_statistics:
+            Statistic.apply_bet_changes(changes)
+            user_ids = {change[0] for change in changes}
+            RoundStatistic.recalculate(user_ids)
+            MatchdayStatistic.recalculate(user_ids)
+    return len(changed_bets)
+
+
+def closed_bets_matrix(reference_date):
+    """
+        All bets on bettables whose deadline has passed, in a columnar encoding: the ids of the users
+        and bettables (in deadline order) plus one column of result bets per bettable, aligned with
+        the users and None where a user has not placed a bet. Built from a single query.
+    """
+    bets = list(Bet.objects
+                .filter(bettable__deadline__lt=reference_date)
+                .exclude(result_bet__isnull=True).exclude(result_bet='')
+                .order_by('bettable__deadline', 'bettable_id')
+                .values_list('user_id', 'bettable_id', 'result_bet'))
+
+    user_ids = sorted({user_id for user_id, bettable_id, result_bet in bets})
+    bettable_ids = list(dict.fromkeys(bettable_id for user_id, bettable_id, result_bet in bets))
+    user_positions = {user_id: position for position, user_id in enumerate(user_ids)}
+    bettable_positions = {bettable_id: position for position, bettable_id in enumerate(bettable_ids)}
+
+    result_bets = [[None] * len(user_ids) for bettable_id in bettable_ids]
+    for user_id, bettable_id, result_bet in bets:
+        result_bets[bettable_positions[bettable_id]][user_positions[user_id]] = result_bet
+    return {'users': user_ids, 'bettables': bettable_ids, 'result_bets': result_bets}
+
+
+def seconds_until_next_deadline(reference_date):
+    """ Seconds until the next bettable closes, None if there is none """
+    next_deadline = Bettable.objects.filter(deadline__gte=reference_date).order_by('deadline') \
+        .values_list('deadline', flat=True).first()
+    return max(int((next_deadline - reference_date).total_seconds()), 1) if next_deadline else None
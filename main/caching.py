@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from main import utils
+from main.models import Bettable, Game, TOURNAMENT_DATA_VERSION_KEY
+
+# upper bound of the caching of tournament data, in case a bump of its version got lost
+TOURNAMENT_DATA_CACHE_TIMEOUT = 60 * 60
+
+# the latest response cached by single_flight is kept for this long, also after a new version is due, to be
+# served while that is computed
+SINGLE_FLIGHT_CACHE_TIMEOUT = 60 * 60
+# the lock of the computing worker expires after this many seconds, so a crashed worker cannot wedge the endpoint
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+# without a previous version, other workers wait at most this many seconds for the result before computing it
+SINGLE_FLIGHT_WAIT = 2
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+def tournament_data_cache_timeout():
+    """
+        Responses containing tournament data may depend on whether deadlines or kickoffs have passed (bets_open,
+        kicked_off filters), so they must not be cached beyond the next one. The scheduler also bumps the
+        version at these moments, this is the fallback if it is not running.
+    """
+    reference_date = utils.get_reference_date()
+    next_deadline = Bettable.objects.filter(deadline__gte=reference_date).order_by('deadline') \
+        .values_list('deadline', flat=True).first()
+    next_kickoff = Game.objects.filter(kickoff__gte=reference_date).order_by('kickoff') \
+        .values_list('kickoff', flat=True).first()
+    upcoming = [moment for moment in (next_deadline, next_kickoff) if moment is not None]
+    if not upcoming:
+        return TOURNAMENT_DATA_CACHE_TIMEOUT
+    return max(min(TOURNAMENT_DATA_CACHE_TIMEOUT, int((min(upcoming) - reference_date).total_seconds())), 1)
+
+
+def passed_moments_validator():
+    """
+        Number of passed deadlines and kickoffs, with a single query. Part of the validators of all responses
+        which depend on them, in case the scheduler does not bump the data versions at these moments.
+    """
+    reference_date = utils.get_reference_date()
+    passed = Bettable.objects.aggregate(deadlines=Count('pk', filter=Q(deadline__lt=reference_date)),
+                                        kickoffs=Count('game', filter=Q(game__kickoff__lte=reference_date)))
+    return '%i:%i' % (passed['deadlines'], passed['kickoffs'])
+
+
+class ConditionalListMixin:
+    """
+        Answers list requests whose If-None-Match matches the current ETag with 304 Not Modified, before the
+        queryset is evaluated or anything is serialized. The ETag is a hash of the full path and of
+        get_list_validator(request), which viewsets (or mixins listed after this one) implement
+        with a cheap query or a data version. Viewsets overriding list wrap their response with conditional_response.
+        There is no Last-Modified: a timestamp does not reflect deleted rows or bets revealed at a deadline.
+    """
+
+    def list(self, request, *args, **kwargs):
+        parent = super(ConditionalListMixin, self)
+        return self.conditional_response(request, lambda: parent.list(request, *args, **kwargs))
+
+    def conditional_response(self, request, get_response):
+        validator = '%s|%s' % (request.get_full_path(), self.get_list_validator(request))
+        etag = '"%s"' % hashlib.sha1(validator.encode('utf-8')).hexdigest()
+        # weak comparison, proxies compressing the response (e.g. nginx) mark the ETag as weak
+        if etag in (tag[2:] if tag.startswith('W/') else tag
+                    for tag in parse_etags(request.headers.get('If-None-Match', ''))):
+            response = HttpResponseNotModified()
+        else:
+            response = get_response()
+        # a stale response (cf. single_flight) does not match the current validator, so it must not be revalidated
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED) and \
+                not getattr(response, 'stale', False):
+            response['ETag'] = etag
+        return response
+
+
+class TournamentDataCacheMixin:
+    """
+        Caches the list and retrieve responses of a viewset of tournament data (groups, rounds, teams, venues,
+        games, extras) by full path, including the query parameters. The keys contain the tournament data
+        version, which is bumped whenever one of these models changes, so the cache is coherent across processes
+        as long as the cache backend is shared (cf. the production settings).
+    """
+
+    def get_list_validator(self, request):
+        return '%s:%s' % (utils.get_version(TOURNAMENT_DATA_VERSION_KEY), passed_moments_validator())
+
+    def cached_response(self, request, get_response):
+        key = 'tournament_data:%s:%s' % (utils.get_version(TOURNAMENT_DATA_VERSION_KEY), request.get_full_path())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, tournament_data_cache_timeout())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(TournamentDataCacheMixin, self).list(
+            request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(TournamentDataCacheMixin, self).retrieve(
+            request, *args, **kwargs))
+
+
+def single_flight(name, get_version):
+    """
+        Decorates a viewset method (self, request, ...) returning a Response, whose data is cached by name and full
+        path along with get_version(view, request). If the version has changed, only one worker re-computes the
+        response while holding a lock in the cache. The others get the previous version right away
+        (stale-while-revalidate), marked as stale so that no ETag is sent along, or, if there is none, wait for the
+        result and compute it on their own after SINGLE_FLIGHT_WAIT seconds.
+        The cache backend must be shared between the workers for the lock to take effect (cf. the production
+        settings).
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version = str(get_version(self, request))
+            key = 'single_flight:%s:%s' % (name, request.get_full_path())
+            lock_key = key + ':lock'
+
+            latest = cache.get(key)
+            if latest is not None and latest[0] == version:
+                return Response(latest[1])
+
+            if not cache.add(lock_key, version, SINGLE_FLIGHT_LOCK_TIMEOUT):
+                # another worker is computing the response
+                if latest is not None:
+                    response = Response(latest[1])
+                    response.stale = True
+                    return response
+                deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+                    latest = cache.get(key)
+                    if latest is not None and latest[0] == version:
+                        return Response(latest[1])
+                return method(self, request, *args, **kwargs)
+
+            try:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(key, (version, response.data), SINGLE_FLIGHT_CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+            return response
+
+        return wrapper
+
+    return decorator
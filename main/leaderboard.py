@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from django.contrib.auth.models import User
+from django.db.models import Count, F, IntegerField, Max, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, Rank
+
+from main import utils
+from main.bets_matrix import BetsMatrix
+from main.models import Bet, Bettable, Game, RankSnapshot, ResultBetType, Statistic, TOURNAMENT_DATA_VERSION_KEY, \
+    USER_DATA_VERSION_KEY
+from main.scoring import RESULT_BET_TYPES
+
+# same tie resolution as the ordering of the stored statistics: ('-points', '-no_volltreffer', 'user__username')
+LEADERBOARD_ORDERING = (F('points').desc(), F('no_volltreffer').desc(), F('username').asc())
+
+PERIOD_LEADERBOARD_ORDERING = (F('points').desc(), F('no_volltreffer').desc(), F('user__username').asc())
+
+
+def result_bet_type_count(result_bet_type, scored=Q(bet__points__isnull=False)):
+    return Count('bet', filter=Q(bet__result_bet_type=result_bet_type.name) & scored)
+
+
+def aggregated_leaderboard(users, as_of=None):
+    """
+        Computes points, counters and rank of the given users directly from their bets,
+        using one grouped aggregate query and a window function for the rank.
+        Same rules as Statistic.recalculate(): a bet counts as soon as it has points.
+        With as_of, only the results entered by then count, and only the bets on bettables whose deadline had
+        passed by then (the time of placing a bet is unknown). The maximum points are unknown for past leaderboards.
+    """
+    placed, scored = Q(bet__result_bet__gt=''), Q(bet__points__isnull=False)
+    if as_of is not None:
+        placed &= Q(bet__bettable__deadline__lte=as_of)
+        scored &= Q(bet__bettable__result_entered_at__lte=as_of)
+
+    return users \
+        .select_related('profile') \
+        .annotate(no_bets=Count('bet', filter=placed),
+                  no_volltreffer=result_bet_type_count(ResultBetType.volltreffer, scored),
+                  no_differenz=result_bet_type_count(ResultBetType.differenz, scored),
+                  no_remis_tendenz=result_bet_type_count(ResultBetType.remis_tendenz, scored),
+                  no_tendenz=result_bet_type_count(ResultBetType.tendenz, scored),
+                  no_niete=result_bet_type_count(ResultBetType.niete, scored),
+                  points=Coalesce(Sum('bet__points', filter=scored), 0),
+                  max_points=F('statistic__max_points') if as_of is None else Value(None, IntegerField())) \
+        .annotate(rank=Window(Rank(), order_by=LEADERBOARD_ORDERING)) \
+        .order_by(*LEADERBOARD_ORDERING)
+
+
+AS_OF_LEADERBOARD_CACHE_TIMEOUT = 60 * 60
+
+
+def as_of_leaderboard_cache_key(as_of):
+    """
+        Past leaderboards only change with the results entered before as_of, so all points in time between
+        two result entries share one cache entry. This keeps a timeline slider cheap: at most one aggregate
+        query per result entry, every other position is served from the cache.
+        Bets placed since do not change them, so instead of the version of the statistics, the keys contain
+        the versions of the tournament data (e.g. corrected results) and of the users only.
+    """
+    known_results = Bettable.objects \
+        .filter(result_entered_at__lte=as_of) \
+        .aggregate(count=Count('pk'), latest=Max('result_entered_at'))
+    # the deadlines passed by then change the number of bets only
+    passed_deadlines = Bettable.objects.filter(deadline__lte=as_of).count()
+    return 'as_of_leaderboard:%s:%s:%i:%i:%s:%i' % (
+        utils.get_version(TOURNAMENT_DATA_VERSION_KEY), utils.get_version(USER_DATA_VERSION_KEY),
+        utils.active_users().count(), known_results['count'],
+        known_results['latest'].timestamp() if known_results['latest'] else '-', passed_deadlines)
+
+
+def period_leaderboard(period_statistics, period_field):
+    """ Ranks the given round or matchday statistics within their period, with the ordering of the leaderboard """
+    return period_statistics \
+        .select_related('user__profile') \
+        .annotate(rank=Window(Rank(), partition_by=F(period_field), order_by=PERIOD_LEADERBOARD_ORDERING)) \
+        .order_by(period_field, *PERIOD_LEADERBOARD_ORDERING)
+
+
+def set_rank_bounds(statistics, population):
+    """
+        Sets the best and worst still possible rank on the given statistics (or leaderboard users), with the flags
+        whether the user cannot win anymore or has certainly won. population are the (points, max_points) of all
+        users of the leaderboard. Ties are resolved in favour of the user for the best and against it for the worst
+        rank, so a user is only eliminated or has clinched if it is mathematically certain.
+    """
+    points, max_points = (np.sort(np.array(column, dtype=np.int64)) for column in zip(*population)) \
+        if population else (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    for statistic in statistics:
+        # only users with more points than this user could possibly get are certainly ahead ...
+        statistic.best_rank = 1 + len(points) - int(np.searchsorted(points, statistic.max_points, side='right'))
+        # ... while all users who could still reach the points of this user might end up ahead
+        statistic.worst_rank = len(max_points) - int(np.searchsorted(max_points, statistic.points, side='left'))
+        statistic.is_eliminated = statistic.best_rank > 1
+        statistic.has_clinched = statistic.worst_rank == 1
+
+
+# the live scores are part of the cache key, so this only bounds the staleness of the stored statistics
+PROVISIONAL_LEADERBOARD_CACHE_TIMEOUT = 60
+
+
+def live_scores():
+    """ Returns (game id, home goals, away goals) of the started games without result which have a live score """
+    return list(Game.objects
+                .filter(kickoff__lte=utils.get_reference_date())
+                .filter(Q(homegoals=-1) | Q(awaygoals=-1))
+                .exclude(live_homegoals=-1).exclude(live_awaygoals=-1)
+                .order_by('pk')
+                .values_list('pk', 'live_homegoals', 'live_awaygoals'))
+
+
+def provisional_leaderboard_cache_key(scores):
+    return 'provisional_leaderboard:%s:%s' % (utils.get_version(Statistic.VERSION_KEY),
+                                              ','.join('%i-%i:%i' % score for score in scores))
+
+
+def provisional_leaderboard(statistics, scores):
+    """
+        Computes the leaderboard as if the running games ended with their live scores, without persisting anything.
+        Only the bets on the live games are scored, their points and counters are added to the stored statistics.
+        Returns the statistics ordered like the leaderboard, with their live_points and rank set.
+    """
+    statistics = list(statistics)
+    for statistic in statistics:
+        statistic.live_points = 0
+
+    matrix = BetsMatrix.load(Bet.objects.filter(bettable_id__in=[game_id for game_id, *goals in scores]))
+    if len(matrix):
+        goals_by_game = {game_id: goals for game_id, *goals in scores}
+        result_homegoals, result_awaygoals = (np.array(column, dtype=np.int16) for column in
+                                              zip(*(goals_by_game[game_id] for game_id in matrix.game_ids.tolist())))
+        codes, points = matrix.score(result_homegoals, result_awaygoals)
+
+        live_points = dict(zip(matrix.user_ids.tolist(), matrix.points_per_user(points).tolist()))
+        live_counters = {
+            result_bet_type: dict(zip(matrix.user_ids.tolist(), np.bincount(
+                matrix.user_indices[codes == code], minlength=len(matrix.user_ids)).tolist()))
+            for code, result_bet_type in enumerate(RESULT_BET_TYPES)
+        }
+        for statistic in statistics:
+            statistic.live_points = live_points.get(statistic.user_id, 0)
+            statistic.points += statistic.live_points
+            for result_bet_type, counters in live_counters.items():
+                field = Statistic.counter_field(result_bet_type)
+                setattr(statistic, field, getattr(statistic, field) + counters.get(statistic.user_id, 0))
+
+    # same ordering as LEADERBOARD_ORDERING
+    statistics.sort(key=lambda statistic: (-statistic.points, -statistic.no_volltreffer, statistic.user.username))
+    for rank, statistic in enumerate(statistics, start=1):
+        statistic.rank = rank
+    return statistics
+
+
+def rank_history(user_id=None):
+    """
+        Rank curves from the snapshots taken after each finished game, in kickoff order. With a user_id, returns
+        the rank and points of that user per snapshot. Otherwise returns the whole race chart: the games and,
+        for every user, one rank and points per game (None if the user was not part of that snapshot).
+    """
+    snapshots = [(snapshot.game_id, snapshot.get_ranks()) for snapshot in RankSnapshot.objects.all()]
+    if user_id is not None:
+        return [{'game': game_id, 'rank': ranks[user_id][0], 'points': ranks[user_id][1]}
+                for game_id, ranks in snapshots if user_id in ranks]
+
+    user_ids = set().union(*(ranks.keys() for game_id, ranks in snapshots))
+    usernames = dict(User.objects.filter(pk__in=user_ids).values_list('pk', 'username'))
+    # users are ordered by their latest rank
+    latest_ranks = snapshots[-1][1] if snapshots else {}
+    return {
+        'games': [game_id for game_id, ranks in snapshots],
+        'users': [{'user': user_id, 'username': usernames.get(user_id),
+                   'ranks': [ranks[user_id][0] if user_id in ranks else None for game_id, ranks in snapshots],
+                   'points': [ranks[user_id][1] if user_id in ranks else None for game_id, ranks in snapshots]}
+                  for user_id in sorted(user_ids, key=lambda user_id: (latest_ranks.get(user_id, (len(user_ids),))[0],
+                                                                       usernames.get(user_id) or ''))],
+    }
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+
+ENDPOINTS = ('/rtg/games/', '/rtg/bettables/', '/rtg/statistics/', '/rtg/bets/')
+
+
+class Command(BaseCommand):
+    help = 'Compares full list responses with conditional requests answered by 304 Not Modified on the current data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed requests per endpoint and kind')
+        parser.add_argument('--user', help='Username of the requesting user, defaults to the first active user')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        users = User.objects.filter(is_active=True).order_by('pk')
+        user = users.filter(username=options['user']).first() if options['user'] else users.first()
+        if user is None:
+            raise CommandError('No such user')
+
+        client = APIClient()
+        client.force_authenticate(user)
+        self.stdout.write('as %s, %i requests each' % (user.username, repeat))
+        self.stdout.write('%-18s %10s %10s %8s %8s %8s %8s' % ('endpoint', 'full ms', '304 ms', 'bytes', 'queries',
+                                                              '304 qs', 'saved'))
+        for endpoint in ENDPOINTS:
+            response = client.get(endpoint)
+            if 'ETag' not in response:
+                self.stdout.write('%-18s %s' % (endpoint, 'status %i without ETag' % response.status_code))
+                continue
+
+            full_ms, full_queries = self.benchmark(repeat, lambda: client.get(endpoint))
+            not_modified_ms, not_modified_queries = self.benchmark(
+                repeat, lambda: client.get(endpoint, HTTP_IF_NONE_MATCH=response['ETag']))
+            self.stdout.write('%-18s %10.2f %10.2f %8i %8i %8i %7.0f%%' % (
+                endpoint, full_ms, not_modified_ms, len(response.content), full_queries, not_modified_queries,
+                100 * (1 - not_modified_ms / full_ms)))
+
+    def benchmark(self, repeat, request):
+        """ Returns the mean duration in ms and the number of queries of the given request """
+        queries = []
+        # the test client resets connection.queries on every request, so the queries are counted by a wrapper
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            request()  # warm up
+        start = time.perf_counter()
+        for i in range(repeat):
+            request()
+        return (time.perf_counter() - start) * 1000 / repeat, len(queries)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.leaderboard import aggregated_leaderboard
+from main.models import Statistic
+from main.serializers import LeaderboardSerializer, StatisticSerializer
+from main.utils import active_users
+
+
+class Command(BaseCommand):
+    help = 'Compares the stored statistics leaderboard with the aggregated one on the current data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed runs per leaderboard mode')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        stored = self.benchmark(repeat, lambda: StatisticSerializer(
+            Statistic.objects.filter(user__pk__in=active_users())
+                .select_related('user__profile')
+                .order_by('-points', '-no_volltreffer', 'user__username'), many=True).data)
+        aggregated = self.benchmark(repeat, lambda: LeaderboardSerializer(
+            aggregated_leaderboard(active_users()), many=True).data)
+
+        self.stdout.write('%i active users, %i runs each' % (active_users().count(), repeat))
+        self.stdout.write('stored:     %.2f ms per leaderboard' % stored)
+        self.stdout.write('aggregated: %.2f ms per leaderboard' % aggregated)
+        self.stdout.write("Set LEADERBOARD_MODE = '%s' for the faster path on this data."
+                          % ('stored' if stored <= aggregated else 'aggregated'))
+
+    def benchmark(self, repeat, compute):
+        compute()  # warm up
+        start = time.perf_counter()
+        for i in range(repeat):
+            compute()
+        return (time.perf_counter() - start) * 1000 / repeat
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from main.models import BetsSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Freezes the bets of all bettables whose deadline has passed into snapshots ' \
+           '(done right at each deadline by run_scheduler)'
+
+    def handle(self, *args, **options):
+        for snapshot in BetsSnapshot.build_missing():
+            self.stdout.write('Built snapshot of bettable %i (%i bytes)' % (snapshot.bettable_id, len(snapshot.content)))
@@ -21,7 +21,7 @@ class Command(BaseCommand):
 
     def reset_results(self):
         for bettable in Bettable.objects.all():
-            if hasattr(bettable, 'game'):
+            if bettable.kind == Bettable.GAME:
                 bettable.game.homegoals = -1
                 bettable.game.awaygoals = -1
                 bettable.game.save()
@@ -38,11 +38,11 @@ class Command(BaseCommand):
         print("Generating random results for %i of %i bettables..." % (bettable_ct_to_generate_bets, nr_bettables))
 
         for bettable in Bettable.objects.all().order_by('?')[:bettable_ct_to_generate_bets]:
-            if hasattr(bettable, 'game'):
+            if bettable.kind == Bettable.GAME:
                 bettable.game.homegoals = randrange(5)
                 bettable.game.awaygoals = randrange(5)
                 bettable.game.save()
-            elif hasattr(bettable, 'extra'):
+            elif bettable.kind == Bettable.EXTRA:
                 extra_choices = ExtraChoice.objects.filter(extra=bettable)
                 bettable.result = str(random.choice(extra_choices))
                 bettable.save()
\ No newline at end of file
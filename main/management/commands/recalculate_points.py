@@ -1,11 +1,110 @@
 # -*- coding: utf-8 -*-
-from django.contrib.auth.models import User
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from main import utils
+from main.bets_matrix import rescore_game_bets
+from main.models import Bet, Extra, MatchdayStatistic, RankSnapshot, RoundStatistic, Statistic
+
+STATISTIC_FIELDS = ('no_bets', 'no_volltreffer', 'no_differenz', 'no_remis_tendenz', 'no_tendenz', 'no_niete',
+                    'points')
+
+
+def compute_statistics(user_ids, chunk_size):
+    """
+        Computes the statistic fields of the given users by streaming their bets in chunks.
+        Same rules as Statistic.update(): a bet counts as soon as it has been placed,
+        its points as soon as the bettable has a result and the bet has points.
+    """
+    statistics = {user_id: dict.fromkeys(STATISTIC_FIELDS, 0) for user_id in user_ids}
+    bets = Bet.objects \
+        .filter(user_id__in=user_ids) \
+        .exclude(result_bet__isnull=True).exclude(result_bet='') \
+        .order_by() \
+        .values_list('user_id', 'result_bet_type', 'points', 'bettable__result')
+
+    for user_id, result_bet_type, points, bettable_result in bets.iterator(chunk_size=chunk_size):
+        statistic = statistics[user_id]
+        statistic['no_bets'] += 1
+        if bettable_result and points is not None:
+            statistic['points'] += points
+            if result_bet_type in Statistic.COUNTED_RESULT_BET_TYPES:
+                statistic[Statistic.counter_field(result_bet_type)] += 1
+    return statistics
+
+
+def close_db_connections():
+    # forked workers must not share the database connections of the parent process
+    connections.close_all()
 
 
 class Command(BaseCommand):
     help = 'Recalculates all points'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes computing the statistics')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of users per task, also the number of rows fetched and written at once')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only print the differences to the stored statistics, without rescoring bets')
+
     def handle(self, *args, **options):
-        for user in User.objects.all():
-            user.statistic.update()
\ No newline at end of file
+        workers, chunk_size, dry_run = options['workers'], options['chunk_size'], options['dry_run']
+        start = time.perf_counter()
+
+        current = {row[0]: dict(zip(STATISTIC_FIELDS, row[1:]))
+                   for row in Statistic.objects.values_list('user_id', *STATISTIC_FIELDS)}
+        user_ids = sorted(current)
+
+        if not dry_run:
+            with transaction.atomic():
+                # the statistics of all users are re-calculated below, so no deltas need to be applied
+                rescore_game_bets(apply_statistics=False)
+                for extra in Extra.objects.all():
+                    Bet.compute_points_of_bettable(extra, recalculated_user_ids=frozenset(user_ids))
+
+        computed = {}
+        for statistics in self.compute_in_chunks(user_ids, workers, chunk_size):
+            computed.update(statistics)
+            elapsed = time.perf_counter() - start
+            self.stdout.write('%i/%i users (%.0f users/s)' % (len(computed), len(user_ids), len(computed) / elapsed))
+
+        changed = {user_id: statistic for user_id, statistic in computed.items() if statistic != current[user_id]}
+        if dry_run:
+            for user_id, statistic in sorted(changed.items()):
+                diffs = ['%s %i -> %i' % (field, current[user_id][field], value)
+                         for field, value in statistic.items() if value != current[user_id][field]]
+                self.stdout.write('user %i: %s' % (user_id, ', '.join(diffs)))
+        else:
+            Statistic.objects.bulk_update([Statistic(user_id=user_id, **statistic)
+                                           for user_id, statistic in changed.items()],
+                                          STATISTIC_FIELDS, batch_size=chunk_size)
+            RoundStatistic.recalculate()
+            MatchdayStatistic.recalculate()
+            RankSnapshot.rebuild()
+            Statistic.update_max_points()
+            utils.bump_version(Statistic.VERSION_KEY)
+
+        self.stdout.write('%s %i of %i statistics in %.2f s' % ('Would update' if dry_run else 'Updated',
+                                                               len(changed), len(user_ids),
+                                                               time.perf_counter() - start))
+
+    def compute_in_chunks(self, user_ids, workers, chunk_size):
+        """ Yields the computed statistics chunk by chunk, in worker processes if more than one is configured """
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        if workers <= 1:
+            for chunk in chunks:
+                yield compute_statistics(chunk, chunk_size)
+            return
+
+        close_db_connections()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=close_db_connections) as executor:
+            futures = [executor.submit(compute_statistics, chunk, chunk_size) for chunk in chunks]
+            for future in as_completed(futures):
+                yield future.result()
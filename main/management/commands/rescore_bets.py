@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main import utils
+from main.bets_matrix import rescore_game_bets
+from main.models import Bet, Bettable, Extra, RankSnapshot, Statistic
+from main.scoring import get_scoring_table
+
+LOG = logging.getLogger('rtg.' + __name__)
+
+
+class Command(BaseCommand):
+    help = 'Rescores all bets with the compiled BET_POINTS rules, e.g. after the rules have been changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--if-changed', action='store_true',
+                            help='Only rescore if the stored points of game bets do not match BET_POINTS')
+
+    def handle(self, *args, **options):
+        scoring_table = get_scoring_table()
+        if options['if_changed'] and not self.rules_changed(scoring_table):
+            self.stdout.write('Stored points match BET_POINTS, nothing to rescore.')
+            return
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            # statistics are kept consistent by the deltas of the re-computed bets, period statistics are re-created
+            no_changed_bets = rescore_game_bets()
+            for extra in Extra.objects.all():
+                Bet.compute_points_of_bettable(extra)
+            Statistic.update_max_points()
+            # the snapshots contain the points of all bettables scored up to their game
+            RankSnapshot.rebuild()
+        utils.bump_version(Statistic.VERSION_KEY)
+
+        msg = 'Rescored bets in %.2f s, %i game bets changed' % (time.perf_counter() - start, no_changed_bets)
+        LOG.info(msg)
+        self.stdout.write(msg)
+
+    def rules_changed(self, scoring_table):
+        """ Only the points per result bet type are configurable, so comparing them detects a change of rules """
+        stored_points = Bet.objects \
+            .filter(bettable__kind=Bettable.GAME, points__isnull=False) \
+            .values_list('result_bet_type', 'points') \
+            .distinct()
+        return any(scoring_table.bet_points.get(result_bet_type) != points
+                   for result_bet_type, points in stored_points)
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from main.scheduler import DeadlineScheduler
+
+
+class Command(BaseCommand):
+    help = 'Runs the scheduler which closes bettables and polls results right at each deadline and kickoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Only catch up with what has been missed and exit, e.g. when run by cron')
+
+    def handle(self, *args, **options):
+        scheduler = DeadlineScheduler()
+        if options['once']:
+            scheduler.start()
+        else:
+            scheduler.run()
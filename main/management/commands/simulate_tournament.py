@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.simulation import simulate_tournament, simulation_cache_key, store_simulation
+
+
+class Command(BaseCommand):
+    help = 'Simulates the remaining games and extras and prints the chances of each user to win, ' \
+           'to reach the top 3 or to finish last'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=None,
+                            help='Number of simulated tournaments, defaults to the SIMULATION_SAMPLES setting')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes')
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the random numbers, for reproducible runs')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        samples = options['samples'] or settings.SIMULATION_SAMPLES
+        cache_key = simulation_cache_key(samples)
+        results = simulate_tournament(samples, options['workers'], options['seed'])
+        store_simulation(cache_key, samples, results)
+
+        self.stdout.write('%-30s %8s %8s %8s' % ('user', 'first', 'top 3', 'last'))
+        for result in results:
+            self.stdout.write('%-30s %7.2f%% %7.2f%% %7.2f%%' % (result['username'], result['first'] * 100,
+                                                              result['top3'] * 100, result['last'] * 100))
+        self.stdout.write('Simulated %i tournaments in %.2f s' % (samples, time.perf_counter() - start))
@@ -17,30 +17,41 @@ LOG = logging.getLogger('rtg.' + __name__)
 
 class Command(BaseCommand):
     args = ''
-    help = 'Check for new results on OpenLigaDB web service'
+    help = 'Check for new results and live scores on OpenLigaDB web service'
 
     def handle(self, *args, **options):
         for game in self.get_started_games_without_result():
-            result = self.fetch_result_from_openligadb(game)
+            match_data = self.fetch_match_data_from_openligadb(game)
+            if not match_data:
+                continue
+
+            result = self.get_result(game, match_data)
             if result:
                 LOG.info('Setting result of game %s to %s' % (game, result))
                 game.set_result_goals(*result)
-                game.save()
+                continue
+
+            live_goals = self.get_live_goals(match_data)
+            if live_goals != (game.live_homegoals, game.live_awaygoals):
+                LOG.info('Setting live score of game %s to %s' % (game, live_goals))
+                game.set_live_goals(*live_goals)
 
     def get_started_games_without_result(self):
         return Game.objects\
+            .select_related('hometeam', 'awayteam', 'round')\
             .filter(kickoff__lte=get_reference_date())\
             .filter(Q(homegoals=-1) | Q(awaygoals=-1))
 
-    def fetch_result_from_openligadb(self, game):
+    def fetch_match_data_from_openligadb(self, game):
         if not game.openligadb_match_id:
             LOG.warning('Cannot fetch result of game %s, OpenLigaDB ID is missing.' % game.pk)
             return None
 
-        resp = requests\
+        return requests\
             .get('https://www.openligadb.de/api/getmatchdata/%s' % game.openligadb_match_id)\
             .json()
 
+    def get_result(self, game, resp):
         game_finished = resp['MatchIsFinished']
         results = resp['MatchResults']
         final_result = self.find_result_by_name(results, 'Endergebnis')
@@ -59,6 +70,14 @@ class Command(BaseCommand):
         LOG.info('No result found for game %s' % game)
         return None
 
+    def get_live_goals(self, resp):
+        """ The score after the latest goal of a running game, 0:0 as long as there are none """
+        goals = resp.get('Goals') or []
+        if not goals:
+            return (0, 0)
+        latest_goal = max(goals, key=lambda goal: (goal['ScoreTeam1'] or 0) + (goal['ScoreTeam2'] or 0))
+        return (latest_goal['ScoreTeam1'], latest_goal['ScoreTeam2'])
+
     def find_result_by_name(self, result_list, result_name):
         matches = [res for res in result_list if res['ResultName'] == result_name]
         return matches[0] if matches else None
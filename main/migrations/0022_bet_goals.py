@@ -0,0 +1,37 @@
+import re
+
+from django.db import migrations, models
+
+GAME_BET_PATTERN = re.compile("^([0-9]{1,2}):([0-9]{1,2})$")
+
+
+def backfill_bet_goals(apps, schema_editor):
+    bet_model = apps.get_model('main', 'Bet')
+    bets = []
+    for bet in bet_model.objects.exclude(result_bet='').only('pk', 'result_bet').iterator():
+        match = GAME_BET_PATTERN.match(bet.result_bet)
+        if match:
+            bet.homegoals_bet, bet.awaygoals_bet = (int(goal) for goal in match.group(1, 2))
+            bets.append(bet)
+    bet_model.objects.bulk_update(bets, ['homegoals_bet', 'awaygoals_bet'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_sites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='homegoals_bet',
+            field=models.SmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bet',
+            name='awaygoals_bet',
+            field=models.SmallIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_bet_goals, migrations.RunPython.noop),
+    ]
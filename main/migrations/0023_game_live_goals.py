@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_bet_goals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='live_awaygoals',
+            field=models.SmallIntegerField(default=-1),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='live_homegoals',
+            field=models.SmallIntegerField(default=-1),
+        ),
+    ]
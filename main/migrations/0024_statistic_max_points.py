@@ -0,0 +1,45 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+
+
+def backfill_max_points(apps, schema_editor):
+    bettable_model = apps.get_model('main', 'Bettable')
+    bet_model = apps.get_model('main', 'Bet')
+    statistic_model = apps.get_model('main', 'Statistic')
+
+    max_game_points = max(settings.BET_POINTS.values())
+    unfinished_bettables = bettable_model.objects.filter(Q(result__isnull=True) | Q(result=''))
+    open_points = sum(extra_points if extra_points is not None else max_game_points for extra_points in
+                      unfinished_bettables.filter(deadline__gt=timezone.now()).values_list('extra__points', flat=True))
+    closed_points_by_user = bet_model.objects \
+        .filter(bettable__in=unfinished_bettables.filter(deadline__lte=timezone.now())) \
+        .exclude(result_bet__isnull=True).exclude(result_bet='') \
+        .order_by() \
+        .values('user_id') \
+        .annotate(attainable=Sum(Case(When(bettable__extra__isnull=False, then=F('bettable__extra__points')),
+                                      default=Value(max_game_points)))) \
+        .values_list('user_id', 'attainable')
+
+    statistic_model.objects.update(max_points=F('points') + open_points)
+    for user_id, closed_points in closed_points_by_user:
+        statistic_model.objects.filter(user_id=user_id).update(max_points=F('points') + open_points + closed_points)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_game_live_goals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistic',
+            name='max_points',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_max_points, migrations.RunPython.noop),
+    ]
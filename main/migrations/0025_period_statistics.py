@@ -0,0 +1,74 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+RESULT_BET_TYPES = ('volltreffer', 'differenz', 'remis_tendenz', 'tendenz', 'niete')
+
+
+def backfill_period_statistics(apps, schema_editor):
+    bets = apps.get_model('main', 'Bet').objects \
+        .filter(bettable__game__isnull=False, points__isnull=False) \
+        .exclude(result_bet__isnull=True).exclude(result_bet='') \
+        .exclude(bettable__result__isnull=True).exclude(bettable__result='')
+    counters = {'no_%s' % result_bet_type: Count('pk', filter=Q(result_bet_type=result_bet_type))
+                for result_bet_type in RESULT_BET_TYPES}
+
+    for model_name, period_field, period in (('RoundStatistic', 'round_id', F('bettable__game__round_id')),
+                                             ('MatchdayStatistic', 'matchday', TruncDate('bettable__game__kickoff'))):
+        model = apps.get_model('main', model_name)
+        aggregates = bets \
+            .annotate(**{period_field: period}) \
+            .order_by() \
+            .values('user_id', period_field) \
+            .annotate(points=Sum('points'), **counters)
+        model.objects.bulk_create([model(**aggregate) for aggregate in aggregates])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0024_statistic_max_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoundStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('no_volltreffer', models.PositiveSmallIntegerField(default=0)),
+                ('no_differenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_remis_tendenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_tendenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_niete', models.PositiveSmallIntegerField(default=0)),
+                ('points', models.PositiveSmallIntegerField(default=0)),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.tournamentround')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'round')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MatchdayStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('no_volltreffer', models.PositiveSmallIntegerField(default=0)),
+                ('no_differenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_remis_tendenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_tendenz', models.PositiveSmallIntegerField(default=0)),
+                ('no_niete', models.PositiveSmallIntegerField(default=0)),
+                ('points', models.PositiveSmallIntegerField(default=0)),
+                ('matchday', models.DateField(db_index=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'matchday')},
+            },
+        ),
+        migrations.RunPython(backfill_period_statistics, migrations.RunPython.noop),
+    ]
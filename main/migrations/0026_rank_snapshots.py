@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0025_period_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankSnapshot',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank_snapshot', serialize=False, to='main.game')),
+                ('created', models.DateTimeField(auto_now=True)),
+                ('user_ids', models.BinaryField()),
+                ('points', models.BinaryField()),
+            ],
+            options={
+                'ordering': ['game__kickoff', 'game_id'],
+            },
+        ),
+    ]
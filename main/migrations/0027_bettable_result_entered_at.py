@@ -0,0 +1,42 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:10
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+
+# the entry time of existing results is unknown, so a game is assumed to be entered right after its end
+# and an extra after the end of the last game
+GAME_DURATION = timedelta(hours=1, minutes=45)
+
+
+def backfill_result_entered_at(apps, schema_editor):
+    game_model = apps.get_model('main', 'Game')
+    extra_model = apps.get_model('main', 'Extra')
+
+    finished_games = game_model.objects.exclude(result__isnull=True).exclude(result='')
+    for game in finished_games:
+        game.result_entered_at = game.kickoff + GAME_DURATION
+    game_model.objects.bulk_update(finished_games, ['result_entered_at'])
+
+    last_kickoff = game_model.objects.aggregate(last_kickoff=Max('kickoff'))['last_kickoff']
+    finished_extras = extra_model.objects.exclude(result__isnull=True).exclude(result='')
+    for extra in finished_extras:
+        extra.result_entered_at = max(extra.deadline, last_kickoff + GAME_DURATION) if last_kickoff else extra.deadline
+    extra_model.objects.bulk_update(finished_extras, ['result_entered_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0026_rank_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bettable',
+            name='result_entered_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_result_entered_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0027_bettable_result_entered_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BetsSnapshot',
+            fields=[
+                ('bettable', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='bets_snapshot', serialize=False, to='main.bettable')),
+                ('created', models.DateTimeField(auto_now=True)),
+                ('etag', models.CharField(max_length=40)),
+                ('content', models.BinaryField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0028_bets_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bet',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bettable',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+def backfill_kind(apps, schema_editor):
+    bettable_model = apps.get_model('main', 'Bettable')
+    for kind, model_name in (('game', 'Game'), ('extra', 'Extra')):
+        bettable_model.objects \
+            .filter(pk__in=apps.get_model('main', model_name).objects.values('pk')) \
+            .update(kind=kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0029_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bettable',
+            name='kind',
+            field=models.CharField(choices=[('game', 'Game'), ('extra', 'Extra')], default='', editable=False,
+                                   max_length=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_kind, migrations.RunPython.noop),
+    ]
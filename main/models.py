@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
+import gzip
+import hashlib
+import json
+import threading
+import zlib
+from array import array
+from collections import defaultdict, namedtuple
 from datetime import *
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models, utils
-from django.db.models import Q
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import models, transaction, utils
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from main import utils, mail_utils
+from main.scoring import get_scoring_table
 from main.storage import OverwriteStorage
 from main.validators import *
 
@@ -75,33 +86,62 @@ class ResultBetType(utils.ChoicesEnum):
 
 
 class Bettable(models.Model):
+    GAME, EXTRA = 'game', 'extra'
+    KIND_CHOICES = ((GAME, 'Game'), (EXTRA, 'Extra'))
+
     deadline = models.DateTimeField()
     name = models.CharField(max_length=50)
+    # model name of the child (Game or Extra), so that dispatching on the type needs no query on the child tables
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, editable=False)
     result = models.CharField(blank=True, null=True, max_length=50)
+    # when the current result has been entered, so that past leaderboards only count the results known by then
+    result_entered_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["deadline", "name"]
 
-    def deadline_passed(self):
-        return utils.get_reference_date() >= self.deadline
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored result to detect changes on save
+        instance._stored_result = instance.__dict__.get('result', models.DEFERRED)
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self.kind and type(self) is not Bettable:
+            self.kind = self._meta.model_name
+        stored_result = getattr(self, '_stored_result', None)
+        # only set by a first result entry and cleared by its removal, a corrected result keeps the moment of the entry
+        if stored_result is not models.DEFERRED and 'result' in self.__dict__ and \
+                (self.result or None) != (stored_result or None) and not (self.has_result() and stored_result):
+            self.result_entered_at = utils.get_reference_date() if self.has_result() else None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'result_entered_at'}
+        # auto_now fields are only written along with explicit update_fields if listed
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'updated_at'}
+        super().save(*args, **kwargs)
+        self._stored_result = self.__dict__.get('result', models.DEFERRED)
+
+    def deadline_passed(self, reference_date=None):
+        return (reference_date or utils.get_reference_date()) >= self.deadline
 
     def has_result(self):
         return self.result is not None and self.result != ''
 
     def set_result(self, result):
         self.result = result
-        self.save()
+        self.save(update_fields=['result'])
 
     def remove_result(self):
         self.result = None
-        self.save()
+        self.save(update_fields=['result'])
 
     def get_related_child(self):
-        if hasattr(self, 'game'):
-            return self.game
-        elif hasattr(self, 'extra'):
-            return self.extra
-        return None
+        if type(self) is not Bettable:
+            return self
+        return getattr(self, self.kind) if self.kind else None
 
     @staticmethod
     def get_open_bettables_for_user(user_id):
@@ -122,6 +162,9 @@ class Game(Bettable):
     kickoff = models.DateTimeField()
     homegoals = models.SmallIntegerField(default=-1)
     awaygoals = models.SmallIntegerField(default=-1)
+    # current score while the game is running, only used for the provisional leaderboard
+    live_homegoals = models.SmallIntegerField(default=-1)
+    live_awaygoals = models.SmallIntegerField(default=-1)
 
     hometeam = models.ForeignKey(Team, models.CASCADE, related_name='games_home')
     awayteam = models.ForeignKey(Team, models.CASCADE, related_name='games_away')
@@ -150,24 +193,74 @@ class Game(Bettable):
         return utils.get_reference_date() > (self.kickoff + timedelta(hours=1, minutes=45))
 
     def set_result_goals(self, homegoals, awaygoals):
+        """
+            Result entry: goals, result string and bettable name are persisted with a single save,
+            which triggers the scoring of the game's bets exactly once.
+        """
         self.homegoals = homegoals
         self.awaygoals = awaygoals
-        super().set_result(self.result_str())
-        self.save()
+        self.save(update_fields=['homegoals', 'awaygoals'])
 
     def remove_result(self):
-        self.homegoals = -1
-        self.awaygoals = -1
-        super().remove_result()
-        self.save()
+        self.set_result_goals(-1, -1)
+
+    def has_live_score(self):
+        return self.live_homegoals != -1 and self.live_awaygoals != -1
+
+    def set_live_goals(self, homegoals, awaygoals):
+        """
+            Stores the current score of a running game. Written by a queryset update, so that
+            no signals are sent: live scores must not trigger any scoring of bets.
+        """
+        self.live_homegoals, self.live_awaygoals = homegoals, awaygoals
+        Game.objects.filter(pk=self.pk).update(live_homegoals=homegoals, live_awaygoals=awaygoals)
+
+    @staticmethod
+    def bet_distribution_cache_key(game_id):
+        return 'bet_distribution:%i' % game_id
+
+    def get_bet_distribution(self):
+        """
+            Number of bets per scoreline (most frequent first) and the share of each tendency in percent,
+            computed with a single aggregate query on the goals of the placed bets.
+        """
+        scorelines = sorted(({'homegoals': homegoals, 'awaygoals': awaygoals, 'count': count}
+                             for homegoals, awaygoals, count in Bet.objects
+                             .filter(bettable=self, homegoals_bet__isnull=False, awaygoals_bet__isnull=False)
+                             .order_by()
+                             .values('homegoals_bet', 'awaygoals_bet')
+                             .annotate(count=Count('pk'))
+                             .values_list('homegoals_bet', 'awaygoals_bet', 'count')),
+                            key=lambda scoreline: (-scoreline['count'], scoreline['homegoals'], scoreline['awaygoals']))
+
+        no_bets = sum(scoreline['count'] for scoreline in scorelines)
+        tendencies = dict.fromkeys(('home', 'draw', 'away'), 0)
+        for scoreline in scorelines:
+            goal_diff = scoreline['homegoals'] - scoreline['awaygoals']
+            tendencies['home' if goal_diff > 0 else 'away' if goal_diff < 0 else 'draw'] += scoreline['count']
+
+        return {
+            'game': self.pk,
+            'no_bets': no_bets,
+            'scorelines': scorelines,
+            'tendencies': {tendency: round(100 * count / no_bets, 1) if no_bets else 0.0
+                           for tendency, count in tendencies.items()},
+        }
 
     def update_bettable_name(self):
-        self.bettable_ptr.name = "%s - %s" % (self.hometeam, self.awayteam,)
-        self.bettable_ptr.save()
+        if self.hometeam_id is not None and self.awayteam_id is not None:
+            self.name = "%s - %s" % (self.hometeam, self.awayteam,)
 
     def update_bettable_result_field(self):
-        self.bettable_ptr.result = self.result_str()
-        self.bettable_ptr.save()
+        self.result = self.result_str()
+
+    def save(self, *args, **kwargs):
+        # the inherited bettable fields are kept in sync here, so they are written along with the game
+        self.update_bettable_name()
+        self.update_bettable_result_field()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'name', 'result'}
+        super().save(*args, **kwargs)
 
     @staticmethod
     def tournament_has_started():
@@ -234,6 +327,9 @@ class ExtraChoice(models.Model):
 
 class Bet(models.Model):
     result_bet = models.CharField(blank=True, max_length=50)
+    # goals of a game bet parsed from result_bet on save, None for extra bets or no bet
+    homegoals_bet = models.SmallIntegerField(blank=True, null=True, db_index=True)
+    awaygoals_bet = models.SmallIntegerField(blank=True, null=True, db_index=True)
     result_bet_type = models.CharField(blank=True, null=True,
                                        choices=ResultBetType.choices(), max_length=50)
     points = models.PositiveSmallIntegerField(blank=True, null=True)
@@ -241,6 +337,12 @@ class Bet(models.Model):
     bettable = models.ForeignKey(Bettable, models.CASCADE)
     user = models.ForeignKey(User, models.CASCADE)
 
+    # also set by the bulk updates of points, so that it is a validator of the bets for conditional requests
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # cache of the matrix of all bets on closed bettables, cf. bets_matrix.closed_bets_matrix()
+    CLOSED_BETS_CACHE_KEY = 'closed_bets_matrix'
+
     class Meta:
         unique_together = ('bettable', 'user',)
 
@@ -254,11 +356,31 @@ class Bet(models.Model):
         return self.result_bet is not None and self.result_bet != ''
 
     def get_gamebet_goals(self):
-        if self.has_bet():
+        if self.homegoals_bet is not None and self.awaygoals_bet is not None:
+            return self.homegoals_bet, self.awaygoals_bet
+        elif self.has_bet():
             return [int(it) for it in self.result_bet.split(":")]
         else:
             return -1, -1
 
+    def update_gamebet_goals(self):
+        (homegoals, awaygoals) = utils.extract_goals_from_result(str(self.result_bet or ''))
+        if homegoals >= 0 and awaygoals >= 0:
+            self.homegoals_bet, self.awaygoals_bet = homegoals, awaygoals
+        else:
+            self.homegoals_bet, self.awaygoals_bet = None, None
+
+    def save(self, *args, **kwargs):
+        # the goal columns are derived from result_bet, so they are written along with it
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'result_bet' in update_fields:
+            self.update_gamebet_goals()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'homegoals_bet', 'awaygoals_bet'}
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'updated_at'}
+        super().save(*args, **kwargs)
+
     @staticmethod
     def get_by_user(user_id):
         return Bet.objects \
@@ -302,72 +424,102 @@ class Bet(models.Model):
         bettables = Bet.objects.filter(user__pk=user_id).filter(bettable__pk=bettable_id)
         return bettables.first() if bettables else None
 
-    def compute_points(self):
+    @staticmethod
+    def compute_points_of_bettable(bettable, recalculated_user_ids=frozenset()):
+        """
+            Re-computes points and result bet types of all bets on the given bettable in a single pass
+            and writes them back with one bulk update, instead of saving each bet on its own.
+            The deltas are applied to the statistics of the bets' users, except for the given users
+            whose statistics are going to be fully re-calculated anyway.
+        """
+        # all bets share the same bettable instance, so the child lookup (game or extra) is done only once
+        if type(bettable) is not Bettable:
+            bettable = Bettable.objects.get(pk=bettable.pk)
+
+        # the bets are locked until the deltas are applied, so that concurrent re-computations of the same bettable
+        # (e.g. a result entered by an admin and by update_results) see each other's points instead of applying
+        # the same deltas twice
+        with transaction.atomic(savepoint=False):
+            bets = list(Bet.objects.select_for_update().filter(bettable=bettable))
+
+            changed_bets, changes = [], []
+            for bet in bets:
+                old_result_bet_type, old_points = bet.result_bet_type, bet.points
+                bet.bettable = bettable
+                bet.compute_points(commit=False)
+                if (old_result_bet_type, old_points) != (bet.result_bet_type, bet.points):
+                    changed_bets.append(bet)
+                    changes.append((bet.user_id, old_result_bet_type, old_points, bet.result_bet_type, bet.points))
+
+            if changed_bets:
+                now = timezone.now()
+                for bet in changed_bets:
+                    bet.updated_at = now
+                Bet.objects.bulk_update(changed_bets, ['points', 'result_bet_type', 'updated_at'])
+                changes = [change for change in changes if change[0] not in recalculated_user_ids]
+                Statistic.apply_bet_changes(changes)
+                if bettable.kind == Bettable.GAME:
+                    RoundStatistic.apply_bet_changes(changes, round_id=bettable.game.round_id)
+                    MatchdayStatistic.apply_bet_changes(changes, matchday=timezone.localdate(bettable.game.kickoff))
+        return bets
+
+    def compute_points(self, commit=True):
         if not self.bettable or not self.bettable.has_result() or not self.has_bet():
             self.points = None
             self.result_bet_type = None
-            self.save()
-            return
-
-        if hasattr(self.bettable, 'extra'):
+        elif self.bettable.kind == Bettable.EXTRA:
             self.compute_points_of_extra_bettable()
-        elif hasattr(self.bettable, 'game'):
+        elif self.bettable.kind == Bettable.GAME:
             self.compute_points_of_game_bettable()
 
-        self.save()
+        if commit:
+            self.save()
 
     def compute_points_of_extra_bettable(self):
-        if self.result_bet == self.bettable.result:
-            self.result_bet_type = ResultBetType.volltreffer.name
-            self.points = self.bettable.extra.points
-        else:
-            self.result_bet_type = ResultBetType.niete.name
-            self.points = 0
+        self.result_bet_type, self.points = \
+            get_scoring_table().score_extra_bet(self.result_bet, self.bettable.result, self.bettable.extra.points)
 
     def compute_points_of_game_bettable(self):
         if not self.has_bet() or not self.bettable.has_result():
             return
 
         bettable_game = self.bettable.game
-        points = settings.BET_POINTS
-
-        (game_hg, game_ag) = (int(bettable_game.homegoals), int(bettable_game.awaygoals))
         (bet_hg, bet_ag) = self.get_gamebet_goals()
 
-        if game_hg == bet_hg and game_ag == bet_ag:
-            self.result_bet_type = ResultBetType.volltreffer.name
-            self.points = points["volltreffer"]
-            return
-
-        if (game_hg - game_ag) == (bet_hg - bet_ag):
-            if game_hg == game_ag:
-                # game was a remis
-                self.result_bet_type = ResultBetType.remis_tendenz.name
-                self.points = points["remis_tendenz"]
-                return
-            else:
-                # game was no remis
-                self.result_bet_type = ResultBetType.differenz.name
-                self.points = points["differenz"]
-                return
-
-        if (game_hg - game_ag) * (bet_hg - bet_ag) > 0:
-            self.result_bet_type = ResultBetType.tendenz.name
-            self.points = points["tendenz"]
-            return
-
-        if game_hg is game_ag and bet_hg is bet_ag:
-            self.result_bet_type = ResultBetType.tendenz.name
-            self.points = points["tendenz"]
-            return
-
-        self.result_bet_type = ResultBetType.niete.name
-        self.points = points["niete"]
+        self.result_bet_type, self.points = get_scoring_table().score_game_bet(
+            bet_hg, bet_ag, int(bettable_game.homegoals), int(bettable_game.awaygoals))
 
     def __str__(self):
         return self.bet_str()
 
 
+def bet_change_updates(changes):
+    """
+        Groups the users of the given bet changes by identical change and yields the F-expression updates
+        of the statistic fields with the users they apply to.
+        changes are (user_id, old_result_bet_type, old_points, new_result_bet_type, new_points) tuples.
+    """
+    users_by_change = defaultdict(list)
+    for user_id, *change in changes:
+        users_by_change[tuple(change)].append(user_id)
+
+    for (old_result_bet_type, old_points, new_result_bet_type, new_points), user_ids in users_by_change.items():
+        deltas = defaultdict(int)
+        # same rules as in Statistic.recalculate(): a bet counts as soon as it has points
+        if old_points is not None:
+            deltas['points'] -= old_points
+            if old_result_bet_type in Statistic.COUNTED_RESULT_BET_TYPES:
+                deltas[Statistic.counter_field(old_result_bet_type)] -= 1
+        if new_points is not None:
+            deltas['points'] += new_points
+            if new_result_bet_type in Statistic.COUNTED_RESULT_BET_TYPES:
+                deltas[Statistic.counter_field(new_result_bet_type)] += 1
+
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta != 0}
+        if updates:
+            yield updates, user_ids
+
+
 class Statistic(models.Model):
     user = models.OneToOneField(User, models.CASCADE, primary_key=True)
 
@@ -380,20 +532,90 @@ class Statistic(models.Model):
     no_niete = models.PositiveSmallIntegerField(default=0)
 
     points = models.PositiveSmallIntegerField(default=0)
+    # points plus the points still attainable with the bettables without result
+    max_points = models.PositiveSmallIntegerField(default=0)
+
+    # cache version of all statistics, bumped whenever bets have been scored
+    VERSION_KEY = 'statistics'
+
+    COUNTED_RESULT_BET_TYPES = tuple(result_bet_type.name for result_bet_type in ResultBetType)
+
+    @staticmethod
+    def counter_field(result_bet_type):
+        return 'no_%s' % result_bet_type
+
+    @staticmethod
+    def apply_bet_changes(changes):
+        """
+            Incrementally applies the point and counter deltas of re-computed bets to their users' statistics.
+            changes are (user_id, old_result_bet_type, old_points, new_result_bet_type, new_points) tuples.
+            All users sharing the same delta are updated with a single query.
+        """
+        for updates, user_ids in bet_change_updates(changes):
+            Statistic.objects.filter(user__in=user_ids).update(**updates)
+
+    @staticmethod
+    def attainable_points(bettable_path=''):
+        """ Expression of the points a bet can win at most on the bettable at the given path """
+        return Case(When(**{bettable_path + 'extra__isnull': False}, then=F(bettable_path + 'extra__points')),
+                    default=Value(max(settings.BET_POINTS.values())))
+
+    @staticmethod
+    def update_max_points(user_ids=None):
+        """
+            Re-computes the maximum attainable points of the given (or all) users with a few bulk queries.
+            The bettables without result can still be won by anyone as long as their deadline has not passed,
+            afterwards only with a placed bet. A game bet can win at most the points of a Volltreffer.
+        """
+        reference_date = utils.get_reference_date()
+        unfinished_bettables = Bettable.objects.filter(Q(result__isnull=True) | Q(result=''))
+        statistics, bets = Statistic.objects.all(), Bet.objects.all()
+        if user_ids is not None:
+            statistics, bets = statistics.filter(user__in=user_ids), bets.filter(user__in=user_ids)
+
+        open_points = unfinished_bettables \
+            .filter(deadline__gt=reference_date) \
+            .aggregate(total=Coalesce(Sum(Statistic.attainable_points()), 0))['total']
+        closed_points_by_user = bets \
+            .filter(bettable__in=unfinished_bettables.filter(deadline__lte=reference_date)) \
+            .exclude(result_bet__isnull=True).exclude(result_bet='') \
+            .order_by() \
+            .values('user_id') \
+            .annotate(attainable=Sum(Statistic.attainable_points('bettable__'))) \
+            .values_list('user_id', 'attainable')
+
+        users_by_closed_points = defaultdict(list)
+        for user_id, closed_points in closed_points_by_user:
+            users_by_closed_points[closed_points].append(user_id)
+
+        statistics.update(max_points=F('points') + open_points)
+        for closed_points, closed_user_ids in users_by_closed_points.items():
+            Statistic.objects.filter(user__in=closed_user_ids) \
+                .update(max_points=F('points') + open_points + closed_points)
 
     def update(self):
+        """
+            Re-calculates all fields from the bets of the user, but only writes the changed ones, so that concurrent
+            deltas of other fields (cf. apply_bet_changes()) are not overwritten. Returns the changed fields.
+        """
+        fields = ('no_bets', 'no_volltreffer', 'no_differenz', 'no_remis_tendenz', 'no_tendenz', 'no_niete', 'points')
+        stored = [getattr(self, field) for field in fields]
         self.recalculate()
         self.update_no_bets()
-        self.save()
+        changed = [field for field, value in zip(fields, stored) if getattr(self, field) != value]
+        if changed:
+            self.save(update_fields=changed)
+        return changed
 
     def recalculate(self):
         """
-            Re-calculate statistics based on all bets for this user
+            Re-calculate statistics based on all bets for this user.
+            Statistics are maintained incrementally on result updates, so this serves as a consistency check.
         """
         self.points, self.no_volltreffer, self.no_differenz, self.no_remis_tendenz, \
             self.no_tendenz, self.no_niete = 0, 0, 0, 0, 0, 0
 
-        for bet in Bet.get_by_user_and_has_bet_and_bettable_has_result(self.user.pk):
+        for bet in Bet.get_by_user_and_has_bet_and_bettable_has_result(self.user_id):
             if bet.points is not None:
                 self.points += bet.points
                 result_bet_type = bet.result_bet_type
@@ -412,7 +634,7 @@ class Statistic(models.Model):
         """
             Count number of bets this user has placed
         """
-        self.no_bets = Bet.get_by_user_and_has_bet(self.user.pk).count()
+        self.no_bets = Bet.get_by_user_and_has_bet(self.user_id).count()
 
     def pretty_print(self):
         return "%s (%i bets, %i Volltreffer, %i Points)" % (self.user, self.no_bets, self.no_volltreffer, self.points)
@@ -421,6 +643,211 @@ class Statistic(models.Model):
         return "%s's statistics" % self.user
 
 
+BetPeriod = namedtuple('BetPeriod', ('name', 'expression'))
+
+
+class PeriodStatistic(models.Model):
+    """ Points and counters of a user within a part of the tournament, maintained from the deltas of scored bets """
+    user = models.ForeignKey(User, models.CASCADE)
+
+    no_volltreffer = models.PositiveSmallIntegerField(default=0)
+    no_differenz = models.PositiveSmallIntegerField(default=0)
+    no_remis_tendenz = models.PositiveSmallIntegerField(default=0)
+    no_tendenz = models.PositiveSmallIntegerField(default=0)
+    no_niete = models.PositiveSmallIntegerField(default=0)
+
+    points = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def apply_bet_changes(cls, changes, **period):
+        """ Like Statistic.apply_bet_changes(), rows of users without any scored bet in the period are created first """
+        if not changes:
+            return
+        cls.objects.bulk_create([cls(user_id=user_id, **period) for user_id in {change[0] for change in changes}],
+                                ignore_conflicts=True)
+        for updates, user_ids in bet_change_updates(changes):
+            cls.objects.filter(user__in=user_ids, **period).update(**updates)
+
+    @classmethod
+    def recalculate_periods(cls, bet_period, user_ids=None):
+        """
+            Re-creates the rows of the given (or all) users from their scored game bets with one aggregate query,
+            grouped by the period of the bets (a BetPeriod, stored in the field of the same name).
+            Same rules as Statistic.recalculate().
+        """
+        bets = Bet.objects \
+            .filter(bettable__kind=Bettable.GAME, points__isnull=False) \
+            .exclude(result_bet__isnull=True).exclude(result_bet='') \
+            .exclude(bettable__result__isnull=True).exclude(bettable__result='')
+        rows = cls.objects.all()
+        if user_ids is not None:
+            bets, rows = bets.filter(user__in=user_ids), rows.filter(user__in=user_ids)
+
+        counters = {Statistic.counter_field(result_bet_type): Count('pk', filter=Q(result_bet_type=result_bet_type))
+                    for result_bet_type in Statistic.COUNTED_RESULT_BET_TYPES}
+        aggregates = bets \
+            .annotate(**{bet_period.name: bet_period.expression}) \
+            .order_by() \
+            .values('user_id', bet_period.name) \
+            .annotate(points=Sum('points'), **counters)
+
+        rows.delete()
+        cls.objects.bulk_create([cls(**aggregate) for aggregate in aggregates])
+
+
+class RoundStatistic(PeriodStatistic):
+    round = models.ForeignKey(TournamentRound, models.CASCADE)
+
+    class Meta:
+        unique_together = ('user', 'round',)
+
+    @classmethod
+    def recalculate(cls, user_ids=None):
+        """ Re-creates the rows of the given (or all) users, cf. PeriodStatistic.recalculate_periods() """
+        cls.recalculate_periods(BetPeriod('round_id', F('bettable__game__round_id')), user_ids)
+
+
+class MatchdayStatistic(PeriodStatistic):
+    # kickoff date of the games in the local time zone
+    matchday = models.DateField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'matchday',)
+
+    @classmethod
+    def recalculate(cls, user_ids=None):
+        """ Re-creates the rows of the given (or all) users, cf. PeriodStatistic.recalculate_periods() """
+        # truncated in the current (local) time zone, like timezone.localdate()
+        cls.recalculate_periods(BetPeriod('matchday', TruncDate('bettable__game__kickoff')), user_ids)
+
+class RankSnapshot(models.Model):
+    """
+        Leaderboard right after a game has finished. Instead of one row per user, the ids of the users ordered
+        by rank and their points are stored as zlib compressed arrays of 32 bit integers, so the rank of a user
+        is its position in user_ids plus one. A tournament of 64 games with a few hundred users needs < 200 kB.
+    """
+    game = models.OneToOneField(Game, models.CASCADE, primary_key=True, related_name='rank_snapshot')
+    created = models.DateTimeField(auto_now=True)
+    user_ids = models.BinaryField()
+    points = models.BinaryField()
+
+    class Meta:
+        ordering = ['game__kickoff', 'game_id']
+
+    @staticmethod
+    def pack(values):
+        return zlib.compress(array('i', values).tobytes())
+
+    @staticmethod
+    def unpack(data):
+        values = array('i')
+        values.frombytes(zlib.decompress(data))
+        return values.tolist()
+
+    def get_user_ids(self):
+        return self.unpack(self.user_ids)
+
+    def get_points(self):
+        return self.unpack(self.points)
+
+    def get_ranks(self):
+        """ Returns the ranks and points of the snapshot by user id """
+        return {user_id: (rank, points) for rank, (user_id, points)
+                in enumerate(zip(self.get_user_ids(), self.get_points()), start=1)}
+
+    @classmethod
+    def update_for_games(cls, game_ids):
+        """
+            Snapshots the leaderboard for those of the given games which are finished and drops the snapshots
+            of the others, e.g. if their result has been removed. The snapshots of all finished games from the
+            earliest given one on are re-built, since a corrected result also changes the points of the later ones:
+            the leaderboard after a game is the current one without the bets on the finished games after it.
+            Costs four queries, five if later games have finished already, no matter how many games and users there are.
+        """
+        game_ids = set(game_ids)
+        games = list(Game.objects.order_by('kickoff', 'pk').values_list('pk', 'homegoals', 'awaygoals'))
+        positions = [i for i, (game_id, homegoals, awaygoals) in enumerate(games) if game_id in game_ids]
+        finished_game_ids = [game_id for game_id, homegoals, awaygoals in games[positions[0]:] if
+                             homegoals != -1 and awaygoals != -1] if positions else []
+        cls.objects.filter(game_id__in=game_ids).exclude(game_id__in=finished_game_ids).delete()
+        if not finished_game_ids:
+            return
+
+        # in the order of the leaderboard, sorted again below with ties kept in the order of the usernames
+        leaderboard = list(Statistic.objects
+                           .filter(user__pk__in=utils.active_users())
+                           .order_by('-points', '-no_volltreffer', 'user__username')
+                           .values_list('user_id', 'points', 'no_volltreffer'))
+        points = {user_id: [user_points, no_volltreffer] for user_id, user_points, no_volltreffer in leaderboard}
+        later_bets = defaultdict(list)
+        if len(finished_game_ids) > 1:
+            for user_id, game_id, bet_points, result_bet_type in Bet.objects \
+                    .filter(bettable_id__in=finished_game_ids[1:], user_id__in=points.keys(), points__isnull=False) \
+                    .values_list('user_id', 'bettable_id', 'points', 'result_bet_type'):
+                later_bets[game_id].append((user_id, bet_points, result_bet_type == ResultBetType.volltreffer.name))
+
+        snapshots, now = [], timezone.now()
+        for game_id in reversed(finished_game_ids):
+            ranked = sorted(leaderboard, key=lambda row: (-points[row[0]][0], -points[row[0]][1]))
+            snapshots.append(cls(game_id=game_id, created=now, user_ids=cls.pack([row[0] for row in ranked]),
+                                 points=cls.pack([points[row[0]][0] for row in ranked])))
+            # going back to the leaderboard right after the previous finished game
+            for user_id, bet_points, is_volltreffer in later_bets[game_id]:
+                points[user_id][0] -= bet_points
+                points[user_id][1] -= is_volltreffer
+        cls.objects.bulk_create(snapshots, update_conflicts=True, unique_fields=['game'],
+                                update_fields=['created', 'user_ids', 'points'])
+
+    @classmethod
+    def rebuild(cls):
+        """ Re-builds the snapshots of all finished games, e.g. after the bets have been rescored """
+        cls.update_for_games(Game.objects.values_list('pk', flat=True))
+
+
+class BetsSnapshot(models.Model):
+    """
+        The bets on a bettable, frozen when its deadline has passed, as gzip compressed JSON ready to be served.
+        Only the placed result bets are part of it, their points change with the result and are not frozen.
+    """
+    bettable = models.OneToOneField(Bettable, models.CASCADE, primary_key=True, related_name='bets_snapshot')
+    created = models.DateTimeField(auto_now=True)
+    etag = models.CharField(max_length=40)
+    content = models.BinaryField()
+
+    @classmethod
+    def build(cls, bettable):
+        """ Builds (or re-builds) the snapshot of the given closed bettable with a single query for its bets """
+        bets = Bet.objects \
+            .filter(bettable=bettable) \
+            .exclude(result_bet__isnull=True).exclude(result_bet='') \
+            .order_by('pk') \
+            .values('id', 'user', 'result_bet')
+        data = json.dumps({'bettable': bettable.pk, 'bettable_type': bettable.kind or None, 'bets': list(bets)},
+                          separators=(',', ':')).encode('utf-8')
+
+        snapshot = cls(bettable_id=bettable.pk, created=timezone.now(), etag=hashlib.sha1(data).hexdigest(),
+                       content=gzip.compress(data, mtime=0))
+        # concurrent builds of the same snapshot write the same content
+        cls.objects.bulk_create([snapshot], update_conflicts=True, unique_fields=['bettable'],
+                                update_fields=['created', 'etag', 'content'])
+        return snapshot
+
+    @classmethod
+    def build_missing(cls):
+        """ Builds the snapshots of all bettables whose deadline has passed, but which have none yet """
+        # the type of the bettable is known by its kind, without joining the game and extra tables
+        bettables = Bettable.objects \
+            .filter(deadline__lt=utils.get_reference_date(), bets_snapshot__isnull=True) \
+            .only('pk', 'kind')
+        return [cls.build(bettable) for bettable in bettables]
+
+    def get_data(self):
+        return gzip.decompress(self.content)
+
+
 ###########
 # SIGNAL OVERRIDES
 ###########
@@ -431,25 +858,158 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
         Statistic.objects.create(user=instance)
+        Statistic.update_max_points([instance.pk])
+        bump_statistic_version_on_commit()
+
+
+def bump_statistic_version_on_commit():
+    # for statistics changed outside of the ScoringQueue, whose flush bumps the version itself
+    transaction.on_commit(lambda: utils.bump_version(Statistic.VERSION_KEY))
+
+
+class ScoringQueue(threading.local):
+    """
+        Collects the bettables and users whose bets changed within the current transaction.
+        Their bets and statistics are re-computed only once, in a transaction of their own when the transaction
+        is committed (or immediately, if there is no transaction in autocommit mode).
+    """
+    def __init__(self):
+        self.bettable_ids, self.user_ids = set(), set()
+        self.max_points_changed = False
+        # the callback registered with the pending transaction, a new one per transaction
+        self.registered_flush = None
+
+    def add_bettable(self, bettable_id):
+        self.register()
+        self.bettable_ids.add(bettable_id)
+        self.flush_if_autocommit()
+
+    def add_user(self, user_id):
+        self.register()
+        self.user_ids.add(user_id)
+        self.flush_if_autocommit()
+
+    def add_max_points_change(self):
+        """ The points attainable by everyone have changed, e.g. because a bettable has been added or deleted """
+        self.register()
+        self.max_points_changed = True
+        self.flush_if_autocommit()
+
+    def register(self):
+        """ Registers the flush once per transaction, the ids of a rolled back transaction are discarded """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return
+        if any(hook[1] is self.registered_flush for hook in connection.run_on_commit):
+            return
+        # either nothing is pending, or the transaction which registered the flush has been rolled back
+        self.bettable_ids, self.user_ids = set(), set()
+        self.max_points_changed = False
+        self.registered_flush = lambda: self.flush()
+        transaction.on_commit(self.registered_flush)
+
+    def flush_if_autocommit(self):
+        if not transaction.get_connection().in_atomic_block:
+            self.flush()
+
+    def flush(self):
+        self.registered_flush = None
+        bettable_ids, self.bettable_ids = self.bettable_ids, set()
+        user_ids, self.user_ids = self.user_ids, set()
+        max_points_changed, self.max_points_changed = self.max_points_changed, False
+        if not bettable_ids and not user_ids and not max_points_changed:
+            return
+
+        # bets and statistics are either updated together or not at all
+        with transaction.atomic():
+            # statistics of the affected users are updated incrementally along with their bets ...
+            bettables = list(Bettable.objects.filter(pk__in=bettable_ids))
+            # the maximum points only change for users whose points or unfinished bettables have changed
+            max_points_user_ids = set()
+            for bettable in bettables:
+                max_points_user_ids.update(bet.user_id for bet in
+                                           Bet.compute_points_of_bettable(bettable, recalculated_user_ids=user_ids))
+
+            # ... except for directly saved bets, which are not covered by deltas, so their users are fully updated,
+            # locked against deltas applied concurrently
+            scored_user_ids = set()
+            for statistic in Statistic.objects.select_for_update().filter(user__in=user_ids):
+                changed = statistic.update()
+                if 'points' in changed:
+                    max_points_user_ids.add(statistic.user_id)
+                # a placed or changed bet only affects the number of bets, not the scored points in a period
+                if set(changed) - {'no_bets'}:
+                    scored_user_ids.add(statistic.user_id)
+            if scored_user_ids:
+                RoundStatistic.recalculate(scored_user_ids)
+                MatchdayStatistic.recalculate(scored_user_ids)
+            if bettable_ids:
+                RankSnapshot.update_for_games(bettable_ids)
+            reference_date = utils.get_reference_date()
+            if max_points_changed or any(bettable.deadline > reference_date for bettable in bettables):
+                # the result of an open bettable changes the points attainable by everyone
+                Statistic.update_max_points()
+            elif max_points_user_ids:
+                Statistic.update_max_points(max_points_user_ids)
+        # only after the commit, so that no other process caches the previous statistics with the new version
+        utils.bump_version(Statistic.VERSION_KEY)
+
+
+scoring_queue = ScoringQueue()
+
+
+# cache version of the tournament data (groups, rounds, teams, venues, games and extras)
+TOURNAMENT_DATA_VERSION_KEY = 'tournament_data'
+
+
+@receiver(post_save, sender=TournamentGroup)
+@receiver(post_save, sender=TournamentRound)
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Venue)
+@receiver(post_save, sender=Game)
+@receiver(post_save, sender=Extra)
+@receiver(post_save, sender=ExtraChoice)
+@receiver(post_delete, sender=TournamentGroup)
+@receiver(post_delete, sender=TournamentRound)
+@receiver(post_delete, sender=Team)
+@receiver(post_delete, sender=Venue)
+@receiver(post_delete, sender=Game)
+@receiver(post_delete, sender=Extra)
+@receiver(post_delete, sender=ExtraChoice)
+def bump_tournament_data_version(sender, instance, **kwargs):
+    utils.bump_version(TOURNAMENT_DATA_VERSION_KEY)
 
 
 @receiver(post_save, sender=Game)
 @receiver(post_save, sender=Extra)
 def update_bet_results(sender, instance, created, **kwargs):
-    # update result field on Game bettables, which are stored by setting the goals, but not the result string
-    if isinstance(instance, Game) and hasattr(instance, 'bettable_ptr'):
-        instance.update_bettable_name()
-        instance.update_bettable_result_field()
+    if created:
+        # new bettables do not have any bets yet, but they can still be won by everyone
+        scoring_queue.add_max_points_change()
+    else:
+        scoring_queue.add_bettable(instance.pk)
+
+
+@receiver(post_delete, sender=Bettable)
+def update_max_points_of_deleted_bettable(sender, instance, **kwargs):
+    # deleted along with its bets, an open bettable can no longer be won by anyone
+    scoring_queue.add_max_points_change()
 
-    [bet.compute_points() for bet in Bet.get_by_bettable(instance.pk)]
-    [user.statistic.update() for user in User.objects.all()]
+
+@receiver(post_save, sender=Bet)
+def update_statistic_of_bet_user(sender, instance, created, **kwargs):
+    scoring_queue.add_user(instance.user_id)
 
 
-# update no_bets on user statistic
 @receiver(post_save, sender=Bet)
-def update_statistic_no_bets(sender, instance, created, **kwargs):
-    instance.user.statistic.update_no_bets()
-    instance.user.statistic.save()
+@receiver(post_delete, sender=Bet)
+def invalidate_closed_bets(sender, instance, **kwargs):
+    # closed bets are cached once the deadline has passed, only admins may still change bets afterwards
+    cache.delete(Game.bet_distribution_cache_key(instance.bettable_id))
+    # the bettable is usually at hand here, otherwise the closed bets are invalidated without looking it up
+    if not Bet.bettable.is_cached(instance) or instance.bettable.deadline_passed():
+        cache.delete(Bet.CLOSED_BETS_CACHE_KEY)
+        BetsSnapshot.objects.filter(bettable_id=instance.bettable_id).delete()
 
 
 class Profile(models.Model):
@@ -490,6 +1050,21 @@ class Profile(models.Model):
         return str(self.user) + '\'s Profile'
 
 
+# cache version of the user data within the statistics (usernames, avatars and who is active)
+USER_DATA_VERSION_KEY = 'user_data'
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=User)
+def bump_user_data_version(sender, instance, update_fields=None, **kwargs):
+    # a login only changes the active users if it is the first one of the year, which the count of the active users
+    # in the validators already covers
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    utils.bump_version(USER_DATA_VERSION_KEY)
+
+
 class Post(models.Model):
     title = models.TextField(null=True, blank=True, default='')
     content = models.TextField(null=True, blank=True, default='')
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import time
+
+import numpy as np
+from django.db.models import Q
+
+from main import utils
+from main.bets_matrix import BetsMatrix, NOT_SCORED
+from main.models import Bet, Extra, Statistic
+from main.scoring import VOLLTREFFER
+
+# bumps of the statistics version are only seen by this process if the cache is shared,
+# so the snapshot is re-built after this many seconds in any case
+SCENARIO_SNAPSHOT_MAX_AGE = 60
+
+
+class ScenarioSnapshot:
+    """
+        Compact in-memory snapshot of the current standings and of all bets on unfinished games and extras,
+        indexed by the position of their user in user_ids. Scenarios of hypothetical results for the
+        unfinished bettables are computed from it without any database access.
+    """
+
+    def __init__(self):
+        statistics = list(Statistic.objects
+                          .filter(user__pk__in=utils.active_users())
+                          .order_by('user_id')
+                          .values_list('user_id', 'user__username', 'points', 'no_volltreffer'))
+        user_ids, usernames, points, no_volltreffer = zip(*statistics) if statistics else ((), (), (), ())
+        self.user_ids = np.array(user_ids, dtype=np.int64)
+        self.usernames = np.array(usernames, dtype=str)
+        self.points = np.array(points, dtype=np.int64)
+        self.no_volltreffer = np.array(no_volltreffer, dtype=np.int64)
+
+        active_bets = Bet.objects.filter(user__pk__in=utils.active_users())
+        self.matrix = BetsMatrix.load(active_bets.filter(Q(bettable__game__homegoals=-1) |
+                                                         Q(bettable__game__awaygoals=-1)))
+        self.game_positions = {game_id: position for position, game_id in enumerate(self.matrix.game_ids.tolist())}
+        self.bet_user_positions = np.searchsorted(self.user_ids, self.matrix.user_ids)[self.matrix.user_indices]
+
+        self.extras = {}
+        unfinished_extras = Extra.objects.filter(Q(result__isnull=True) | Q(result=''))
+        for extra_id, extra_points in unfinished_extras.values_list('pk', 'points'):
+            self.extras[extra_id] = (extra_points, [], [])
+        for user_id, extra_id, result_bet in active_bets \
+                .filter(bettable_id__in=self.extras.keys()).exclude(result_bet='') \
+                .values_list('user_id', 'bettable_id', 'result_bet'):
+            self.extras[extra_id][1].append(user_id)
+            self.extras[extra_id][2].append(result_bet)
+        self.extras = {extra_id: (extra_points, np.searchsorted(self.user_ids, np.array(bet_user_ids, dtype=np.int64)),
+                                  np.array(result_bets, dtype=str))
+                       for extra_id, (extra_points, bet_user_ids, result_bets) in self.extras.items()}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def standings(self, game_results, extra_results):
+        """
+            Points and ranks of all users if the given unfinished games and extras ended with the given results,
+            as arrays indexed like user_ids, plus the user positions ordered by rank.
+            game_results maps game ids to (home goals, away goals), extra_results maps extra ids to their result.
+        """
+        points, no_volltreffer = self.points.copy(), self.no_volltreffer.copy()
+
+        if game_results and len(self.matrix):
+            result_homegoals = np.full(len(self.game_positions), -1, dtype=np.int16)
+            result_awaygoals = np.full(len(self.game_positions), -1, dtype=np.int16)
+            for game_id, (homegoals, awaygoals) in game_results.items():
+                if game_id in self.game_positions:
+                    result_homegoals[self.game_positions[game_id]] = homegoals
+                    result_awaygoals[self.game_positions[game_id]] = awaygoals
+            codes, bet_points = self.matrix.score(result_homegoals, result_awaygoals)
+            scored = codes != NOT_SCORED
+            points += np.bincount(self.bet_user_positions[scored], weights=bet_points[scored],
+                                  minlength=len(self)).astype(np.int64)
+            no_volltreffer += np.bincount(self.bet_user_positions[codes == VOLLTREFFER], minlength=len(self))
+
+        for extra_id, result in extra_results.items():
+            if extra_id in self.extras:
+                extra_points, bet_user_positions, result_bets = self.extras[extra_id]
+                hits = np.bincount(bet_user_positions[result_bets == result], minlength=len(self))
+                points += hits * extra_points
+                no_volltreffer += hits
+
+        # same ordering as the leaderboard: points, Volltreffer, username
+        order = np.lexsort((self.usernames, -no_volltreffer, -points))
+        ranks = np.empty(len(self), dtype=np.int64)
+        ranks[order] = np.arange(1, len(self) + 1)
+        return points, ranks, order
+
+
+_snapshot = {'version': None, 'created': 0, 'snapshot': None}
+
+
+def get_scenario_snapshot():
+    """ Returns the snapshot of this process, which is re-built once bets or results have changed """
+    version = utils.get_version(Statistic.VERSION_KEY)
+    if _snapshot['version'] != version or time.monotonic() - _snapshot['created'] > SCENARIO_SNAPSHOT_MAX_AGE:
+        _snapshot.update(version=version, created=time.monotonic(), snapshot=ScenarioSnapshot())
+    return _snapshot['snapshot']
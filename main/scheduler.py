@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import heapq
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.db.models import Q
+from django.dispatch import Signal, receiver
+
+from main import utils
+from main.models import Bet, Bettable, BetsSnapshot, Game, Statistic, TOURNAMENT_DATA_VERSION_KEY
+from main.simulation import refresh_simulation
+
+LOG = logging.getLogger('rtg.' + __name__)
+
+# sent right after the deadline of a bettable has passed, with its bettable_id
+bettable_closed = Signal()
+# sent right after the kickoff of a game, with its game_id
+game_kicked_off = Signal()
+
+# order of events at the same moment: bets are closed before the game kicks off
+DEADLINE, KICKOFF = 0, 1
+
+# changed deadlines and kickoffs are picked up by re-loading the index at least this often
+MAX_SLEEP = 60
+# results are polled this often after a kickoff, until all started games have a result or for at most
+# RESULT_POLLING_DURATION after the latest kickoff
+RESULT_POLLING_INTERVAL = 5 * 60
+RESULT_POLLING_DURATION = timedelta(hours=3)
+# the stored simulation of the tournament is refreshed at most this often, once bets or results have changed
+SIMULATION_INTERVAL = 15 * 60
+
+
+class DeadlineScheduler:
+    """
+        In-process scheduler of the moments when bettables close and games kick off. Keeps a heap of the
+        upcoming deadlines and kickoffs and sends bettable_closed and game_kicked_off as soon as they have passed,
+        so read paths may cache everything that only changes at these moments in between.
+    """
+
+    def __init__(self, now=None):
+        self.last_run = now or utils.get_reference_date()
+        self.events = []
+        self.polling_until = None
+        self.last_poll = None
+        self.last_simulation = None
+
+    def start(self):
+        """ Catches up with what has been missed while the scheduler was not running """
+        for snapshot in BetsSnapshot.build_missing():
+            LOG.info('Built missing snapshot of bettable %i' % snapshot.bettable_id)
+        latest_kickoff = Game.objects \
+            .filter(kickoff__lte=self.last_run, kickoff__gt=self.last_run - RESULT_POLLING_DURATION) \
+            .filter(Q(homegoals=-1) | Q(awaygoals=-1)) \
+            .order_by('-kickoff').values_list('kickoff', flat=True).first()
+        if latest_kickoff is not None:
+            self.polling_until = latest_kickoff + RESULT_POLLING_DURATION
+
+    def load(self):
+        """ Re-builds the index of all deadlines and kickoffs after the last run, with two queries """
+        self.events = [(deadline, DEADLINE, bettable_id) for bettable_id, deadline in
+                       Bettable.objects.filter(deadline__gt=self.last_run).values_list('pk', 'deadline')]
+        self.events += [(kickoff, KICKOFF, game_id) for game_id, kickoff in
+                        Game.objects.filter(kickoff__gt=self.last_run).values_list('pk', 'kickoff')]
+        heapq.heapify(self.events)
+
+    def run_pending(self, now=None):
+        """ Sends the signals of all events up to now, in chronological order, polls results and simulates if due """
+        now = now or utils.get_reference_date()
+        while self.events and self.events[0][0] <= now:
+            moment, kind, pk = heapq.heappop(self.events)
+            if kind == DEADLINE:
+                LOG.info('Deadline of bettable %i passed at %s' % (pk, moment))
+                self.send(bettable_closed, sender=Bettable, bettable_id=pk)
+            else:
+                LOG.info('Game %i kicked off at %s' % (pk, moment))
+                self.send(game_kicked_off, sender=Game, game_id=pk)
+                self.polling_until = max(self.polling_until or moment, moment + RESULT_POLLING_DURATION)
+        self.last_run = now
+
+        if self.polling_until is not None and now <= self.polling_until and \
+                (self.last_poll is None or (now - self.last_poll).total_seconds() >= RESULT_POLLING_INTERVAL):
+            self.last_poll = now
+            try:
+                if self.poll_results():
+                    # all started games have a result
+                    self.polling_until = None
+            except Exception:
+                # e.g. the results provider is down, polled again after RESULT_POLLING_INTERVAL
+                LOG.exception('Polling results failed')
+
+        if self.last_simulation is None or (now - self.last_simulation).total_seconds() >= SIMULATION_INTERVAL:
+            try:
+                # in this process, instead of forking workers from the long-running scheduler
+                if refresh_simulation(settings.SIMULATION_SAMPLES):
+                    self.last_simulation = now
+                    LOG.info('Refreshed the simulation of the tournament')
+            except Exception:
+                self.last_simulation = now
+                LOG.exception('Simulating the tournament failed')
+
+    @staticmethod
+    def send(signal, **kwargs):
+        """ Sends the signal to all receivers, a failing receiver is logged and does not stop the others """
+        for receiver_func, response in signal.send_robust(**kwargs):
+            if isinstance(response, Exception):
+                LOG.error('Receiver %s of %s failed' % (receiver_func.__name__, kwargs),
+                          exc_info=(type(response), response, response.__traceback__))
+
+    def poll_results(self):
+        """ Fetches new results and live scores, returns True if no started game is left without result """
+        call_command('update_results')
+        return not Game.objects.filter(kickoff__lte=utils.get_reference_date()) \
+            .filter(Q(homegoals=-1) | Q(awaygoals=-1)).exists()
+
+    def seconds_until_next_event(self, now=None):
+        now = now or utils.get_reference_date()
+        seconds = MAX_SLEEP
+        if self.events:
+            seconds = min(seconds, (self.events[0][0] - now).total_seconds())
+        if self.polling_until is not None and self.last_poll is not None:
+            seconds = min(seconds, RESULT_POLLING_INTERVAL - (now - self.last_poll).total_seconds())
+        return max(seconds, 0)
+
+    def run(self):
+        """ Runs forever, sleeping until the next event (or at most MAX_SLEEP, to pick up changed schedules) """
+        self.start()
+        while True:
+            # like a request, each iteration gets a usable database connection after the long sleep
+            close_old_connections()
+            try:
+                self.load()
+                self.run_pending()
+            except Exception:
+                # e.g. the database is unavailable, the events are picked up by the next iteration
+                LOG.exception('Running pending events failed')
+            time.sleep(self.seconds_until_next_event())
+
+
+@receiver(bettable_closed)
+def freeze_closed_bets(sender, bettable_id, **kwargs):
+    # built right away, so that the first requests after the deadline are served from the snapshot
+    for bettable in Bettable.objects.filter(pk=bettable_id).only('pk', 'kind'):
+        BetsSnapshot.build(bettable)
+    cache.delete(Bet.CLOSED_BETS_CACHE_KEY)
+
+
+@receiver(bettable_closed)
+def update_max_points_after_deadline(sender, bettable_id, **kwargs):
+    # a closed bettable can only be won with a placed bet
+    Statistic.update_max_points()
+    utils.bump_version(Statistic.VERSION_KEY)
+
+
+@receiver(bettable_closed)
+@receiver(game_kicked_off)
+def bump_tournament_data_version(sender, **kwargs):
+    # the cached tournament data contains whether bets are open, and may be filtered by kickoff
+    utils.bump_version(TOURNAMENT_DATA_VERSION_KEY)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+
+# codes of the result bet types, in the order of their points (keys of settings.BET_POINTS)
+RESULT_BET_TYPES = ('volltreffer', 'differenz', 'remis_tendenz', 'tendenz', 'niete')
+VOLLTREFFER, DIFFERENZ, REMIS_TENDENZ, TENDENZ, NIETE = range(len(RESULT_BET_TYPES))
+
+# goal differences within this range are looked up, larger ones are classified on the fly
+MAX_GOAL_DIFF = 20
+
+
+def classify_goal_diffs(bet_diff, result_diff):
+    """ Result bet type code of a game bet which does not exactly hit the result """
+    if bet_diff == result_diff:
+        return REMIS_TENDENZ if result_diff == 0 else DIFFERENZ
+    if bet_diff * result_diff > 0:
+        return TENDENZ
+    return NIETE
+
+
+class ScoringTable:
+    """
+        The BET_POINTS rules compiled into lookup structures. Apart from a Volltreffer, the result bet type
+        of a game bet only depends on the goal differences of bet and result, so it is looked up by them.
+    """
+
+    def __init__(self, bet_points, max_goal_diff=MAX_GOAL_DIFF):
+        self.bet_points = dict(bet_points)
+        self.points_by_code = tuple(bet_points[result_bet_type] for result_bet_type in RESULT_BET_TYPES)
+        self.max_goal_diff = max_goal_diff
+        self.codes_by_goal_diffs = {
+            (bet_diff, result_diff): classify_goal_diffs(bet_diff, result_diff)
+            for bet_diff in range(-max_goal_diff, max_goal_diff + 1)
+            for result_diff in range(-max_goal_diff, max_goal_diff + 1)
+        }
+
+    def game_bet_code(self, bet_homegoals, bet_awaygoals, result_homegoals, result_awaygoals):
+        if bet_homegoals == result_homegoals and bet_awaygoals == result_awaygoals:
+            return VOLLTREFFER
+        goal_diffs = (bet_homegoals - bet_awaygoals, result_homegoals - result_awaygoals)
+        code = self.codes_by_goal_diffs.get(goal_diffs)
+        return code if code is not None else classify_goal_diffs(*goal_diffs)
+
+    def score_game_bet(self, bet_homegoals, bet_awaygoals, result_homegoals, result_awaygoals):
+        """ Returns result bet type and points of a game bet """
+        code = self.game_bet_code(bet_homegoals, bet_awaygoals, result_homegoals, result_awaygoals)
+        return RESULT_BET_TYPES[code], self.points_by_code[code]
+
+    @staticmethod
+    def score_extra_bet(result_bet, result, extra_points):
+        """ Returns result bet type and points of an extra bet, which is either right or wrong """
+        if result_bet == result:
+            return RESULT_BET_TYPES[VOLLTREFFER], extra_points
+        return RESULT_BET_TYPES[NIETE], 0
+
+
+_scoring_tables = {}
+
+
+def get_scoring_table():
+    """ Returns the ScoringTable of the current settings.BET_POINTS, which is compiled only once """
+    rules = tuple(sorted(settings.BET_POINTS.items()))
+    if rules not in _scoring_tables:
+        _scoring_tables[rules] = ScoringTable(settings.BET_POINTS)
+    return _scoring_tables[rules]
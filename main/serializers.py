@@ -1,26 +1,31 @@
 # -*- coding: utf-8 -*-
-from django.template.defaultfilters import lower
+from django.db.models import Q
 from rest_framework import serializers
 from rest_framework.fields import CharField, ImageField
 
-from main import registration_overrides
+from main import registration_overrides, utils
 from main.models import *
 
 
+def context_reference_date(serializer):
+    """ One reference date for all objects of a serialization, the viewsets pass it in the context per request """
+    context = serializer.context
+    if 'reference_date' not in context:
+        context['reference_date'] = utils.get_reference_date()
+    return context['reference_date']
+
+
 class BetSerializer(serializers.ModelSerializer):
     # needs to be specified explicitly with default because it is part of a unique_together relation in the model
     user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
 
-    bettable_type = serializers.SerializerMethodField(read_only=True)
+    bettable_type = serializers.CharField(source='bettable.kind', read_only=True)
 
     class Meta:
         model = Bet
         fields = '__all__'
         read_only_fields = ('points', 'result_bet_type',)
 
-    def get_bettable_type(self, obj):
-        return lower(type(obj.bettable.get_related_child()).__name__)
-
     def validate(self, attrs):
         if attrs['bettable'].deadline_passed():
             raise serializers.ValidationError({ 'detail': 'Die Deadline ist abgelaufen.', 'code': 'DEADLINE_PASSED'})
@@ -28,15 +33,12 @@ class BetSerializer(serializers.ModelSerializer):
 
 
 class BettableSerializer(serializers.ModelSerializer):
-    type = serializers.SerializerMethodField()
+    type = serializers.CharField(source='kind', read_only=True)
 
     class Meta:
         model = Bettable
         fields = ('id', 'deadline', 'name', 'result', 'type')
 
-    def get_type(self, obj):
-        return lower(type(obj.get_related_child()).__name__)
-
 
 class ExtraChoiceNameField(serializers.RelatedField):
     def to_representation(self, value):
@@ -52,7 +54,7 @@ class ExtraSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'points', 'deadline', 'result', 'choices', 'open')
 
     def get_open(self, obj):
-        return not obj.deadline_passed()
+        return not obj.deadline_passed(context_reference_date(self))
 
 
 class TournamentGroupSerializer(serializers.ModelSerializer):
@@ -129,7 +131,7 @@ class GameSerializer(serializers.ModelSerializer):
         }
 
     def get_bets_open(self, obj):
-        return not obj.deadline_passed()
+        return not obj.deadline_passed(context_reference_date(self))
 
     def get_city(self, obj):
         return obj.venue.city
@@ -141,6 +143,46 @@ class GameSerializer(serializers.ModelSerializer):
         return TournamentGroupSerializer.as_dict(obj.hometeam.group) if not obj.round.is_knock_out else None
 
 
+class GameResultSerializer(serializers.Serializer):
+    homegoals = serializers.IntegerField(min_value=0)
+    awaygoals = serializers.IntegerField(min_value=0)
+
+
+class GameScenarioSerializer(serializers.Serializer):
+    game = serializers.IntegerField()
+    homegoals = serializers.IntegerField(min_value=0)
+    awaygoals = serializers.IntegerField(min_value=0)
+
+
+class ExtraScenarioSerializer(serializers.Serializer):
+    extra = serializers.IntegerField()
+    result = serializers.CharField(max_length=50)
+
+
+class WhatIfSerializer(serializers.Serializer):
+    """ Hypothetical results of unfinished games and extras """
+    games = GameScenarioSerializer(many=True, required=False, default=list)
+    extras = ExtraScenarioSerializer(many=True, required=False, default=list)
+
+    def validate_games(self, games):
+        game_ids = [game['game'] for game in games]
+        unfinished_ids = set(Game.objects.filter(pk__in=game_ids).filter(Q(homegoals=-1) | Q(awaygoals=-1))
+                             .values_list('pk', flat=True))
+        invalid_ids = [game_id for game_id in game_ids if game_id not in unfinished_ids]
+        if invalid_ids:
+            raise serializers.ValidationError('Games %s do not exist or are already finished.' % invalid_ids)
+        return games
+
+    def validate_extras(self, extras):
+        extra_ids = [extra['extra'] for extra in extras]
+        unfinished_ids = set(Extra.objects.filter(pk__in=extra_ids).filter(Q(result__isnull=True) | Q(result=''))
+                             .values_list('pk', flat=True))
+        invalid_ids = [extra_id for extra_id in extra_ids if extra_id not in unfinished_ids]
+        if invalid_ids:
+            raise serializers.ValidationError('Extras %s do not exist or are already finished.' % invalid_ids)
+        return extras
+
+
 class GameKickoffsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Game
@@ -262,8 +304,65 @@ class StatisticSerializer(serializers.ModelSerializer):
     username = CharField(source='user.username', read_only=True)
     user_avatar = CharField(source='user.profile.avatar', read_only=True)
 
+    # set by the leaderboard (cf. set_rank_bounds), omitted otherwise
+    best_rank = serializers.IntegerField(read_only=True)
+    worst_rank = serializers.IntegerField(read_only=True)
+    is_eliminated = serializers.BooleanField(read_only=True)
+    has_clinched = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Statistic
         fields = '__all__'
 
 
+class RoundStatisticSerializer(serializers.ModelSerializer):
+    username = CharField(source='user.username', read_only=True)
+    user_avatar = CharField(source='user.profile.avatar', read_only=True)
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = RoundStatistic
+        exclude = ('id',)
+
+
+class MatchdayStatisticSerializer(serializers.ModelSerializer):
+    username = CharField(source='user.username', read_only=True)
+    user_avatar = CharField(source='user.profile.avatar', read_only=True)
+    rank = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = MatchdayStatistic
+        exclude = ('id',)
+
+
+class ProvisionalStatisticSerializer(StatisticSerializer):
+    """ Serializes statistics including the points of the live games, as computed by the provisional leaderboard """
+    live_points = serializers.IntegerField(read_only=True)
+    rank = serializers.IntegerField(read_only=True)
+
+
+class LeaderboardSerializer(serializers.ModelSerializer):
+    """ Serializes users annotated by the aggregated leaderboard with the same fields as the StatisticSerializer """
+    user = serializers.IntegerField(source='pk', read_only=True)
+    user_avatar = CharField(source='profile.avatar', read_only=True)
+
+    no_bets = serializers.IntegerField(read_only=True)
+    no_volltreffer = serializers.IntegerField(read_only=True)
+    no_differenz = serializers.IntegerField(read_only=True)
+    no_remis_tendenz = serializers.IntegerField(read_only=True)
+    no_tendenz = serializers.IntegerField(read_only=True)
+    no_niete = serializers.IntegerField(read_only=True)
+    points = serializers.IntegerField(read_only=True)
+    max_points = serializers.IntegerField(read_only=True)
+    rank = serializers.IntegerField(read_only=True)
+
+    best_rank = serializers.IntegerField(read_only=True)
+    worst_rank = serializers.IntegerField(read_only=True)
+    is_eliminated = serializers.BooleanField(read_only=True)
+    has_clinched = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('user', 'username', 'user_avatar', 'no_bets', 'no_volltreffer', 'no_differenz', 'no_remis_tendenz',
+                  'no_tendenz', 'no_niete', 'points', 'max_points', 'rank', 'best_rank', 'worst_rank', 'is_eliminated',
+                  'has_clinched')
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.cache import cache
+
+from main import utils
+from main.bets_matrix import score_game_bets
+from main.models import ExtraChoice, Statistic
+from main.scenarios import ScenarioSnapshot
+from main.scoring import VOLLTREFFER, get_scoring_table
+
+# goals per team and game are sampled from a Poisson distribution with this mean, capped at MAX_SIMULATED_GOALS
+EXPECTED_GOALS = 1.35
+MAX_SIMULATED_GOALS = 7
+
+# points and Volltreffer are combined into one sort key per user, Volltreffer resolve ties of points
+VOLLTREFFER_WEIGHT = 1000
+
+SAMPLES_PER_BATCH = 500
+SIMULATION_CACHE_TIMEOUT = 60 * 60
+
+
+def poisson_probabilities(mean, max_value):
+    probabilities = np.array([math.exp(-mean) * mean ** k / math.factorial(k) for k in range(max_value + 1)])
+    return probabilities / probabilities.sum()
+
+
+class TournamentSimulation:
+    """
+        Samples outcomes of all unfinished games and extras and counts how often each user finishes
+        first, within the top 3 or last. For every unfinished bettable, the sort keys of all users are
+        pre-computed per possible outcome, so a sample only adds up one row per bettable.
+    """
+
+    def __init__(self, snapshot, expected_goals=EXPECTED_GOALS):
+        self.user_ids, self.usernames = snapshot.user_ids, snapshot.usernames
+        self.base_keys = (snapshot.points * VOLLTREFFER_WEIGHT + snapshot.no_volltreffer).astype(np.int32)
+        # the last tie resolution is the username, as in the leaderboard
+        self.tie_breaks = len(self.user_ids) - 1 - np.argsort(np.argsort(self.usernames))
+        # (sort keys per outcome and user, probability per outcome) for each unfinished bettable
+        self.outcome_tables = []
+
+        goals = np.arange(MAX_SIMULATED_GOALS + 1, dtype=np.int16)
+        homegoals, awaygoals = (grid.ravel() for grid in np.meshgrid(goals, goals, indexing='ij'))
+        goal_probabilities = poisson_probabilities(expected_goals, MAX_SIMULATED_GOALS)
+        probabilities = np.outer(goal_probabilities, goal_probabilities).ravel()
+
+        matrix, scoring_table = snapshot.matrix, get_scoring_table()
+        for game_position in range(len(matrix.game_ids)):
+            bets = np.nonzero(matrix.game_indices == game_position)[0]
+            table = np.zeros((len(probabilities), len(self.user_ids)), dtype=np.int32)
+            for outcome, (result_homegoals, result_awaygoals) in enumerate(zip(homegoals, awaygoals)):
+                codes, points = score_game_bets(scoring_table, matrix.homegoals_bet[bets], matrix.awaygoals_bet[bets],
+                                                np.full(len(bets), result_homegoals, dtype=np.int16),
+                                                np.full(len(bets), result_awaygoals, dtype=np.int16))
+                table[outcome, snapshot.bet_user_positions[bets]] = \
+                    points.astype(np.int32) * VOLLTREFFER_WEIGHT + (codes == VOLLTREFFER)
+            self.outcome_tables.append((table, probabilities))
+
+        # without any information on the teams, all choices of an extra are equally likely
+        choices_by_extra = {}
+        for extra_id, choice in ExtraChoice.objects.filter(extra_id__in=snapshot.extras.keys()) \
+                .values_list('extra_id', 'name'):
+            choices_by_extra.setdefault(extra_id, []).append(choice)
+        for extra_id, choices in choices_by_extra.items():
+            extra_points, bet_user_positions, result_bets = snapshot.extras[extra_id]
+            table = np.zeros((len(choices), len(self.user_ids)), dtype=np.int32)
+            for outcome, choice in enumerate(choices):
+                table[outcome, bet_user_positions[result_bets == choice]] = extra_points * VOLLTREFFER_WEIGHT + 1
+            self.outcome_tables.append((table, np.full(len(choices), 1 / len(choices))))
+
+    def simulate(self, samples, seed=None):
+        """ Returns how often each user finished first, within the top 3 and last, as array of shape (3, users) """
+        no_users = len(self.user_ids)
+        counts = np.zeros((3, no_users), dtype=np.int64)
+        if not no_users:
+            return counts
+
+        rng = np.random.default_rng(seed)
+        for start in range(0, samples, SAMPLES_PER_BATCH):
+            batch_size = min(SAMPLES_PER_BATCH, samples - start)
+            keys = np.repeat(self.base_keys[np.newaxis, :], batch_size, axis=0)
+            for table, probabilities in self.outcome_tables:
+                keys += table[rng.choice(len(probabilities), size=batch_size, p=probabilities)]
+            keys = keys.astype(np.int64) * no_users + self.tie_breaks
+
+            counts[0] += np.bincount(keys.argmax(axis=1), minlength=no_users)
+            top = min(3, no_users)
+            counts[1] += np.bincount(np.argpartition(-keys, top - 1, axis=1)[:, :top].ravel(), minlength=no_users)
+            counts[2] += np.bincount(keys.argmin(axis=1), minlength=no_users)
+        return counts
+
+    def run(self, samples, workers=1, seed=None):
+        """
+            Runs the given number of samples, split across a pool of worker processes if more than one is given.
+            Returns the probabilities of each user, ordered by the probability to finish first.
+        """
+        seeds = np.random.SeedSequence(seed).spawn(max(workers, 1))
+        chunks = [samples // len(seeds) + (1 if i < samples % len(seeds) else 0) for i in range(len(seeds))]
+        if workers <= 1:
+            counts = self.simulate(samples, seeds[0])
+        else:
+            global _simulation
+            # the forked workers share the outcome tables of this process instead of getting them pickled
+            _simulation = self
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+                counts = sum(executor.map(simulate_chunk, chunks, seeds))
+
+        probabilities = counts / max(samples, 1)
+        order = np.lexsort((self.usernames, -probabilities[1], -probabilities[0]))
+        return [{'user': int(self.user_ids[i]), 'username': str(self.usernames[i]),
+                 'first': float(probabilities[0][i]), 'top3': float(probabilities[1][i]),
+                 'last': float(probabilities[2][i])} for i in order]
+
+
+_simulation = None
+
+
+def simulate_chunk(samples, seed):
+    return _simulation.simulate(samples, seed)
+
+
+def simulation_cache_key(samples):
+    return 'tournament_simulation:%s:%i' % (utils.get_version(Statistic.VERSION_KEY), samples)
+
+
+def latest_simulation_cache_key(samples):
+    return 'tournament_simulation:latest:%i' % samples
+
+
+def store_simulation(cache_key, samples, results):
+    """ Stores the results under the version they were simulated for and as the latest results, which never expire """
+    cache.set(cache_key, results, SIMULATION_CACHE_TIMEOUT)
+    cache.set(latest_simulation_cache_key(samples), results, None)
+
+
+def refresh_simulation(samples, workers=1):
+    """ Simulates and stores the current bets and results unless they have been simulated already, returns whether """
+    cache_key = simulation_cache_key(samples)
+    if cache.get(cache_key) is not None:
+        return False
+    store_simulation(cache_key, samples, simulate_tournament(samples, workers))
+    return True
+
+
+def stored_simulation(samples):
+    """ The results of the current version, else the latest stored ones until they are simulated again, or None """
+    results = cache.get(simulation_cache_key(samples))
+    return results if results is not None else cache.get(latest_simulation_cache_key(samples))
+
+
+def simulate_tournament(samples, workers=1, seed=None):
+    return TournamentSimulation(ScenarioSnapshot()).run(samples, workers, seed)
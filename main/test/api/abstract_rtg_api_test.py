@@ -22,6 +22,8 @@ class RtgApiTestCase(APITestCase):
     PUBLIC_USERS_BASEURL = '/rtg/users_public/'
     ADMIN_USERS_BASEURL = '/rtg/users_admin/'
     STATISTICS_BASEURL = '/rtg/statistics/'
+    ROUND_STATISTICS_BASEURL = '/rtg/statistics-rounds/'
+    MATCHDAY_STATISTICS_BASEURL = '/rtg/statistics-matchdays/'
     POSTS_BASEURL = '/rtg/posts/'
     COMMENTS_BASEURL = '/rtg/comments/'
 
@@ -2,6 +2,7 @@
 from datetime import timedelta
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from rest_framework import status
 
 from main.models import Bet, Bettable
@@ -43,6 +44,17 @@ class BetApiTests(RtgApiTestCase):
         self.assertEqual(Bet.objects.count(), 1)
         self.assertIsNotNone(Bet.objects.get(user=u1))
 
+    def test_bet_list_bettable_types(self):
+        user = self.create_test_user()
+        for i in range(3):
+            TestModelUtils.create_bet(user, TestModelUtils.create_game(), '1:0')
+        TestModelUtils.create_bet(user, TestModelUtils.create_extra(), 'Deutschland')
+
+        # validator and bets joined with their bettables, independent of the number of bets
+        with self.assertNumQueries(2):
+            response = self.client.get(self.BETS_BASEURL)
+        self.assertEqual(['extra', 'game', 'game', 'game'], sorted(bet['bettable_type'] for bet in response.data))
+
     def test_bet_read_others_bet_before_deadline(self):
         """
             A user may only read their own bet before a game's deadline, but also foreign bets when the deadline
@@ -228,6 +240,59 @@ class BetApiTests(RtgApiTestCase):
         response = self.delete_test_bet_api()
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_bet_list_conditional(self):
+        u1, u2 = TestModelUtils.create_user(), TestModelUtils.create_user()
+        self.create_test_user(u1.username)
+        game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=2)))
+        with self.captureOnCommitCallbacks(execute=True):
+            bet = TestModelUtils.create_bet(u1, game, '2:1')
+            TestModelUtils.create_bet(u2, game, '1:1')
+
+        etag = self.client.get(self.BETS_BASEURL)['ETag']
+        response = self.client.get(self.BETS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        # other users see different bets
+        self.create_test_user(u2.username)
+        self.assertEqual(status.HTTP_200_OK, self.client.get(self.BETS_BASEURL, HTTP_IF_NONE_MATCH=etag).status_code)
+
+        # scored bets are modified, even though their points are written by a bulk update
+        self.create_test_user(u1.username)
+        with self.captureOnCommitCallbacks(execute=True):
+            game.set_result_goals(2, 1)
+        response = self.client.get(self.BETS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, next(data for data in response.data if data['id'] == bet.pk)['points'])
+
+    def test_bet_matrix(self):
+        cache.clear()
+        u1, u2 = TestModelUtils.create_user(), TestModelUtils.create_user()
+        self.create_test_user(u1.username)
+        g1 = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-2)))
+        extra = TestModelUtils.create_extra(deadline=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        open_game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=2)))
+        TestModelUtils.create_bet(u1, g1, '2:1')
+        TestModelUtils.create_bet(u2, g1, '0:0')
+        TestModelUtils.create_bet(u2, extra, 'Belgien')
+        TestModelUtils.create_bet(u1, open_game, '1:1')
+
+        response = self.client.get('%smatrix/' % self.BETS_BASEURL)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({'users': [u1.pk, u2.pk], 'bettables': [g1.pk, extra.pk],
+                          'result_bets': [['2:1', '0:0'], [None, 'Belgien']]}, response.data)
+
+        # cached until the next deadline, bets on open bettables do not invalidate it
+        TestModelUtils.create_bet(u2, open_game, '3:0')
+        with self.assertNumQueries(0):
+            self.client.get('%smatrix/' % self.BETS_BASEURL)
+
+        # ... unlike changes to closed bets
+        bet = Bet.objects.get(user=u1, bettable=g1)
+        bet.result_bet = '3:1'
+        bet.save()
+        response = self.client.get('%smatrix/' % self.BETS_BASEURL)
+        self.assertEqual(['3:1', '0:0'], response.data['result_bets'][0])
+
     def get_test_bet_api(self):
         test_bet = TestModelUtils.create_bet(self.test_user, None, '4:2')
         return self.client.get('%s%i/' % (self.BETS_BASEURL, test_bet.pk))
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
+import gzip
+import json
 from datetime import timedelta
+from io import StringIO
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.utils import timezone
 from rest_framework import status
 
-from main.models import Bet, Bettable
+from main.models import Bet, Bettable, BetsSnapshot
 from main.test.api.abstract_rtg_api_test import RtgApiTestCase
 from main.test.utils import TestModelUtils
 
@@ -23,7 +27,9 @@ class BettableApiTests(RtgApiTestCase):
         some_game = TestModelUtils.create_game(deadline=timezone.now())
         some_extra = TestModelUtils.create_extra(deadline=timezone.now() + timedelta(days=1))
 
-        response = self.client.get(self.BETTABLES_BASEURL)
+        # the types are read from the bettables, without queries on the child tables
+        with self.assertNumQueries(4):
+            response = self.client.get(self.BETTABLES_BASEURL)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(2, len(response.data))
         self.assertEqual(some_game.bettable_ptr.name, response.data[0]['name'])
@@ -51,3 +57,49 @@ class BettableApiTests(RtgApiTestCase):
         some_bettable = TestModelUtils.create_game()
         response = self.client.delete('%s%i/' % (self.BETTABLES_BASEURL, some_bettable.pk))
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_closed_bets_snapshot(self):
+        user = self.create_test_user()
+        game = TestModelUtils.create_game(kickoff=timezone.now() + timedelta(hours=1))
+        bet = TestModelUtils.create_bet(user, game, '2:1')
+        other_bet = TestModelUtils.create_bet(bettable=game, result_bet='0:0')
+        url = '%s%i/bets/' % (self.BETTABLES_BASEURL, game.pk)
+
+        self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, self.client.get(url).status_code)
+
+        Bettable.objects.filter(pk=game.pk).update(deadline=timezone.now() - timedelta(minutes=1))
+        out = StringIO()
+        call_command('build_bets_snapshots', stdout=out)
+        self.assertIn('Built snapshot of bettable %i' % game.pk, out.getvalue())
+        call_command('build_bets_snapshots', stdout=StringIO())
+        self.assertEqual(1, BetsSnapshot.objects.count())
+
+        # served from the snapshot, compressed if the client accepts it
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('gzip', response['Content-Encoding'])
+        # revalidated, since the snapshot is re-built on corrections
+        self.assertEqual('private, no-cache', response['Cache-Control'])
+        expected = {'bettable': game.pk, 'bettable_type': 'game',
+                    'bets': [{'id': bet.pk, 'user': user.pk, 'result_bet': '2:1'},
+                             {'id': other_bet.pk, 'user': other_bet.user_id, 'result_bet': '0:0'}]}
+        self.assertEqual(expected, json.loads(gzip.decompress(response.content)))
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(expected, json.loads(response.content))
+
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        # an admin correction drops the snapshot, which is re-built on the next request
+        bet = Bet.objects.get(pk=bet.pk)
+        bet.result_bet = '3:1'
+        bet.save()
+        self.assertFalse(BetsSnapshot.objects.exists())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        self.assertEqual('3:1', json.loads(response.content)['bets'][0]['result_bet'])
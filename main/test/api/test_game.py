@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.utils import timezone
 from rest_framework import status
 
@@ -80,6 +81,38 @@ class GameApiTests(RtgApiTestCase):
         self.assertEquals(stored_game.homegoals, 3)
         self.assertEquals(stored_game.awaygoals, 2)
 
+    def test_game_enter_result(self):
+        self.create_test_user(admin=True)
+        g1 = TestModelUtils.create_game()
+
+        response = self.client.post("%s%i/result/" % (self.GAMES_BASEURL, g1.pk), {'homegoals': 3, 'awaygoals': 2},
+                                    format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, 2), (response.data['homegoals'], response.data['awaygoals']))
+
+        stored_game = Game.objects.get(pk=g1.pk)
+        self.assertEqual((3, 2), (stored_game.homegoals, stored_game.awaygoals))
+        self.assertEqual('3:2', stored_game.result)
+
+        response = self.client.delete("%s%i/result/" % (self.GAMES_BASEURL, g1.pk))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse(Game.objects.get(pk=g1.pk).has_result())
+
+    def test_game_enter_invalid_result(self):
+        self.create_test_user(admin=True)
+        g1 = TestModelUtils.create_game()
+
+        response = self.client.post("%s%i/result/" % (self.GAMES_BASEURL, g1.pk), {'homegoals': -3}, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_game_enter_result_unauth(self):
+        self.create_test_user()
+        g1 = TestModelUtils.create_game()
+
+        response = self.client.post("%s%i/result/" % (self.GAMES_BASEURL, g1.pk), {'homegoals': 3, 'awaygoals': 2},
+                                    format='json')
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
     def test_game_update_unauth(self):
         self.create_test_user()
         response = self.update_test_game_api()
@@ -161,6 +194,83 @@ class GameApiTests(RtgApiTestCase):
         self.assertEqual(g2.id, response.data['results'][1]['id'])
         self.assertEqual(g3.id, response.data['results'][2]['id'])
 
+    def test_game_list_cached(self):
+        self.create_test_user()
+        game = TestModelUtils.create_game(kickoff=timezone.now() + timedelta(hours=1))
+        self.assertEqual(1, self.client.get(self.GAMES_BASEURL).data['count'])
+
+        # served from the cache until the tournament data changes, only the validator is queried
+        with self.assertNumQueries(1):
+            response = self.client.get(self.GAMES_BASEURL)
+        self.assertTrue(response.data['results'][0]['bets_open'])
+
+        # conditional requests are answered before anything is serialized
+        with self.assertNumQueries(1):
+            not_modified = self.client.get(self.GAMES_BASEURL, HTTP_IF_NONE_MATCH='W/%s' % response['ETag'])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, not_modified.status_code)
+        self.assertEqual(response['ETag'], not_modified['ETag'])
+
+        game.set_result_goals(1, 0)
+        modified = self.client.get(self.GAMES_BASEURL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, modified.status_code)
+        self.assertEqual(1, modified.data['results'][0]['homegoals'])
+        TestModelUtils.create_game(kickoff=timezone.now() - timedelta(hours=1))
+        self.assertEqual(2, self.client.get(self.GAMES_BASEURL).data['count'])
+
+        # the query parameters are part of the key
+        self.assertEqual(1, self.client.get(self.GAMES_BASEURL, {'kicked_off': 'true'}).data['count'])
+
+    def test_game_list_query_budget(self):
+        self.create_test_user()
+        for i in range(3):
+            TestModelUtils.create_game(kickoff=timezone.now() + timedelta(hours=i + 1))
+        cache.clear()
+        # validator, count, games with all their related objects and the next deadline and kickoff for the cache timeout
+        with self.assertNumQueries(5):
+            self.assertEqual(3, self.client.get(self.GAMES_BASEURL).data['count'])
+
+        # independent of the number of games, as long as no game can be bet anymore
+        for i in range(10):
+            TestModelUtils.create_game(kickoff=timezone.now() - timedelta(hours=i + 1))
+        cache.clear()
+        with self.assertNumQueries(5):
+            response = self.client.get(self.GAMES_BASEURL)
+        self.assertEqual(13, response.data['count'])
+        self.assertEqual([True] * 3 + [False] * 10,
+                         [game['bets_open'] for game in reversed(response.data['results'])])
+
+    def test_game_bet_distribution(self):
+        cache.clear()
+        self.create_test_user()
+        game = TestModelUtils.create_game(kickoff=timezone.now() + timedelta(hours=1))
+        bets = [TestModelUtils.create_bet(bettable=game, result_bet=result_bet)
+                for result_bet in ('2:1', '1:1', '2:1', '0:3', '', '2:1', '1:1', '0:0')]
+
+        # hidden until the deadline has passed
+        response = self.client.get('%s%i/bet-distribution/' % (self.GAMES_BASEURL, game.pk))
+        self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, response.status_code)
+
+        Game.objects.filter(pk=game.pk).update(deadline=timezone.now() - timedelta(minutes=1))
+        response = self.client.get('%s%i/bet-distribution/' % (self.GAMES_BASEURL, game.pk))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({
+            'game': game.pk,
+            'no_bets': 7,
+            'scorelines': [{'homegoals': 2, 'awaygoals': 1, 'count': 3}, {'homegoals': 1, 'awaygoals': 1, 'count': 2},
+                           {'homegoals': 0, 'awaygoals': 0, 'count': 1}, {'homegoals': 0, 'awaygoals': 3, 'count': 1}],
+            'tendencies': {'home': 42.9, 'draw': 42.9, 'away': 14.3},
+        }, response.data)
+
+        # cached, only the game is loaded
+        with self.assertNumQueries(1):
+            self.client.get('%s%i/bet-distribution/' % (self.GAMES_BASEURL, game.pk))
+
+        # ... until an admin changes a bet
+        bets[0].result_bet = '0:1'
+        bets[0].save()
+        response = self.client.get('%s%i/bet-distribution/' % (self.GAMES_BASEURL, game.pk))
+        self.assertEqual({'home': 28.6, 'draw': 42.9, 'away': 28.6}, response.data['tendencies'])
+
     def get_test_game_api(self, game_id):
         return self.client.get('%s%i/' % (self.GAMES_BASEURL, game_id))
 
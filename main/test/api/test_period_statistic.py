@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+
+from django.utils import timezone
+
+from rest_framework import status
+
+from main.test.api.abstract_rtg_api_test import RtgApiTestCase
+from main.test.utils import TestModelUtils
+
+
+class PeriodStatisticApiTests(RtgApiTestCase):
+
+    def setUp(self):
+        self.user = self.create_test_user('user')
+        self.other = TestModelUtils.create_user(username='other', last_login=timezone.now())
+        self.round = TestModelUtils.create_round()
+        self.later_round = TestModelUtils.create_round()
+        self.game = TestModelUtils.create_game(kickoff=timezone.make_aware(datetime(2024, 6, 14, 21)), round=self.round)
+        self.later_game = TestModelUtils.create_game(kickoff=timezone.make_aware(datetime(2024, 6, 20, 18)),
+                                                     round=self.later_round)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, self.game, '1:0')
+            TestModelUtils.create_bet(self.other, self.game, '2:0')
+            TestModelUtils.create_bet(self.user, self.later_game, '3:3')
+            TestModelUtils.create_bet(self.other, self.later_game, '1:1')
+            self.game.set_result_goals(2, 0)
+            self.later_game.set_result_goals(3, 3)
+
+    def test_round_leaderboard(self):
+        response = self.client.get('%s?round=%i' % (self.ROUND_STATISTICS_BASEURL, self.round.pk))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        leaderboard = response.data['results']
+        self.assertEqual(['other', 'user'], [row['username'] for row in leaderboard])
+        self.assertEqual([1, 2], [row['rank'] for row in leaderboard])
+        self.assertEqual([self.round.pk] * 2, [row['round'] for row in leaderboard])
+
+        response = self.client.get('%s?round=%i' % (self.ROUND_STATISTICS_BASEURL, self.later_round.pk))
+        self.assertEqual(['user', 'other'], [row['username'] for row in response.data['results']])
+
+    def test_matchday_leaderboard(self):
+        response = self.client.get('%s?matchday=2024-06-20&limit=1' % self.MATCHDAY_STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        self.assertEqual(2, response.data['count'])
+        self.assertEqual([('user', 1, 1)], [(row['username'], row['rank'], row['no_volltreffer'])
+                                            for row in response.data['results']])
+
+    def test_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.get(self.ROUND_STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
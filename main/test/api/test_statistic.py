@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 from datetime import timedelta
+from io import StringIO
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, update_last_login
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
 
 from rest_framework import status
 
-from main.models import Game, Bet, Statistic
+from main.models import Game, Bet, Bettable, Statistic
 from main.test.api.abstract_rtg_api_test import RtgApiTestCase
 from main.test.utils import TestModelUtils
 
@@ -18,6 +22,7 @@ class StatisticApiTests(RtgApiTestCase):
 
     def setUp(self):
         self.user = self.create_test_user('user', True, True)
+        cache.clear()
 
     def tearDown(self):
         User.objects.all().delete()
@@ -27,10 +32,12 @@ class StatisticApiTests(RtgApiTestCase):
 
     def test_recalculate_after_game_update(self):
         self.game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now())
-        self.bet = TestModelUtils.create_bet(self.user, self.game, '2:1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bet = TestModelUtils.create_bet(self.user, self.game, '2:1')
 
-        response = self.client.patch("%s%i/" % (self.GAMES_BASEURL, self.game.pk), {'homegoals': 3, 'awaygoals': 2},
-                                     format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch("%s%i/" % (self.GAMES_BASEURL, self.game.pk),
+                                         {'homegoals': 3, 'awaygoals': 2}, format='json')
         self.assertEqual(status.HTTP_200_OK, response.status_code)
 
         updated_bet = self.client.get("%s%i/" % (self.BETS_BASEURL, self.bet.pk)).data
@@ -53,3 +60,425 @@ class StatisticApiTests(RtgApiTestCase):
 
         response = self.client.get("%s%i/" % (self.STATISTICS_BASEURL, self.user.pk))
         self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, response.status_code)
+
+    def test_aggregated_leaderboard_equals_stored(self):
+        other_user = TestModelUtils.create_user(last_login=TestModelUtils.create_datetime_from_now())
+        g1 = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+        g2 = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, g1, '2:1')
+            TestModelUtils.create_bet(self.user, g2, '0:0')
+            TestModelUtils.create_bet(other_user, g1, '3:2')
+            TestModelUtils.create_bet(other_user, g2, '1:1')
+            g1.set_result_goals(2, 1)
+            g2.set_result_goals(1, 1)
+
+        stored = self.client.get(self.STATISTICS_BASEURL).data
+        with override_settings(LEADERBOARD_MODE='aggregated'):
+            aggregated = self.client.get(self.STATISTICS_BASEURL).data
+            aggregated_user = self.client.get("%s%i/" % (self.STATISTICS_BASEURL, other_user.pk)).data
+
+        self.assertEqual([stat['user'] for stat in stored], [stat['user'] for stat in aggregated])
+        self.assertEqual([1, 2], [stat['rank'] for stat in aggregated])
+        for stored_stat, aggregated_stat in zip(stored, aggregated):
+            for field in ('username', 'points', 'no_bets', 'no_volltreffer', 'no_differenz', 'no_remis_tendenz',
+                          'no_tendenz', 'no_niete'):
+                self.assertEqual(stored_stat[field], aggregated_stat[field])
+        self.assertEqual(1, aggregated_user['rank'])
+
+    @override_settings(LEADERBOARD_MODE='aggregated')
+    def test_aggregated_leaderboard_ties(self):
+        TestModelUtils.create_user(username='b_user', last_login=TestModelUtils.create_datetime_from_now())
+        TestModelUtils.create_user(username='a_user', last_login=TestModelUtils.create_datetime_from_now())
+        TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+
+        # ties are resolved by username, like the ordering of the stored statistics
+        response = self.client.get(self.STATISTICS_BASEURL).data
+        self.assertEqual(['a_user', 'b_user', 'user'], [stat['username'] for stat in response])
+        self.assertEqual([1, 2, 3], [stat['rank'] for stat in response])
+
+    def test_provisional_leaderboard(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        finished = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+        live = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, finished, '2:1')
+            TestModelUtils.create_bet(other_user, finished, '1:0')
+            TestModelUtils.create_bet(self.user, live, '0:1')
+            TestModelUtils.create_bet(other_user, live, '1:1')
+            finished.set_result_goals(2, 1)
+
+        # without a live score, the provisional leaderboard is the stored one
+        response = self.client.get('%sprovisional/' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([('user', 3, 0, 1), ('other', 2, 0, 2)],
+                         [(stat['username'], stat['points'], stat['live_points'], stat['rank'])
+                          for stat in response.data])
+
+        # WHEN: the live game is a draw for now
+        live.set_live_goals(2, 2)
+        response = self.client.get('%sprovisional/' % self.STATISTICS_BASEURL).data
+
+        # THEN: the points of the live game are added, without persisting anything
+        self.assertEqual([('user', 3, 0, 1), ('other', 3, 1, 2)],
+                         [(stat['username'], stat['points'], stat['live_points'], stat['rank']) for stat in response])
+        self.assertEqual(1, response[1]['no_remis_tendenz'])
+        self.assertEqual(2, Statistic.objects.get(user=other_user).points)
+        self.assertIsNone(Bet.objects.get(user=other_user, bettable=live).points)
+
+        # WHEN: the away team scores
+        live.set_live_goals(2, 3)
+        response = self.client.get('%sprovisional/' % self.STATISTICS_BASEURL).data
+
+        # THEN: the leaderboard changes accordingly
+        self.assertEqual([('user', 5, 2, 1), ('other', 2, 0, 2)],
+                         [(stat['username'], stat['points'], stat['live_points'], stat['rank']) for stat in response])
+
+    def test_provisional_leaderboard_cached_per_live_scores(self):
+        live = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, live, '1:0')
+        live.set_live_goals(1, 0)
+
+        self.client.get('%sprovisional/' % self.STATISTICS_BASEURL)
+        # only the live scores are queried when nothing changed (besides the tournament start)
+        with self.assertNumQueries(2):
+            response = self.client.get('%sprovisional/' % self.STATISTICS_BASEURL).data
+        self.assertEqual(3, response[0]['points'])
+
+        live.set_live_goals(1, 1)
+        self.assertEqual(0, self.client.get('%sprovisional/' % self.STATISTICS_BASEURL).data[0]['points'])
+
+        # a result of another game invalidates the cache as well
+        finished = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, finished, '2:0')
+            finished.set_result_goals(2, 0)
+        self.assertEqual(3, self.client.get('%sprovisional/' % self.STATISTICS_BASEURL).data[0]['points'])
+
+    def test_provisional_leaderboard_should_fail_before_tournament(self):
+        TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=5)))
+
+        response = self.client.get('%sprovisional/' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, response.status_code)
+
+    def test_what_if(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        finished = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=-1)))
+        open_game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=1)))
+        extra = TestModelUtils.create_extra(points=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, finished, '2:1')
+            TestModelUtils.create_bet(other_user, finished, '1:0')
+            TestModelUtils.create_bet(self.user, open_game, '0:1')
+            TestModelUtils.create_bet(other_user, open_game, '1:1')
+            TestModelUtils.create_bet(other_user, extra, 'Schweiz')
+            finished.set_result_goals(2, 1)
+
+        # without hypothetical results, the current standings are returned
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {}, format='json')
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([('user', 3, 1), ('other', 2, 2)],
+                         [(stat['username'], stat['points'], stat['rank']) for stat in response.data['leaderboard']])
+        self.assertEqual((1, 3), (response.data['rank'], response.data['points']))
+
+        # WHEN: the open game and the extra end in favour of the other user
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {
+            'games': [{'game': open_game.pk, 'homegoals': 1, 'awaygoals': 1}],
+            'extras': [{'extra': extra.pk, 'result': 'Schweiz'}]
+        }, format='json')
+
+        # THEN: the leaderboard changes, but nothing is persisted
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([('other', 15, 1), ('user', 3, 2)],
+                         [(stat['username'], stat['points'], stat['rank']) for stat in response.data['leaderboard']])
+        self.assertEqual((2, 3), (response.data['rank'], response.data['points']))
+        self.assertEqual(2, Statistic.objects.get(user=other_user).points)
+        self.assertIsNone(Bet.objects.get(user=other_user, bettable=open_game).points)
+
+        # WHEN: a bet changes
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, extra, 'Schweiz')
+
+        # THEN: the snapshot is re-built
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {
+            'extras': [{'extra': extra.pk, 'result': 'Schweiz'}]
+        }, format='json')
+        self.assertEqual([('user', 13, 1), ('other', 12, 2)],
+                         [(stat['username'], stat['points'], stat['rank']) for stat in response.data['leaderboard']])
+
+    def test_what_if_finished_bettables(self):
+        finished = TestModelUtils.create_game(homegoals=1, awaygoals=0)
+        finished_extra = TestModelUtils.create_extra(result='Schweiz')
+
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {
+            'games': [{'game': finished.pk, 'homegoals': 1, 'awaygoals': 1}]
+        }, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {
+            'extras': [{'extra': finished_extra.pk, 'result': 'Belgien'}]
+        }, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {
+            'games': [{'game': 4711, 'homegoals': -1, 'awaygoals': 1}]
+        }, format='json')
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_what_if_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post('%swhat-if/' % self.STATISTICS_BASEURL, {}, format='json')
+        self.assertEqual(status.HTTP_401_UNAUTHORIZED, response.status_code)
+
+    @override_settings(SIMULATION_SAMPLES=200)
+    def test_simulation(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        open_game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(days=1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(other_user, open_game, '1:1')
+
+        # nothing is simulated within the request
+        with self.assertNumQueries(0):
+            response = self.client.get('%ssimulation/' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_412_PRECONDITION_FAILED, response.status_code)
+
+        call_command('simulate_tournament', workers=1, seed=1, stdout=StringIO())
+        response = self.client.get('%ssimulation/' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['other', 'user'], [result['username'] for result in response.data])
+        self.assertEqual(0, response.data[1]['first'])
+
+        # the latest results are served until the command has simulated the changed bets
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, open_game, '1:1')
+        with self.assertNumQueries(0):
+            self.assertEqual(response.data, self.client.get('%ssimulation/' % self.STATISTICS_BASEURL).data)
+
+    def test_rank_bounds(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        past = TestModelUtils.create_datetime_from_now(timedelta(hours=-1))
+        finished, closed = TestModelUtils.create_game(kickoff=past), TestModelUtils.create_game(kickoff=past)
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, finished, '2:1')
+            TestModelUtils.create_bet(other_user, finished, '0:0')
+            TestModelUtils.create_bet(other_user, closed, '1:1')
+            finished.set_result_goals(2, 1)
+
+        # the other user can still catch up with the last open game
+        stats = {stat['username']: stat for stat in self.client.get(self.STATISTICS_BASEURL).data}
+        self.assertEqual((3, 1, 2, False, False), tuple(stats['user'][field] for field in
+                                                        ('max_points', 'best_rank', 'worst_rank', 'is_eliminated',
+                                                         'has_clinched')))
+        self.assertEqual((3, 1, 2, False, False), tuple(stats['other'][field] for field in
+                                                         ('max_points', 'best_rank', 'worst_rank', 'is_eliminated',
+                                                          'has_clinched')))
+
+        # WHEN: the other user misses the last game
+        with self.captureOnCommitCallbacks(execute=True):
+            closed.set_result_goals(1, 0)
+
+        # THEN: the user has clinched the first place
+        stats = {stat['username']: stat for stat in self.client.get(self.STATISTICS_BASEURL).data}
+        self.assertTrue(stats['user']['has_clinched'])
+        self.assertTrue(stats['other']['is_eliminated'])
+        other_stats = self.client.get("%s%i/" % (self.STATISTICS_BASEURL, other_user.pk)).data
+        self.assertEqual((2, 2), (other_stats['best_rank'], other_stats['worst_rank']))
+
+    def test_rank_bounds_after_bettable_changes(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        finished = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, finished, '2:1')
+            TestModelUtils.create_bet(other_user, finished, '0:0')
+            finished.set_result_goals(2, 1)
+        response = self.client.get(self.STATISTICS_BASEURL)
+        self.assertEqual((3, True), (response.data[0]['max_points'], response.data[0]['has_clinched']))
+
+        # WHEN: a game is added
+        with self.captureOnCommitCallbacks(execute=True):
+            open_game = TestModelUtils.create_game()
+
+        # THEN: the other user can catch up again
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((6, False), (response.data[0]['max_points'], response.data[0]['has_clinched']))
+
+        # WHEN: it is deleted again
+        with self.captureOnCommitCallbacks(execute=True):
+            open_game.delete()
+
+        # THEN: the first place is clinched again
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((3, True), (response.data[0]['max_points'], response.data[0]['has_clinched']))
+
+    def test_history(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        past = TestModelUtils.create_datetime_from_now(timedelta(hours=-3))
+        first, second = TestModelUtils.create_game(kickoff=past), \
+            TestModelUtils.create_game(kickoff=past + timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, first, '0:0')
+            TestModelUtils.create_bet(other_user, first, '1:0')
+            TestModelUtils.create_bet(self.user, second, '2:0')
+            TestModelUtils.create_bet(other_user, second, '0:1')
+            # entered in the wrong order, the history still follows the kickoffs and the points of the first game
+            # are added to the snapshot of the second one
+            second.set_result_goals(3, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.set_result_goals(1, 0)
+
+        response = self.client.get('%shistory/' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([first.pk, second.pk], response.data['games'])
+        self.assertEqual([{'user': other_user.pk, 'username': 'other', 'ranks': [1, 1], 'points': [3, 3]},
+                          {'user': self.user.pk, 'username': 'user', 'ranks': [2, 2], 'points': [0, 1]}],
+                         response.data['users'])
+
+        response = self.client.get('%shistory/?user=%i' % (self.STATISTICS_BASEURL, other_user.pk))
+        self.assertEqual([{'game': first.pk, 'rank': 1, 'points': 3}, {'game': second.pk, 'rank': 1, 'points': 3}],
+                         response.data)
+
+        response = self.client.get('%shistory/?user=other' % self.STATISTICS_BASEURL)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_as_of(self):
+        other_user = TestModelUtils.create_user(username='other', last_login=TestModelUtils.create_datetime_from_now())
+        past = TestModelUtils.create_datetime_from_now(timedelta(days=-2))
+        first, second = TestModelUtils.create_game(kickoff=past), \
+            TestModelUtils.create_game(kickoff=past + timedelta(days=1))
+        open_game = TestModelUtils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, first, '0:0')
+            TestModelUtils.create_bet(other_user, first, '1:0')
+            TestModelUtils.create_bet(self.user, second, '2:0')
+            TestModelUtils.create_bet(other_user, second, '0:1')
+            first.set_result_goals(1, 0)
+            second.set_result_goals(2, 0)
+        Bettable.objects.filter(pk=first.pk).update(result_entered_at=past + timedelta(hours=2))
+        Bettable.objects.filter(pk=second.pk).update(result_entered_at=past + timedelta(days=1, hours=2))
+
+        def leaderboard(as_of):
+            response = self.client.get(self.STATISTICS_BASEURL, {'as_of': as_of.isoformat()})
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            return [(stats['username'], stats['points'], stats['no_bets'], stats['rank']) for stats in response.data]
+
+        self.assertEqual([('other', 0, 0, 1), ('user', 0, 0, 2)], leaderboard(past - timedelta(hours=1)))
+        self.assertEqual([('other', 0, 1, 1), ('user', 0, 1, 2)], leaderboard(past + timedelta(hours=1)))
+        self.assertEqual([('other', 3, 1, 1), ('user', 0, 1, 2)], leaderboard(past + timedelta(hours=3)))
+        self.assertEqual([('other', 3, 2, 1), ('user', 3, 2, 2)], leaderboard(past + timedelta(days=1, hours=3)))
+
+        # the detail of a user equals its entry of the list
+        response = self.client.get("%s%i/" % (self.STATISTICS_BASEURL, self.user.pk),
+                                   {'as_of': (past + timedelta(hours=3)).isoformat()})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual((0, 1, 2), (response.data['points'], response.data['no_bets'], response.data['rank']))
+
+        # bets placed since do not change past leaderboards, which stay cached
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, open_game, '1:1')
+        with self.assertNumQueries(4):
+            self.assertEqual([('other', 3, 1, 1), ('user', 0, 1, 2)], leaderboard(past + timedelta(hours=3)))
+
+        # corrected results do
+        with self.captureOnCommitCallbacks(execute=True):
+            first.set_result_goals(0, 0)
+        self.assertEqual([('user', 3, 1, 1), ('other', 0, 1, 2)], leaderboard(past + timedelta(hours=3)))
+
+        # the bets endpoint only returns the bets whose result was known by then
+        response = self.client.get(self.BETS_BASEURL, {'as_of': (past + timedelta(hours=3)).isoformat()})
+        self.assertEqual({first.pk}, {bet['bettable'] for bet in response.data})
+
+        response = self.client.get(self.STATISTICS_BASEURL, {'as_of': 'yesterday'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_list_conditional(self):
+        game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, game, '2:1')
+
+        etag = self.client.get(self.STATISTICS_BASEURL)['ETag']
+        with self.assertNumQueries(3):
+            response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            game.set_result_goals(2, 1)
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, response.data[0]['points'])
+
+    def test_list_conditional_on_users(self):
+        TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        other_user = TestModelUtils.create_user(username='other')
+
+        # a first login of the year adds a user to the leaderboard
+        etag = self.client.get(self.STATISTICS_BASEURL)['ETag']
+        update_last_login(None, other_user)
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn('other', [stat['username'] for stat in response.data])
+
+        # later logins do not change it
+        etag = response['ETag']
+        update_last_login(None, other_user)
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+
+        # changed usernames
+        other_user.username = 'renamed'
+        other_user.save()
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn('renamed', [stat['username'] for stat in response.data])
+
+        # changed avatars
+        etag = response['ETag']
+        other_user.profile.save()
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        # a user deactivated while another one logs in for the first time
+        etag = response['ETag']
+        other_user.is_active = False
+        other_user.save()
+        update_last_login(None, TestModelUtils.create_user(username='third'))
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(['third', 'user'], sorted(stat['username'] for stat in response.data))
+
+    def test_list_computed_once_per_version(self):
+        game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, game, '2:1')
+        self.client.get(self.STATISTICS_BASEURL)
+
+        # the tournament start and the validator (for the ETag and for the cached leaderboard) are queried
+        with self.assertNumQueries(5):
+            response = self.client.get(self.STATISTICS_BASEURL)
+        self.assertEqual(0, response.data[0]['points'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            game.set_result_goals(2, 1)
+        self.assertEqual(3, self.client.get(self.STATISTICS_BASEURL).data[0]['points'])
+
+    def test_list_stale_without_etag(self):
+        game = TestModelUtils.create_game(kickoff=TestModelUtils.create_datetime_from_now(timedelta(hours=-1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            TestModelUtils.create_bet(self.user, game, '2:1')
+        etag = self.client.get(self.STATISTICS_BASEURL)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            game.set_result_goals(2, 1)
+
+        # while another worker re-computes the leaderboard, the previous one is served without an ETag
+        cache.add('single_flight:leaderboard:%s:lock' % self.STATISTICS_BASEURL, 'other')
+        response = self.client.get(self.STATISTICS_BASEURL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(0, response.data[0]['points'])
+        self.assertNotIn('ETag', response)
+
+        cache.delete('single_flight:leaderboard:%s:lock' % self.STATISTICS_BASEURL)
+        response = self.client.get(self.STATISTICS_BASEURL)
+        self.assertEqual(3, response.data[0]['points'])
+        self.assertIn('ETag', response)
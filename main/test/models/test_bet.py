@@ -193,6 +193,72 @@ class BetTests(TestCase):
         gb.compute_points_of_game_bettable()
         self.assertEqual('niete', gb.result_bet_type)
 
+    def test_gamebet_goals_stored_on_save(self):
+        bet = utils.create_bet(result_bet='3:1')
+        bet.refresh_from_db()
+        self.assertEqual((3, 1), (bet.homegoals_bet, bet.awaygoals_bet))
+        self.assertEqual((3, 1), tuple(bet.get_gamebet_goals()))
+
+        bet.result_bet = '0:2'
+        bet.save(update_fields=['result_bet'])
+        bet.refresh_from_db()
+        self.assertEqual((0, 2), (bet.homegoals_bet, bet.awaygoals_bet))
+
+        bet.result_bet = ''
+        bet.save()
+        bet.refresh_from_db()
+        self.assertEqual((None, None), (bet.homegoals_bet, bet.awaygoals_bet))
+        self.assertEqual((-1, -1), tuple(bet.get_gamebet_goals()))
+
+        extra_bet = utils.create_bet(bettable=utils.create_extra(), result_bet='Schweiz')
+        extra_bet.refresh_from_db()
+        self.assertEqual((None, None), (extra_bet.homegoals_bet, extra_bet.awaygoals_bet))
+
+    def test_compute_points_of_bettable_equals_single_bet_computation(self):
+        g = utils.create_game()
+        bets = [utils.create_bet(bettable=g, result_bet="%s:%s" % (randrange(5), randrange(5))) for i in range(20)]
+        utils.create_bet(bettable=g)
+        Game.objects.filter(pk=g.pk).update(homegoals=2, awaygoals=1)
+        Bettable.objects.filter(pk=g.pk).update(result='2:1')
+
+        bulk_computed = {bet.pk: (bet.points, bet.result_bet_type) for bet in Bet.compute_points_of_bettable(g)}
+
+        for bet in bets:
+            bet.refresh_from_db()
+            self.assertEqual(bulk_computed[bet.pk], (bet.points, bet.result_bet_type))
+            bet.bettable.refresh_from_db()
+            bet.compute_points(commit=False)
+            self.assertEqual(bulk_computed[bet.pk], (bet.points, bet.result_bet_type))
+
+    def test_compute_points_of_bettable_extra(self):
+        e = utils.create_extra(points=7)
+        right_bet, wrong_bet, no_bet = utils.create_bet(bettable=e, result_bet='Schweiz'), \
+            utils.create_bet(bettable=e, result_bet='Belgien'), utils.create_bet(bettable=e)
+        Bettable.objects.filter(pk=e.pk).update(result='Schweiz')
+
+        Bet.compute_points_of_bettable(e)
+
+        right_bet.refresh_from_db(), wrong_bet.refresh_from_db(), no_bet.refresh_from_db()
+        self.assertEqual((7, 'volltreffer'), (right_bet.points, right_bet.result_bet_type))
+        self.assertEqual((0, 'niete'), (wrong_bet.points, wrong_bet.result_bet_type))
+        self.assertEqual((None, None), (no_bet.points, no_bet.result_bet_type))
+
+    def test_compute_points_of_bettable_query_count(self):
+        g1, g2 = utils.create_game(homegoals=1, awaygoals=0), utils.create_game(homegoals=1, awaygoals=0)
+        [utils.create_bet(bettable=g1, result_bet="1:0") for i in range(2)]
+        [utils.create_bet(bettable=g2, result_bet="1:0") for i in range(30)]
+
+        # the number of queries must not depend on the number of bets (all bets share the same statistic delta),
+        # the deltas are applied to the overall, round and matchday statistics
+        with self.assertNumQueries(9):
+            Bet.compute_points_of_bettable(g1)
+        with self.assertNumQueries(9):
+            Bet.compute_points_of_bettable(g2)
+
+        # unchanged bets are not written again
+        with self.assertNumQueries(3):
+            Bet.compute_points_of_bettable(g2)
+
     def assertItemsEqual(self, list1, list2):
         self.assertEqual(len(list1), len(list2))
         for list1_item in list1:
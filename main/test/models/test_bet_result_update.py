@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 import time
 from random import randrange
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.test import TestCase
 
-from main.models import Statistic
+from main.models import Bet, Statistic
 from main.test.utils import TestModelUtils as utils
 
 
@@ -29,14 +31,16 @@ class BetResultUpdateTests(TestCase):
         g1, g2, g3 = utils.create_game(), utils.create_game(), utils.create_game()
 
         # AND: some bets for these games
-        utils.create_bet(some_user, g1, "4:2")
-        utils.create_bet(some_user, g2, "3:0")
-        utils.create_bet(some_user, g3, "2:2")
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(some_user, g1, "4:2")
+            utils.create_bet(some_user, g2, "3:0")
+            utils.create_bet(some_user, g3, "2:2")
 
         # WHEN games get a result and are saved
-        g1.set_result_goals(3, 1)
-        g2.set_result_goals(1, 1)
-        g3.set_result_goals(1, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            g1.set_result_goals(3, 1)
+            g2.set_result_goals(1, 1)
+            g3.set_result_goals(1, 1)
 
         # THEN: the user stats are as expected
         user_stats = Statistic.objects.get(user=some_user)
@@ -66,29 +70,31 @@ class BetResultUpdateTests(TestCase):
         utils.create_extrachoice(name='Belgien', extra=e2)
 
         # AND: some bets
-        utils.create_bet(u1, g1, "3:1")
-        utils.create_bet(u1, g2, "1:1")
-        utils.create_bet(u1, g3, "3:0")
-        utils.create_bet(u1, g4, "2:2")
-        utils.create_bet(u1, g5, "0:2")
-        utils.create_bet(u1, e1, 'Deutschland')
-        utils.create_bet(u1, e2, 'Niederlande')
-
-        utils.create_bet(u2, g1, "4:2")
-        utils.create_bet(u2, g4, "2:1")
-        utils.create_bet(u2, g5, "0:0")
-        utils.create_bet(u2, e1, 'Schweiz')
-        utils.create_bet(u2, e2, 'Belgien')
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(u1, g1, "3:1")
+            utils.create_bet(u1, g2, "1:1")
+            utils.create_bet(u1, g3, "3:0")
+            utils.create_bet(u1, g4, "2:2")
+            utils.create_bet(u1, g5, "0:2")
+            utils.create_bet(u1, e1, 'Deutschland')
+            utils.create_bet(u1, e2, 'Niederlande')
+
+            utils.create_bet(u2, g1, "4:2")
+            utils.create_bet(u2, g4, "2:1")
+            utils.create_bet(u2, g5, "0:0")
+            utils.create_bet(u2, e1, 'Schweiz')
+            utils.create_bet(u2, e2, 'Belgien')
 
         # WHEN: bettable result's are updated
-        g1.set_result_goals(3, 1)
-        g2.remove_result()
-        g3.set_result_goals(2, 1)
-        g4.set_result_goals(2, 4)
-        g5.set_result_goals(1, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            g1.set_result_goals(3, 1)
+            g2.remove_result()
+            g3.set_result_goals(2, 1)
+            g4.set_result_goals(2, 4)
+            g5.set_result_goals(1, 1)
 
-        e1.remove_result()
-        e2.set_result('Niederlande')
+            e1.remove_result()
+            e2.set_result('Niederlande')
 
         # THEN: the stats of user 1 should be as expected
         u1_stats = Statistic.objects.get(user=u1)
@@ -112,6 +118,65 @@ class BetResultUpdateTests(TestCase):
 
         self.assertEqual(1*settings.BET_POINTS["differenz"] + 1*settings.BET_POINTS["remis_tendenz"] + 2*settings.BET_POINTS["niete"], u2_stats.points)
 
+    def test_updates_within_transaction_are_coalesced(self):
+        # GIVEN: some user with bets on two games
+        some_user = utils.create_user('Queen')
+        g1, g2 = utils.create_game(), utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            b1, b2 = utils.create_bet(some_user, g1, "1:0"), utils.create_bet(some_user, g2, "2:2")
+
+        # WHEN: the results are entered and corrected within one transaction
+        with mock.patch.object(Bet, 'compute_points_of_bettable', wraps=Bet.compute_points_of_bettable) as rescore:
+            with self.captureOnCommitCallbacks(execute=True):
+                g1.set_result_goals(0, 0)
+                g1.set_result_goals(1, 0)
+                g2.set_result_goals(2, 2)
+
+                # THEN: nothing is scored before the transaction is committed
+                self.assertIsNone(Bet.objects.get(pk=b1.pk).points)
+                rescore.assert_not_called()
+
+        # AND: each bettable has been scored exactly once on commit
+        self.assertEqual(2, rescore.call_count)
+        self.assertEqual(settings.BET_POINTS["volltreffer"], Bet.objects.get(pk=b1.pk).points)
+        self.assertEqual(settings.BET_POINTS["volltreffer"], Bet.objects.get(pk=b2.pk).points)
+
+        user_stats = Statistic.objects.get(user=some_user)
+        self.assertEqual(2, user_stats.no_bets)
+        self.assertEqual(2, user_stats.no_volltreffer)
+        self.assertEqual(2*settings.BET_POINTS["volltreffer"], user_stats.points)
+
+    def test_flush_registered_once_per_transaction(self):
+        some_user = utils.create_user('Queen')
+        g1, g2 = utils.create_game(), utils.create_game()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            utils.create_bet(some_user, g1, "1:0")
+            utils.create_bet(some_user, g2, "2:2")
+            g1.set_result_goals(1, 0)
+        self.assertEqual(1, len(callbacks))
+
+    def test_rolled_back_updates_are_discarded(self):
+        some_user = utils.create_user('Queen')
+        g1, g2 = utils.create_game(), utils.create_game()
+
+        # WHEN: a transaction with a result is rolled back
+        try:
+            with transaction.atomic():
+                utils.create_bet(some_user, g1, "1:0")
+                g1.set_result_goals(1, 0)
+                raise ValueError
+        except ValueError:
+            pass
+
+        # THEN: its bettable is not scored along with the next transaction
+        with mock.patch.object(Bet, 'compute_points_of_bettable', wraps=Bet.compute_points_of_bettable) as rescore:
+            with self.captureOnCommitCallbacks(execute=True):
+                utils.create_bet(some_user, g2, "2:2")
+                g2.set_result_goals(2, 2)
+        self.assertEqual([g2.pk], [call.args[0].pk for call in rescore.call_args_list])
+        self.assertEqual(1, Statistic.objects.get(user=some_user).no_bets)
+
     def test_many_users(self):
         """
             "performance test" which should give an indication about how fast the recalculation of bet points
@@ -140,18 +205,20 @@ class BetResultUpdateTests(TestCase):
 
         # create bets for the given amount of the games for all users and save them
         bets = []
-        for u in users:
-            for g in games[0:int(BET_AMOUNT*len(games))]:
-                bet = utils.create_bet(u, g, "%s:%s" % (randrange(6), randrange(6)))
-                bet.save()
-                bets.append(bet)
+        with self.captureOnCommitCallbacks(execute=True):
+            for u in users:
+                for g in games[0:int(BET_AMOUNT*len(games))]:
+                    bet = utils.create_bet(u, g, "%s:%s" % (randrange(6), randrange(6)))
+                    bet.save()
+                    bets.append(bet)
 
         # create results for all games and save them
         game_save_times = []
         for g in games:
             g.homegoals, g.awaygoals = randrange(6), randrange(6)
             game_save_start = time.process_time()
-            g.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                g.save()
             game_save_end = time.process_time()
             game_save_times.append(game_save_end - game_save_start)
 
@@ -172,5 +239,5 @@ class BetResultUpdateTests(TestCase):
         for u in ranked_users:
             print(u.statistic.pretty_print())
 
-        self.assertEqual(int(BET_AMOUNT*len(games)), users[0].statistic.no_bets)
+        self.assertEqual(int(BET_AMOUNT*len(games)), Statistic.objects.get(user=users[0]).no_bets)
         # TODO P3 what else could be asserted?
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import random
+
+import numpy as np
+from django.conf import settings
+from django.test import TestCase
+
+from main.bets_matrix import BetsMatrix, NOT_SCORED, rescore_game_bets, score_game_bets
+from main.models import Bet, Bettable, Game, Statistic
+from main.scoring import RESULT_BET_TYPES, ScoringTable, get_scoring_table
+from main.test.utils import TestModelUtils as utils
+
+
+class BetsMatrixTests(TestCase):
+
+    def test_score_game_bets_equals_scoring_table(self):
+        rnd = random.Random(4711)
+        samples = [tuple(rnd.choice([rnd.randrange(6), rnd.randrange(40)]) for i in range(4)) for j in range(1000)]
+        samples += [(1, 1, -1, -1), (0, 0, 0, 0), (30, 30, 2, 2), (0, 25, 0, 1)]
+        bet_hg, bet_ag, result_hg, result_ag = (np.array(column, dtype=np.int16) for column in zip(*samples))
+
+        # also with a small table, so that many goal differences are beyond it
+        for scoring_table in (get_scoring_table(), ScoringTable(settings.BET_POINTS, max_goal_diff=2)):
+            codes, points = score_game_bets(scoring_table, bet_hg, bet_ag, result_hg, result_ag)
+
+            for i, (bhg, bag, rhg, rag) in enumerate(samples):
+                if rhg < 0:
+                    self.assertEqual((NOT_SCORED, NOT_SCORED), (codes[i], points[i]), samples[i])
+                else:
+                    self.assertEqual(scoring_table.score_game_bet(bhg, bag, rhg, rag),
+                                     (RESULT_BET_TYPES[codes[i]], points[i]), samples[i])
+
+    def test_load(self):
+        g1, g2 = utils.create_game(homegoals=2, awaygoals=1), utils.create_game()
+        u1, u2 = utils.create_user(), utils.create_user()
+        utils.create_bet(u1, g1, '2:1'), utils.create_bet(u2, g1, '0:0'), utils.create_bet(u1, g2, '1:3')
+        utils.create_bet(u2, g2), utils.create_bet(u2, utils.create_extra(), 'Schweiz')
+
+        with self.assertNumQueries(1):
+            matrix = BetsMatrix.load()
+        self.assertEqual(3, len(matrix))
+
+        codes, points = matrix.score(*matrix.game_results())
+        scored = {(int(matrix.user_ids[u]), int(matrix.game_ids[g])): int(p)
+                  for u, g, p in zip(matrix.user_indices, matrix.game_indices, points)}
+        self.assertEqual({(u1.pk, g1.pk): 3, (u2.pk, g1.pk): 0, (u1.pk, g2.pk): NOT_SCORED}, scored)
+        self.assertEqual({u1.pk: 3, u2.pk: 0}, dict(zip(matrix.user_ids.tolist(),
+                                                        matrix.points_per_user(points).tolist())))
+
+    def test_rescore_game_bets(self):
+        g = utils.create_game()
+        users = [utils.create_user() for i in range(10)]
+        with self.captureOnCommitCallbacks(execute=True):
+            bets = [utils.create_bet(user, g, '%i:%i' % (random.randrange(4), random.randrange(4))) for user in users]
+        Game.objects.filter(pk=g.pk).update(homegoals=2, awaygoals=1)
+        Bettable.objects.filter(pk=g.pk).update(result='2:1')
+
+        self.assertEqual(10, rescore_game_bets())
+        self.assertEqual(0, rescore_game_bets())
+
+        for bet in bets:
+            stored = Bet.objects.get(pk=bet.pk)
+            bet.refresh_from_db()
+            bet.compute_points(commit=False)
+            self.assertEqual((bet.result_bet_type, bet.points), (stored.result_bet_type, stored.points))
+            self.assertEqual(stored.points, Statistic.objects.get(user=bet.user).points)
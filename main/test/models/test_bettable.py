@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
+import json
 from datetime import timedelta
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from main.models import Game, Bet, Bettable
+from main.models import Game, Bet, Bettable, BetsSnapshot
 from main.test.utils import TestModelUtils as utils, TestModelUtils
 
 
@@ -28,6 +31,59 @@ class BettableTests(TestCase):
         self.assertEquals([g2, g3], BettableTests.children(Bettable.get_open_bettables_for_user(u1.pk)))
         self.assertEquals([g3], BettableTests.children(Bettable.get_open_bettables_for_user(u2.pk)))
 
+    def test_result_entered_at(self):
+        game, extra = utils.create_game(), utils.create_extra()
+        self.assertIsNone(game.result_entered_at)
+
+        game.set_result_goals(2, 1)
+        entered_at = Bettable.objects.get(pk=game.pk).result_entered_at
+        self.assertIsNotNone(entered_at)
+
+        # unchanged results keep their time of entry, also for freshly loaded instances
+        game = Game.objects.get(pk=game.pk)
+        game.name = 'Renamed'
+        game.save()
+        self.assertEqual(entered_at, Bettable.objects.get(pk=game.pk).result_entered_at)
+
+        # a corrected result keeps the time of the first entry
+        with override_settings(FAKE_DATE=entered_at + timedelta(hours=1)):
+            game.set_result_goals(2, 2)
+        self.assertEqual(entered_at, Bettable.objects.get(pk=game.pk).result_entered_at)
+        game.remove_result()
+        self.assertIsNone(Bettable.objects.get(pk=game.pk).result_entered_at)
+        with override_settings(FAKE_DATE=entered_at + timedelta(hours=2)):
+            game.set_result_goals(1, 1)
+        self.assertEqual(entered_at + timedelta(hours=2), Bettable.objects.get(pk=game.pk).result_entered_at)
+
+        extra.set_result('Belgien')
+        self.assertIsNotNone(Bettable.objects.get(pk=extra.pk).result_entered_at)
+
+    def test_kind(self):
+        game, extra = utils.create_game(), utils.create_extra()
+        self.assertEqual((Bettable.GAME, Bettable.EXTRA), (game.kind, extra.kind))
+
+        bettables = list(Bettable.objects.filter(pk__in=(game.pk, extra.pk)).order_by('pk'))
+        with self.assertNumQueries(0):
+            self.assertEqual([Bettable.GAME, Bettable.EXTRA], [bettable.kind for bettable in bettables])
+        # only the child of the kind is queried
+        with self.assertNumQueries(2):
+            self.assertEqual([game, extra], BettableTests.children(bettables))
+        self.assertEqual([game, extra], BettableTests.children([game, extra]))
+
+    def test_build_missing_snapshots(self):
+        past = utils.create_datetime_from_now(timedelta(hours=-1))
+        game, extra = utils.create_game(kickoff=past), utils.create_extra(deadline=past)
+        utils.create_game()
+
+        # one query for the closed bettables, without joining their children, and one per snapshot for its bets
+        with CaptureQueriesContext(connection) as queries:
+            snapshots = BetsSnapshot.build_missing()
+        self.assertEqual({game.pk, extra.pk}, {snapshot.bettable_id for snapshot in snapshots})
+        self.assertNotIn('main_game', queries.captured_queries[0]['sql'])
+        self.assertEqual(['game', 'extra'], [json.loads(BetsSnapshot.objects.get(pk=pk).get_data())['bettable_type']
+                                             for pk in (game.pk, extra.pk)])
+        self.assertEqual([], BetsSnapshot.build_missing())
+
     @staticmethod
     def children(bettables_list):
         return [bettable.get_related_child() for bettable in bettables_list]
\ No newline at end of file
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from rest_framework.response import Response
+
+from main import caching
+from main.caching import single_flight
+
+
+class CountingView:
+    version = 1
+
+    def __init__(self):
+        self.computations = 0
+
+    @single_flight('test', lambda view, request: view.version)
+    def get_response(self, request):
+        self.computations += 1
+        return Response({'computation': self.computations})
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.view = CountingView()
+        self.request = RequestFactory().get('/rtg/test/?ordering=points')
+        self.lock_key = 'single_flight:test:/rtg/test/?ordering=points:lock'
+
+    def test_cached_per_version(self):
+        self.assertEqual({'computation': 1}, self.view.get_response(self.request).data)
+        self.assertEqual({'computation': 1}, self.view.get_response(self.request).data)
+        self.assertIsNone(cache.get(self.lock_key))
+
+        self.view.version = 2
+        self.assertEqual({'computation': 2}, self.view.get_response(self.request).data)
+        self.assertEqual(2, self.view.computations)
+
+    def test_stale_while_revalidating(self):
+        self.view.get_response(self.request)
+        self.view.version = 2
+
+        # another worker holds the lock, so the previous version is served without computing
+        cache.add(self.lock_key, '2')
+        response = self.view.get_response(self.request)
+        self.assertEqual({'computation': 1}, response.data)
+        self.assertTrue(response.stale)
+        self.assertEqual(1, self.view.computations)
+
+    @mock.patch.object(caching, 'SINGLE_FLIGHT_WAIT', 0.1)
+    def test_expired_wait_computes(self):
+        # a crashed worker left its lock and there is no previous version
+        cache.add(self.lock_key, '1')
+        self.assertEqual({'computation': 1}, self.view.get_response(self.request).data)
+
+    def test_lock_released_on_error(self):
+        view = CountingView()
+        with mock.patch.object(Response, '__init__', side_effect=ValueError):
+            self.assertRaises(ValueError, view.get_response, self.request)
+        self.assertIsNone(cache.get(self.lock_key))
+        self.assertEqual({'computation': 2}, view.get_response(self.request).data)
@@ -28,11 +28,13 @@ class ExtraResultBetUpdateTests(TestCase):
         some_extra = TestModelUtils.create_extra()
 
         # AND: some bet on this extra
-        some_bet = TestModelUtils.create_bet(bettable=some_extra, result_bet="my result")
+        with self.captureOnCommitCallbacks(execute=True):
+            some_bet = TestModelUtils.create_bet(bettable=some_extra, result_bet="my result")
 
         # WHEN: the extra gets a result
         some_extra.result = 'my result'
-        some_extra.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_extra.save()
 
         # THEN: the bet should have the correct points
         updated_bet = Bet.objects.get(pk=some_bet.pk)
@@ -58,13 +60,15 @@ class ExtraResultBetUpdateTests(TestCase):
         some_extra = TestModelUtils.create_extra(result="result")
 
         # AND: some bet with points
-        some_bet = TestModelUtils.create_bet(bettable=some_extra, result_bet="result")
-        some_bet.points = 4711
-        some_bet.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_bet = TestModelUtils.create_bet(bettable=some_extra, result_bet="result")
+            some_bet.points = 4711
+            some_bet.save()
 
         # WHEN: the extra's result is reset
         some_extra.result = None
-        some_extra.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_extra.save()
 
         # THEN: the bet should reset it's points to None (not 0)
         updated_bet = Bet.objects.get(pk=some_bet.pk)
@@ -7,7 +7,7 @@ from django.db.utils import IntegrityError
 from django.test import TestCase
 from django.utils import timezone
 
-from main.models import Game, Team, Bettable
+from main.models import Game, Team, Bettable, Bet
 from main.test.utils import TestModelUtils as utils
 
 
@@ -132,6 +132,56 @@ class GameTests(TestCase):
         self.assertFalse(utils.create_game(awaygoals=0).has_result())
         self.assertTrue(utils.create_game(homegoals=4, awaygoals=1).has_result())
 
+    def test_set_result_goals_single_write(self):
+        g = utils.create_game()
+
+        # one update per table of the game (bettable and game), no bets to score
+        with self.assertNumQueries(2):
+            g.set_result_goals(3, 1)
+
+        stored_game = Game.objects.get(pk=g.pk)
+        self.assertEqual((3, 1), (stored_game.homegoals, stored_game.awaygoals))
+        self.assertEqual('3:1', stored_game.result)
+        self.assertEqual(str(g), stored_game.name)
+
+    def test_set_result_goals_scores_once(self):
+        g = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            bets = [utils.create_bet(bettable=g, result_bet="%i:1" % i) for i in range(10)]
+
+        # result write (2), flush in a transaction (2): bettables, bets, game lookup, bulk update of bets, one
+        # statistic delta per distinct result bet type (volltreffer, differenz, tendenz, niete), the same for the round
+        # and the matchday statistics plus the creation of their rows (2 * 4), rank snapshot (4), maximum points (3)
+        with self.assertNumQueries(26):
+            with self.captureOnCommitCallbacks(execute=True):
+                g.set_result_goals(3, 1)
+
+        self.assertEqual('volltreffer', Bet.objects.get(pk=bets[3].pk).result_bet_type)
+
+    def test_remove_result_single_write(self):
+        g = utils.create_game(homegoals=1, awaygoals=1)
+
+        with self.assertNumQueries(2):
+            g.remove_result()
+
+        stored_game = Game.objects.get(pk=g.pk)
+        self.assertFalse(stored_game.has_result())
+        self.assertIsNone(stored_game.result)
+
+    def test_set_live_goals(self):
+        g = utils.create_game()
+        self.assertFalse(g.has_live_score())
+
+        # a single update without any scoring of bets
+        with self.captureOnCommitCallbacks() as callbacks, self.assertNumQueries(1):
+            g.set_live_goals(1, 0)
+        self.assertEqual([], callbacks)
+
+        stored_game = Game.objects.get(pk=g.pk)
+        self.assertTrue(stored_game.has_live_score())
+        self.assertEqual((1, 0), (stored_game.live_homegoals, stored_game.live_awaygoals))
+        self.assertFalse(stored_game.has_result())
+
     def test_get_latest_finished_game(self):
         now = timezone.now()
         g1 = utils.create_game(kickoff=now + timedelta(days=-3), homegoals=3, awaygoals=1)
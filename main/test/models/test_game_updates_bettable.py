@@ -41,12 +41,14 @@ class GameResultBetUpdateTests(TestCase):
         some_game = TestModelUtils.create_game()
 
         # AND: some bet
-        some_bet = TestModelUtils.create_bet(bettable=some_game, result_bet="2:0")
+        with self.captureOnCommitCallbacks(execute=True):
+            some_bet = TestModelUtils.create_bet(bettable=some_game, result_bet="2:0")
 
         # WHEN: the game gets a result
         some_game.homegoals = 3
         some_game.awaygoals = 1
-        some_game.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_game.save()
 
         # THEN: the bet should have the correct points
         updated_bet = Bet.objects.get(pk=some_bet.pk)
@@ -74,14 +76,16 @@ class GameResultBetUpdateTests(TestCase):
         some_game = TestModelUtils.create_game(homegoals=3, awaygoals=2)
 
         # AND: some bet with points
-        some_bet = TestModelUtils.create_bet(bettable=some_game, result_bet="2:0")
-        some_bet.points = 4711
-        some_bet.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_bet = TestModelUtils.create_bet(bettable=some_game, result_bet="2:0")
+            some_bet.points = 4711
+            some_bet.save()
 
         # WHEN: the game's result is reset
         some_game.homegoals = -1
         some_game.awaygoals = -1
-        some_game.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            some_game.save()
 
         # THEN: the bet should reset it's points to None (not 0)
         updated_bet = Bet.objects.get(pk=some_bet.pk)
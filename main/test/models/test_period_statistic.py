@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main.bets_matrix import rescore_game_bets
+from main.models import MatchdayStatistic, RoundStatistic
+from main.test.utils import TestModelUtils as utils
+
+
+class PeriodStatisticTests(TestCase):
+
+    def setUp(self):
+        self.u1, self.u2 = utils.create_user(), utils.create_user()
+        self.group_round, self.knockout_round = utils.create_round(), utils.create_round(is_knock_out=True)
+        day = timezone.make_aware(datetime(2024, 6, 14, 21))
+        self.g1 = utils.create_game(kickoff=day, round=self.group_round)
+        self.g2 = utils.create_game(kickoff=day + timedelta(hours=2, minutes=30), round=self.group_round)
+        self.g3 = utils.create_game(kickoff=day + timedelta(days=1), round=self.knockout_round)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for game, u1_bet, u2_bet in ((self.g1, '2:1', '0:0'), (self.g2, '1:1', '2:2'), (self.g3, '0:3', '1:2')):
+                utils.create_bet(self.u1, game, u1_bet)
+                utils.create_bet(self.u2, game, u2_bet)
+
+    def test_maintained_on_result_entry(self):
+        # WHEN: results are entered
+        with self.captureOnCommitCallbacks(execute=True):
+            self.g1.set_result_goals(2, 1)
+            self.g2.set_result_goals(0, 0)
+            self.g3.set_result_goals(0, 1)
+
+        # THEN: the points are split by round and by the local kickoff date (23:30 is still the same day)
+        self.assertEqual((3 + 1, 1), self.period_stats(RoundStatistic, self.u1, round=self.group_round))
+        self.assertEqual((0 + 1, 0), self.period_stats(RoundStatistic, self.u2, round=self.group_round))
+        self.assertEqual((1, 0), self.period_stats(RoundStatistic, self.u1, round=self.knockout_round))
+        self.assertEqual((2, 0), self.period_stats(RoundStatistic, self.u2, round=self.knockout_round))
+        self.assertEqual((4, 1), self.period_stats(MatchdayStatistic, self.u1, matchday='2024-06-14'))
+        self.assertEqual((2, 0), self.period_stats(MatchdayStatistic, self.u2, matchday='2024-06-15'))
+        self.assert_consistent()
+
+        # WHEN: a result is corrected and another one removed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.g1.set_result_goals(0, 0)
+            self.g3.remove_result()
+
+        # THEN: the deltas have been applied
+        self.assertEqual((0 + 1, 0), self.period_stats(RoundStatistic, self.u1, round=self.group_round))
+        self.assertEqual((3 + 1, 1), self.period_stats(RoundStatistic, self.u2, round=self.group_round))
+        self.assertEqual((0, 0), self.period_stats(RoundStatistic, self.u2, round=self.knockout_round))
+        self.assert_consistent()
+
+    def test_recalculated_for_directly_saved_bets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.g1.set_result_goals(2, 1)
+
+        bet = self.u2.bet_set.get(bettable=self.g1)
+        bet.result_bet_type, bet.points = 'volltreffer', 3
+        with self.captureOnCommitCallbacks(execute=True):
+            bet.save()
+
+        self.assertEqual((3, 1), self.period_stats(RoundStatistic, self.u2, round=self.group_round))
+        self.assert_consistent()
+
+    def test_maintained_on_rescoring(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.g1.set_result_goals(2, 1)
+            self.g3.set_result_goals(0, 1)
+
+        # WHEN: the bets are rescored with changed rules
+        with override_settings(BET_POINTS={'volltreffer': 5, 'differenz': 3, 'remis_tendenz': 2, 'tendenz': 1,
+                                           'niete': 0}):
+            rescore_game_bets()
+
+        # THEN: the period statistics have been re-created from the rescored bets
+        self.assertEqual((5, 1), self.period_stats(RoundStatistic, self.u1, round=self.group_round))
+        self.assert_consistent()
+
+    def test_untouched_by_placed_bets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.g1.set_result_goals(2, 1)
+
+        # WHEN: a bet on an unfinished game is changed
+        bet = self.u1.bet_set.get(bettable=self.g2)
+        bet.result_bet = '3:0'
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            bet.save()
+
+        # THEN: the period statistics are neither deleted nor re-created
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'roundstatistic' in query['sql'] or 'matchdaystatistic' in query['sql']])
+        self.assert_consistent()
+
+    def period_stats(self, model, user, **period):
+        stats = model.objects.get(user=user, **period)
+        return stats.points, stats.no_volltreffer
+
+    def assert_consistent(self):
+        for model in (RoundStatistic, MatchdayStatistic):
+            maintained = {(stats.user_id, str(stats.round_id if model is RoundStatistic else stats.matchday)):
+                          (stats.points, stats.no_volltreffer, stats.no_differenz, stats.no_remis_tendenz,
+                           stats.no_tendenz, stats.no_niete)
+                          for stats in model.objects.all() if stats.points or stats.no_niete}
+            model.recalculate()
+            recalculated = {(stats.user_id, str(stats.round_id if model is RoundStatistic else stats.matchday)):
+                            (stats.points, stats.no_volltreffer, stats.no_differenz, stats.no_remis_tendenz,
+                             stats.no_tendenz, stats.no_niete)
+                            for stats in model.objects.all()}
+            self.assertEqual(recalculated, maintained)
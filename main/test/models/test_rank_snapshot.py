@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import RankSnapshot
+from main.test.utils import TestModelUtils as utils
+
+
+class RankSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob = [utils.create_user(username=name, last_login=timezone.now()) for name in ('alice', 'bob')]
+        self.game = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(self.alice, self.game, '1:0')
+            utils.create_bet(self.bob, self.game, '2:2')
+
+    def test_taken_after_result_entry(self):
+        self.assertFalse(RankSnapshot.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.set_result_goals(1, 1)
+        snapshot = RankSnapshot.objects.get(game=self.game)
+        self.assertEqual([self.bob.pk, self.alice.pk], snapshot.get_user_ids())
+        self.assertEqual({self.bob.pk: (1, 1), self.alice.pk: (2, 0)}, snapshot.get_ranks())
+
+        # a corrected result replaces the snapshot, a removed one drops it
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.set_result_goals(1, 0)
+        self.assertEqual([self.alice.pk, self.bob.pk], RankSnapshot.objects.get(game=self.game).get_user_ids())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.remove_result()
+        self.assertFalse(RankSnapshot.objects.exists())
+
+    def test_corrected_after_later_games(self):
+        later_game = utils.create_game(kickoff=self.game.kickoff + timedelta(hours=3))
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(self.alice, later_game, '0:0')
+            utils.create_bet(self.bob, later_game, '3:0')
+            self.game.set_result_goals(1, 1)
+            later_game.set_result_goals(0, 0)
+        snapshot = RankSnapshot.objects.get(game=self.game)
+        self.assertEqual({self.bob.pk: (1, 1), self.alice.pk: (2, 0)}, snapshot.get_ranks())
+
+        # WHEN: the result of the earlier game is corrected after the later one has finished
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.set_result_goals(2, 2)
+
+        # THEN: its snapshot contains only the points up to that game, the later one the corrected points
+        self.assertEqual({self.bob.pk: (1, 3), self.alice.pk: (2, 0)},
+                         RankSnapshot.objects.get(game=self.game).get_ranks())
+        self.assertEqual({self.alice.pk: (1, 3), self.bob.pk: (2, 3)},
+                         RankSnapshot.objects.get(game=later_game).get_ranks())
+
+        # WHEN: its result is removed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.remove_result()
+
+        # THEN: its snapshot is dropped and the later one no longer contains its points
+        self.assertFalse(RankSnapshot.objects.filter(game=self.game).exists())
+        self.assertEqual({self.alice.pk: (1, 3), self.bob.pk: (2, 0)},
+                         RankSnapshot.objects.get(game=later_game).get_ranks())
+
+    def test_pack(self):
+        values = list(range(-5, 1000))
+        self.assertEqual(values, RankSnapshot.unpack(RankSnapshot.pack(values)))
+        self.assertEqual([], RankSnapshot.unpack(RankSnapshot.pack([])))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.models import Bet, BetsSnapshot, Statistic
+from main import scheduler
+from main.scheduler import DeadlineScheduler, MAX_SLEEP, RESULT_POLLING_INTERVAL, SIMULATION_INTERVAL, \
+    bettable_closed, game_kicked_off
+from main.simulation import stored_simulation
+from main.test.utils import TestModelUtils as utils
+
+
+class DeadlineSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.user = utils.create_user(last_login=self.now)
+        self.game = utils.create_game(kickoff=self.now + timedelta(hours=1))
+        self.extra = utils.create_extra(deadline=self.now + timedelta(minutes=30))
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(self.user, self.game, '2:1')
+
+        self.scheduler = DeadlineScheduler(now=self.now)
+        self.scheduler.load()
+        self.events = []
+        bettable_closed.connect(self.record, dispatch_uid='test_bettable_closed')
+        game_kicked_off.connect(self.record, dispatch_uid='test_game_kicked_off')
+
+    def tearDown(self):
+        bettable_closed.disconnect(dispatch_uid='test_bettable_closed')
+        game_kicked_off.disconnect(dispatch_uid='test_game_kicked_off')
+
+    def record(self, signal, **kwargs):
+        self.events.append((signal, kwargs.get('bettable_id', kwargs.get('game_id'))))
+
+    def test_events_in_chronological_order(self):
+        self.assertEqual(MAX_SLEEP, self.scheduler.seconds_until_next_event(self.now))
+        self.assertEqual(60, self.scheduler.seconds_until_next_event(self.now + timedelta(minutes=29)))
+
+        with mock.patch.object(DeadlineScheduler, 'poll_results', return_value=False):
+            self.scheduler.run_pending(self.now + timedelta(minutes=29))
+            self.assertEqual([], self.events)
+            self.scheduler.run_pending(self.now + timedelta(hours=2))
+
+        # the game's deadline equals its kickoff, bets are closed first
+        self.assertEqual([(bettable_closed, self.extra.pk), (bettable_closed, self.game.pk),
+                          (game_kicked_off, self.game.pk)], self.events)
+
+        # events are sent only once, also after re-loading the index
+        self.scheduler.load()
+        self.scheduler.run_pending(self.now + timedelta(hours=2, minutes=1))
+        self.assertEqual(3, len(self.events))
+
+    def test_closing_bettables(self):
+        cache.set(Bet.CLOSED_BETS_CACHE_KEY, {})
+        with override_settings(FAKE_DATE=self.now + timedelta(minutes=45)):
+            self.scheduler.run_pending()
+
+        # the bets of the extra are frozen, the cached matrix is outdated and the open points of the extra are gone
+        self.assertTrue(BetsSnapshot.objects.filter(bettable=self.extra).exists())
+        self.assertFalse(BetsSnapshot.objects.filter(bettable=self.game).exists())
+        self.assertIsNone(cache.get(Bet.CLOSED_BETS_CACHE_KEY))
+        self.assertEqual(3, Statistic.objects.get(user=self.user).max_points)
+
+    def test_result_polling(self):
+        with mock.patch.object(DeadlineScheduler, 'poll_results', return_value=False) as poll_results:
+            kickoff = self.now + timedelta(hours=1)
+            self.scheduler.run_pending(kickoff)
+            self.assertEqual(1, poll_results.call_count)
+            self.assertEqual(1, self.scheduler.seconds_until_next_event(
+                kickoff + timedelta(seconds=RESULT_POLLING_INTERVAL - 1)))
+
+            self.scheduler.run_pending(kickoff + timedelta(minutes=1))
+            self.assertEqual(1, poll_results.call_count)
+            self.scheduler.run_pending(kickoff + timedelta(seconds=RESULT_POLLING_INTERVAL))
+            self.assertEqual(2, poll_results.call_count)
+
+            # stops once all results are in
+            poll_results.return_value = True
+            self.scheduler.run_pending(kickoff + timedelta(seconds=2 * RESULT_POLLING_INTERVAL))
+            self.scheduler.run_pending(kickoff + timedelta(seconds=3 * RESULT_POLLING_INTERVAL))
+            self.assertEqual(3, poll_results.call_count)
+
+    def test_failing_receiver(self):
+        def fail(signal, **kwargs):
+            raise ValueError('receiver failed')
+        bettable_closed.connect(fail, dispatch_uid='test_failing_receiver')
+        try:
+            with self.assertLogs(scheduler.LOG, 'ERROR'), \
+                    mock.patch.object(DeadlineScheduler, 'poll_results', return_value=False):
+                self.scheduler.run_pending(self.now + timedelta(hours=2))
+        finally:
+            bettable_closed.disconnect(dispatch_uid='test_failing_receiver')
+
+        # the other receivers and events are not affected
+        self.assertEqual([(bettable_closed, self.extra.pk), (bettable_closed, self.game.pk),
+                          (game_kicked_off, self.game.pk)], self.events)
+
+    def test_failing_poll(self):
+        kickoff = self.now + timedelta(hours=1)
+        with mock.patch.object(DeadlineScheduler, 'poll_results', side_effect=ConnectionError) as poll_results, \
+                self.assertLogs(scheduler.LOG, 'ERROR'):
+            self.scheduler.run_pending(kickoff)
+            self.scheduler.run_pending(kickoff + timedelta(seconds=RESULT_POLLING_INTERVAL))
+
+        # polled again after the interval
+        self.assertEqual(2, poll_results.call_count)
+
+    def test_run_continues_after_errors(self):
+        class Stop(Exception):
+            pass
+
+        with mock.patch.object(DeadlineScheduler, 'start'), \
+                mock.patch.object(DeadlineScheduler, 'load', side_effect=[ValueError, None]) as load, \
+                mock.patch.object(scheduler, 'close_old_connections') as close_old_connections, \
+                mock.patch.object(scheduler.time, 'sleep', side_effect=[None, Stop]), \
+                self.assertLogs(scheduler.LOG, 'ERROR'):
+            self.assertRaises(Stop, self.scheduler.run)
+
+        self.assertEqual(2, load.call_count)
+        self.assertEqual(2, close_old_connections.call_count)
+
+    @override_settings(SIMULATION_SAMPLES=200)
+    def test_simulation_refreshed(self):
+        cache.clear()
+        with mock.patch.object(DeadlineScheduler, 'poll_results', return_value=False):
+            self.scheduler.run_pending(self.now)
+            self.assertEqual([self.user.pk], [result['user'] for result in stored_simulation(200)])
+
+            # WHEN: a new user places a bet
+            other_user = utils.create_user(last_login=self.now)
+            with self.captureOnCommitCallbacks(execute=True):
+                utils.create_bet(other_user, self.game, '1:1')
+
+            # THEN: the latest results are kept until the next simulation is due
+            self.scheduler.run_pending(self.now + timedelta(seconds=SIMULATION_INTERVAL - 1))
+            self.assertEqual(1, len(stored_simulation(200)))
+            self.scheduler.run_pending(self.now + timedelta(seconds=SIMULATION_INTERVAL))
+            self.assertEqual({self.user.pk, other_user.pk}, {result['user'] for result in stored_simulation(200)})
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from main.models import Bet, RankSnapshot, Statistic
+from main.scoring import ScoringTable, get_scoring_table
+from main.test.utils import TestModelUtils as utils
+
+BET_POINTS = {'volltreffer': 3, 'differenz': 2, 'remis_tendenz': 1, 'tendenz': 1, 'niete': 0}
+CHANGED_BET_POINTS = {'volltreffer': 5, 'differenz': 3, 'remis_tendenz': 2, 'tendenz': 1, 'niete': 0}
+
+
+class ScoringTableTests(TestCase):
+
+    def tearDown(self):
+        User.objects.all().delete()
+        Statistic.objects.all().delete()
+
+    def test_score_game_bet(self):
+        table = ScoringTable(BET_POINTS)
+        self.assertEqual(('volltreffer', 3), table.score_game_bet(3, 1, 3, 1))
+        self.assertEqual(('volltreffer', 3), table.score_game_bet(0, 0, 0, 0))
+        self.assertEqual(('differenz', 2), table.score_game_bet(6, 2, 4, 0))
+        self.assertEqual(('differenz', 2), table.score_game_bet(0, 1, 1, 2))
+        self.assertEqual(('remis_tendenz', 1), table.score_game_bet(3, 3, 1, 1))
+        self.assertEqual(('tendenz', 1), table.score_game_bet(3, 0, 2, 1))
+        self.assertEqual(('tendenz', 1), table.score_game_bet(0, 3, 1, 2))
+        self.assertEqual(('niete', 0), table.score_game_bet(0, 1, 2, 1))
+        self.assertEqual(('niete', 0), table.score_game_bet(1, 2, 0, 0))
+        self.assertEqual(('niete', 0), table.score_game_bet(0, 0, 1, 0))
+
+    def test_score_game_bet_beyond_lookup_range(self):
+        table = ScoringTable(BET_POINTS, max_goal_diff=2)
+        self.assertEqual(('remis_tendenz', 1), table.score_game_bet(300, 300, 1000, 1000))
+        self.assertEqual(('differenz', 2), table.score_game_bet(30, 0, 40, 10))
+        self.assertEqual(('tendenz', 1), table.score_game_bet(30, 0, 4, 1))
+        self.assertEqual(('niete', 0), table.score_game_bet(0, 30, 4, 1))
+
+    def test_score_game_bet_like_the_rules(self):
+        table = ScoringTable(BET_POINTS)
+        for bet_hg in range(8):
+            for bet_ag in range(8):
+                for result_hg in range(8):
+                    for result_ag in range(8):
+                        self.assertEqual(self.score_by_rules(bet_hg, bet_ag, result_hg, result_ag),
+                                         table.score_game_bet(bet_hg, bet_ag, result_hg, result_ag)[0])
+
+    def test_score_extra_bet(self):
+        table = ScoringTable(BET_POINTS)
+        self.assertEqual(('volltreffer', 7), table.score_extra_bet('Schweiz', 'Schweiz', 7))
+        self.assertEqual(('niete', 0), table.score_extra_bet('Belgien', 'Schweiz', 7))
+
+    def test_scoring_table_compiled_once(self):
+        self.assertIs(get_scoring_table(), get_scoring_table())
+        with override_settings(BET_POINTS=CHANGED_BET_POINTS):
+            self.assertEqual(5, get_scoring_table().bet_points['volltreffer'])
+
+    def test_rescore_bets_if_changed(self):
+        u = utils.create_user(last_login=timezone.now())
+        g = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            bet = utils.create_bet(u, g, '2:1')
+            g.set_result_goals(2, 1)
+
+        call_command('rescore_bets', if_changed=True, stdout=StringIO())
+        self.assertEqual(3, Bet.objects.get(pk=bet.pk).points)
+
+        with override_settings(BET_POINTS=CHANGED_BET_POINTS):
+            call_command('rescore_bets', if_changed=True, stdout=StringIO())
+
+        self.assertEqual(5, Bet.objects.get(pk=bet.pk).points)
+        self.assertEqual(5, Statistic.objects.get(user=u).points)
+        # the rank history shows the rescored points
+        self.assertEqual([5], RankSnapshot.objects.get(game=g).get_points())
+
+    @staticmethod
+    def score_by_rules(bet_hg, bet_ag, result_hg, result_ag):
+        if (bet_hg, bet_ag) == (result_hg, result_ag):
+            return 'volltreffer'
+        if bet_hg - bet_ag == result_hg - result_ag:
+            return 'remis_tendenz' if result_hg == result_ag else 'differenz'
+        if (bet_hg - bet_ag) * (result_hg - result_ag) > 0:
+            return 'tendenz'
+        return 'niete'
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from main.models import ExtraChoice
+from main.scenarios import ScenarioSnapshot
+from main.simulation import TournamentSimulation, simulate_tournament, simulation_cache_key
+from main.test.utils import TestModelUtils as utils
+
+
+class TournamentSimulationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.leader, self.chaser, self.hopeless = \
+            [utils.create_user(username=name, last_login=timezone.now()) for name in ('leader', 'chaser', 'hopeless')]
+        finished = utils.create_game()
+        self.open_game = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(self.leader, finished, '2:0')
+            utils.create_bet(self.chaser, finished, '1:0')
+            utils.create_bet(self.leader, self.open_game, '1:0')
+            utils.create_bet(self.chaser, self.open_game, '0:1')
+            finished.set_result_goals(2, 0)
+
+    def test_probabilities(self):
+        results = {result['username']: result for result in simulate_tournament(2000, seed=4711)}
+
+        # the leader (3 points) is only overtaken if the chaser (2 points) gets more than 1 point for the open game
+        self.assertGreater(results['leader']['first'], results['chaser']['first'])
+        self.assertGreater(results['chaser']['first'], 0)
+        self.assertAlmostEqual(1, sum(result['first'] for result in results.values()))
+        self.assertAlmostEqual(1, sum(result['last'] for result in results.values()))
+        for result in results.values():
+            self.assertEqual(1, result['top3'])
+
+        # nobody can catch up without any bets
+        self.assertEqual(0, results['hopeless']['first'])
+        self.assertEqual(1, results['hopeless']['last'])
+
+    def test_extras(self):
+        extra = utils.create_extra(points=10)
+        for choice in ('Schweiz', 'Belgien'):
+            ExtraChoice.objects.create(name=choice, extra=extra)
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(self.hopeless, extra, 'Schweiz')
+
+        results = {result['username']: result for result in simulate_tournament(2000, seed=4711)}
+
+        # the extra bet is right in half of the samples, which is enough for the lead, otherwise it stays last
+        self.assertAlmostEqual(0.5, results['hopeless']['first'], delta=0.05)
+        self.assertAlmostEqual(0.5, results['hopeless']['last'], delta=0.05)
+
+    def test_seeded_runs_are_reproducible(self):
+        simulation = TournamentSimulation(ScenarioSnapshot())
+        self.assertEqual(simulation.run(1000, seed=1), simulation.run(1000, seed=1))
+
+    def test_command_stores_results(self):
+        out = StringIO()
+        call_command('simulate_tournament', samples=500, workers=1, seed=1, stdout=out)
+
+        self.assertIn('Simulated 500 tournaments', out.getvalue())
+        self.assertEqual(['leader', 'chaser', 'hopeless'],
+                         [result['username'] for result in cache.get(simulation_cache_key(500))])
@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 import time
 from datetime import datetime
+from io import StringIO
 from random import randrange
+from unittest import mock
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from main.models import Statistic, ResultBetType, timedelta
+from main.models import Statistic, ResultBetType, Bet, Bettable, Extra, Game, timedelta
 from main.test.utils import TestModelUtils as utils
 
 
@@ -108,3 +113,179 @@ class StatisticTests(TestCase):
         self.assertEqual(0, u2_stats.no_remis_tendenz)
         self.assertEqual(0, u2_stats.no_tendenz)
         self.assertEqual(0, u2_stats.no_niete)
+
+    def test_apply_bet_changes(self):
+        # GIVEN: some users with bets on a game
+        u1, u2 = utils.create_user('Queen'), utils.create_user('King')
+        g1 = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(u1, g1, "2:1")
+            utils.create_bet(u2, g1, "1:1")
+
+        # WHEN: the game gets a result
+        with self.captureOnCommitCallbacks(execute=True):
+            g1.set_result_goals(2, 1)
+
+        # THEN: the incrementally maintained stats equal the recalculated ones
+        self.assert_statistic_consistent(u1)
+        self.assert_statistic_consistent(u2)
+        self.assertEqual(1, Statistic.objects.get(user=u1).no_volltreffer)
+        self.assertEqual(1, Statistic.objects.get(user=u2).no_niete)
+
+        # WHEN: the result is corrected
+        with self.captureOnCommitCallbacks(execute=True):
+            g1.set_result_goals(0, 0)
+
+        # THEN: the deltas of old and new result bet type have been applied
+        self.assert_statistic_consistent(u1)
+        self.assert_statistic_consistent(u2)
+        self.assertEqual(0, Statistic.objects.get(user=u1).no_volltreffer)
+        self.assertEqual(1, Statistic.objects.get(user=u1).no_niete)
+        self.assertEqual(1, Statistic.objects.get(user=u2).no_remis_tendenz)
+
+        # WHEN: the result is removed
+        with self.captureOnCommitCallbacks(execute=True):
+            g1.remove_result()
+
+        # THEN: the points are removed from the stats again
+        self.assert_statistic_consistent(u1)
+        self.assert_statistic_consistent(u2)
+        self.assertEqual(0, Statistic.objects.get(user=u1).points)
+        self.assertEqual(0, Statistic.objects.get(user=u2).points)
+
+    def test_update_writes_changed_fields_only(self):
+        u1 = utils.create_user('Queen')
+        statistic = Statistic.objects.get(user=u1)
+        Bet.objects.create(user=u1, bettable=utils.create_game(), result_bet='1:0')
+
+        # WHEN: a delta is applied after the statistic has been read
+        Statistic.apply_bet_changes([(u1.pk, None, None, ResultBetType.volltreffer.name, 5)])
+
+        # THEN: updating the number of bets does not overwrite the delta
+        self.assertEqual(['no_bets'], statistic.update())
+        statistic.refresh_from_db()
+        self.assertEqual((1, 5, 1), (statistic.no_bets, statistic.points, statistic.no_volltreffer))
+
+    def test_apply_bet_changes_groups_users(self):
+        users = [utils.create_user() for i in range(10)]
+
+        # all users with the same delta are updated by a single query
+        with self.assertNumQueries(2):
+            Statistic.apply_bet_changes([(u.pk, None, None, ResultBetType.volltreffer.name, 3) for u in users[:5]] +
+                                        [(u.pk, None, None, ResultBetType.niete.name, 0) for u in users[5:]])
+
+        self.assertEqual(3, Statistic.objects.get(user=users[0]).points)
+        self.assertEqual(1, Statistic.objects.get(user=users[0]).no_volltreffer)
+        self.assertEqual(0, Statistic.objects.get(user=users[9]).points)
+        self.assertEqual(1, Statistic.objects.get(user=users[9]).no_niete)
+
+    def test_recalculate_points_command(self):
+        # GIVEN: some users with bets on a game whose result has been changed without scoring
+        users = [utils.create_user() for i in range(5)]
+        g1, g2 = utils.create_game(), utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            [utils.create_bet(u, g1, "2:1") for u in users]
+            utils.create_bet(users[0], g2, "0:0")
+        Game.objects.filter(pk=g1.pk).update(homegoals=3, awaygoals=2)
+        Bettable.objects.filter(pk=g1.pk).update(result='3:2')
+
+        # WHEN: recalculating in chunks
+        call_command('recalculate_points', chunk_size=2, stdout=StringIO())
+
+        # THEN: the bets have been rescored and all stats are consistent
+        self.assertEqual(2, Bet.objects.get(user=users[0], bettable=g1).points)
+        for u in users:
+            self.assert_statistic_consistent(u)
+            self.assertEqual(2, Statistic.objects.get(user=u).points)
+        self.assertEqual(2, Statistic.objects.get(user=users[0]).no_bets)
+
+        # WHEN: a stored stat is off and recalculating as dry-run
+        Statistic.objects.filter(user=users[1]).update(points=42, no_differenz=0)
+        out = StringIO()
+        call_command('recalculate_points', dry_run=True, stdout=out)
+
+        # THEN: the differences are reported, but nothing is written
+        self.assertIn('user %i: no_differenz 0 -> 1, points 42 -> 2' % users[1].pk, out.getvalue())
+        self.assertIn('Would update 1 of 5 statistics', out.getvalue())
+        self.assertEqual(42, Statistic.objects.get(user=users[1]).points)
+
+    def test_update_max_points(self):
+        u1, u2, u3 = utils.create_user(), utils.create_user(), utils.create_user()
+        past = utils.create_datetime_from_now(timedelta(hours=-1))
+        finished = utils.create_game(kickoff=past)
+        closed = utils.create_game(kickoff=past)
+        utils.create_game()
+        closed_extra = utils.create_extra(points=10, deadline=past)
+        utils.create_extra(points=7, deadline=utils.create_datetime_from_now(timedelta(days=1)))
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(u1, finished, '1:0')
+            utils.create_bet(u1, closed, '2:2')
+            utils.create_bet(u1, closed_extra, 'Schweiz')
+            utils.create_bet(u2, closed, '0:0')
+            utils.create_bet(u3, closed, '')
+            finished.set_result_goals(1, 0)
+
+        # all users can still win the open game and extra (3 + 7), the closed ones only with a bet
+        with self.assertNumQueries(5):
+            Statistic.update_max_points()
+        self.assertEqual(3 + 10 + 3 + 10, Statistic.objects.get(user=u1).max_points)
+        self.assertEqual(0 + 10 + 3, Statistic.objects.get(user=u2).max_points)
+        self.assertEqual(0 + 10, Statistic.objects.get(user=u3).max_points)
+
+        # WHEN: the closed game gets a result
+        with self.captureOnCommitCallbacks(execute=True):
+            closed.set_result_goals(0, 0)
+
+        # THEN: the maximum points are updated along with the points
+        self.assertEqual(3 + 1 + 10 + 10, Statistic.objects.get(user=u1).max_points)
+        self.assertEqual(3 + 10, Statistic.objects.get(user=u2).max_points)
+
+    def test_max_points_of_created_bettables_updated_once(self):
+        user = utils.create_user()
+
+        # WHEN: several bettables are created within one transaction
+        with mock.patch.object(Statistic, 'update_max_points', wraps=Statistic.update_max_points) as update_max_points:
+            with self.captureOnCommitCallbacks(execute=True):
+                Game.objects.create(kickoff=utils.create_datetime_from_now(timedelta(days=1)),
+                                    deadline=utils.create_datetime_from_now(timedelta(days=1)),
+                                    hometeam=utils.create_team(), awayteam=utils.create_team(),
+                                    venue=utils.create_venue(), round=utils.create_round())
+                Extra.objects.create(name='Weltmeister', points=7,
+                                     deadline=utils.create_datetime_from_now(timedelta(days=1)))
+                self.assertEqual(0, update_max_points.call_count)
+
+        # THEN: the maximum points are updated once, when the transaction is committed
+        self.assertEqual(1, update_max_points.call_count)
+        self.assertEqual(3 + 7, Statistic.objects.get(user=user).max_points)
+
+    def test_update_max_points_of_affected_users(self):
+        u1, u2 = utils.create_user(), utils.create_user()
+        closed = utils.create_game(kickoff=utils.create_datetime_from_now(timedelta(hours=-1)))
+        open_game = utils.create_game()
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_bet(u1, closed, '1:0')
+        Statistic.update_max_points()
+        self.assertEqual(3 + 3, Statistic.objects.get(user=u1).max_points)
+        self.assertEqual(3, Statistic.objects.get(user=u2).max_points)
+        Statistic.objects.filter(user=u2).update(max_points=42)
+
+        # placing a bet on an open bettable does not change anyone's maximum points
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                utils.create_bet(u2, open_game, '0:0')
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE') and
+                          'max_points' in query['sql']])
+
+        # a result only changes the maximum points of the users who bet on it
+        with self.captureOnCommitCallbacks(execute=True):
+            closed.set_result_goals(1, 0)
+        self.assertEqual(3 + 3, Statistic.objects.get(user=u1).max_points)
+        self.assertEqual(42, Statistic.objects.get(user=u2).max_points)
+
+    def assert_statistic_consistent(self, user):
+        stored = Statistic.objects.get(user=user)
+        recalculated = Statistic.objects.get(user=user)
+        recalculated.update()
+        for field in ('points', 'no_bets', 'no_volltreffer', 'no_differenz', 'no_remis_tendenz', 'no_tendenz',
+                      'no_niete'):
+            self.assertEqual(getattr(recalculated, field), getattr(stored, field))
@@ -7,7 +7,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 
 from main.models import TournamentGroup, TournamentRound, Game, Venue, Team, Extra, ExtraChoice, Post, Bet, Profile, \
-    Comment
+    Comment, scoring_queue
 from main.registration_overrides import USERNAME_CHARACTERS
 
 
@@ -54,8 +54,10 @@ class TestModelUtils:
         venue = venue or TestModelUtils.create_venue()
         round = round or TestModelUtils.create_round()
 
-        return Game.objects.create(kickoff=kickoff, deadline=deadline, homegoals=homegoals, awaygoals=awaygoals,
+        game = Game.objects.create(kickoff=kickoff, deadline=deadline, homegoals=homegoals, awaygoals=awaygoals,
                                    hometeam=hometeam, awayteam=awayteam, venue=venue, round=round)
+        TestModelUtils.flush_scoring_queue()
+        return game
 
     @staticmethod
     def create_bet(user=None, bettable=None, result_bet='', result_bet_type=None, points=None):
@@ -99,7 +101,15 @@ class TestModelUtils:
     def create_extra(name=None, points=10, deadline=timezone.now(), result=''):
         name = name or TestModelUtils.create_random_string(6)
 
-        return Extra.objects.create(name=name, points=points, deadline=deadline, result=result)
+        extra = Extra.objects.create(name=name, points=points, deadline=deadline, result=result)
+        TestModelUtils.flush_scoring_queue()
+        return extra
+
+    @staticmethod
+    def flush_scoring_queue():
+        # the test transaction is never committed, so the maximum points of a created bettable are updated right away
+        # and later writes register a flush of their own (cf. ScoringQueue.register())
+        scoring_queue.flush()
 
     @staticmethod
     def create_extrachoice(name=None, extra=None, sort_index=''):
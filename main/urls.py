@@ -21,6 +21,8 @@ router.register(r'users_admin', views.AdminUserViewSet, 'users_admin')
 router.register(r'posts', views.PostViewSet)
 router.register(r'comments', views.CommentViewSet)
 router.register(r'statistics', views.StatisticViewSet)
+router.register(r'statistics-rounds', views.RoundStatisticViewSet)
+router.register(r'statistics-matchdays', views.MatchdayStatisticViewSet)
 
 app_name = 'rtg'
 urlpatterns = [
@@ -1,12 +1,15 @@
 import inspect
 import os
 import re
+import time
 import uuid
 from enum import Enum
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.text import slugify
 
 from main.models import User
@@ -24,6 +27,30 @@ def get_reference_date():
     return settings.FAKE_DATE if hasattr(settings, 'FAKE_DATE') else timezone.now()
 
 
+def parse_reference_date(value):
+    """ Parses an ISO 8601 date time into an aware date time in the current time zone, raises ValueError if invalid """
+    reference_date = parse_datetime(value)
+    if reference_date is None:
+        raise ValueError('Invalid date time: %s' % value)
+    return reference_date if timezone.is_aware(reference_date) else timezone.make_aware(reference_date)
+
+
+def get_version(name):
+    """
+        Returns the current version of the named data, to be used in cache keys of data derived from it.
+        Starts from the current time, so that keys of a flushed cache are not re-used.
+    """
+    return cache.get_or_set('version:%s' % name, lambda: int(time.time() * 1000), timeout=None)
+
+
+def bump_version(name):
+    """ Invalidates all cache entries of the named data by changing its version """
+    try:
+        cache.incr('version:%s' % name)
+    except ValueError:
+        get_version(name)
+
+
 def game_to_string(game):
     return str(game.hometeam.name) + ' - ' + str(game.awayteam.name)
 
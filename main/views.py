@@ -1,12 +1,16 @@
 import logging
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail, EmailMessage
-from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.db.models import Count, Max, Q
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse
 from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, status
+from rest_framework import exceptions, viewsets, status
 from rest_framework.decorators import action, parser_classes
 from rest_framework.filters import OrderingFilter
 from rest_framework.parsers import FormParser
@@ -14,8 +18,16 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST
 
-from main import filters as rtgfilters
-from main.utils import sizeof_fmt, active_users
+from main import filters as rtgfilters, utils
+from main.caching import ConditionalListMixin, TournamentDataCacheMixin, passed_moments_validator, single_flight
+from main.bets_matrix import closed_bets_matrix, seconds_until_next_deadline
+from main.scenarios import get_scenario_snapshot
+from main.simulation import stored_simulation
+from main.leaderboard import (aggregated_leaderboard, period_leaderboard, set_rank_bounds, live_scores,
+                              provisional_leaderboard, provisional_leaderboard_cache_key, rank_history,
+                              as_of_leaderboard_cache_key, PROVISIONAL_LEADERBOARD_CACHE_TIMEOUT,
+                              AS_OF_LEADERBOARD_CACHE_TIMEOUT)
+from main.utils import sizeof_fmt, active_users, get_reference_date, parse_reference_date
 from . import permissions as rtg_permissions
 from .forms import RtgContactForm
 from .serializers import *
@@ -27,8 +39,19 @@ def health(request):
     return HttpResponse(content='OK')
 
 
+def get_as_of(request):
+    """ The optional as_of query parameter, an ISO 8601 date time to query past states of the tournament """
+    as_of = request.query_params.get('as_of', None)
+    if as_of is None:
+        return None
+    try:
+        return parse_reference_date(as_of)
+    except ValueError:
+        raise exceptions.ValidationError({'as_of': 'Expected an ISO 8601 date time.'})
+
+
 # TODO P2 add admin endpoint for recalculating the statistics
-class BetViewSet(viewsets.ModelViewSet):
+class BetViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Bet.objects.all()
     serializer_class = BetSerializer
 
@@ -44,6 +67,11 @@ class BetViewSet(viewsets.ModelViewSet):
     ordering_fields = ('id', 'bettable')
     ordering = ('id',)
 
+    def get_list_validator(self, request):
+        # the visible bets change with every placed bet, scored result or passed deadline
+        bets = self.filter_queryset(self.get_queryset()).aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+        return '%s:%i:%s' % (request.user.pk, bets['count'], bets['updated_at'])
+
     def perform_create(self, serializer):
         """ Always set the Bet user to the current user. """
         serializer.save(user=self.request.user)
@@ -52,22 +80,40 @@ class BetViewSet(viewsets.ModelViewSet):
         """ Always set the Bet user to the current user. """
         serializer.save(user=self.request.user)
 
+    @action(detail=False)
+    def matrix(self, request, *args, **kwargs):
+        """
+            All bets on closed bettables as columns of result bets per bettable, aligned with the list of users.
+            Much more compact than the list of bets, and cached until the next deadline passes.
+        """
+        data = cache.get(Bet.CLOSED_BETS_CACHE_KEY)
+        if data is None:
+            reference_date = get_reference_date()
+            data = closed_bets_matrix(reference_date)
+            cache.set(Bet.CLOSED_BETS_CACHE_KEY, data, timeout=seconds_until_next_deadline(reference_date))
+        return Response(data)
+
     def get_queryset(self):
         """
             Optionally restricts the returned bets to a given user or game,
             by filtering against query parameters in the URL.
         """
-        queryset = Bet.objects.all()
+        # the serializer reads the kind of each bettable
+        queryset = Bet.objects.select_related('bettable')
         user_id = self.request.query_params.get('user_id', None)
         bettable_id = self.request.query_params.get('bettable_id', None)
         if user_id is not None:
             queryset = queryset.filter(user__pk=user_id)
         if bettable_id is not None:
             queryset = queryset.filter(bettable__pk=bettable_id)
+        # only the bets whose result was known at the given time
+        as_of = get_as_of(self.request)
+        if as_of is not None:
+            queryset = queryset.filter(bettable__result_entered_at__lte=as_of)
         return queryset
 
 
-class BettableViewSet(viewsets.ReadOnlyModelViewSet):
+class BettableViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Bettable.objects.all()
     serializer_class = BettableSerializer
     pagination_class = None
@@ -77,31 +123,62 @@ class BettableViewSet(viewsets.ReadOnlyModelViewSet):
     ordering_fields = ('id', 'deadline')
     ordering = ('deadline',)
 
+    # the snapshot is re-built when an admin corrects a result or a bet, so clients revalidate it with the ETag,
+    # which is answered by 304 Not Modified as long as it is unchanged
+    CLOSED_BETS_CACHE_CONTROL = 'private, no-cache'
+
+    @action(detail=True)
+    def bets(self, request, *args, **kwargs):
+        """
+            The bets on a closed bettable from the snapshot frozen at its deadline (cf. build_bets_snapshots),
+            served pre-compressed with an ETag instead of querying and serializing the bets on every request.
+        """
+        bettable = self.get_object()
+        if not bettable.deadline_passed():
+            return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+        snapshot = BetsSnapshot.objects.filter(bettable=bettable).first() or BetsSnapshot.build(bettable)
+
+        etag = '"%s"' % snapshot.etag
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = HttpResponse(snapshot.content, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(snapshot.get_data(), content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = self.CLOSED_BETS_CACHE_CONTROL
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
 
-class ExtraViewSet(viewsets.ModelViewSet):
-    queryset = Extra.objects.all()
+
+class ExtraViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
+    queryset = Extra.objects.prefetch_related('choices')
     serializer_class = ExtraSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
     pagination_class = None
 
     filter_backends = (rtgfilters.BettablesWithBetsOpenIfParamSet,)
 
+    def get_serializer_context(self):
+        return dict(super(ExtraViewSet, self).get_serializer_context(), reference_date=utils.get_reference_date())
+
 
-class TournamentGroupViewSet(viewsets.ModelViewSet):
+class TournamentGroupViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
     queryset = TournamentGroup.objects.all()
     serializer_class = TournamentGroupSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
     pagination_class = None
 
 
-class TournamentRoundViewSet(viewsets.ModelViewSet):
+class TournamentRoundViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
     queryset = TournamentRound.objects.all()
     serializer_class = TournamentRoundSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
     pagination_class = None
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
@@ -112,7 +189,7 @@ class TeamViewSet(viewsets.ModelViewSet):
     ordering = ('name',)
 
 
-class VenueViewSet(viewsets.ModelViewSet):
+class VenueViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
@@ -124,18 +201,47 @@ class VenueViewSet(viewsets.ModelViewSet):
     ordering = ('city',)
 
 
-class GameViewSet(viewsets.ModelViewSet):
-    queryset = Game.objects.all()
+class GameViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ModelViewSet):
+    # everything the serializer touches per game is joined, so listing games takes a constant number of queries
+    queryset = Game.objects.select_related('venue', 'round', 'hometeam__group', 'awayteam')
     serializer_class = GameSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
 
-    filter_backends = (OrderingFilter, rtgfilters.BettablesWithBetsOpenIfParamSet, rtgfilters.GamesFromDate, rtgfilters.GamesKickedOff)
+    filter_backends = (OrderingFilter, rtgfilters.BettablesWithBetsOpenIfParamSet, rtgfilters.GamesFromDate,
+                       rtgfilters.GamesKickedOff)
 
     ordering_fields = ('id', 'kickoff', 'deadline', 'venue', 'round')
     ordering = ('kickoff', 'id',)
 
+    def get_serializer_context(self):
+        return dict(super(GameViewSet, self).get_serializer_context(), reference_date=utils.get_reference_date())
 
-class GameKickoffsViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=True, methods=['POST', 'DELETE'], permission_classes=[rtg_permissions.IsAdmin])
+    def result(self, request, *args, **kwargs):
+        """ Enters (POST) or removes (DELETE) the result of a game with a single write. """
+        game = self.get_object()
+        if request.method == 'DELETE':
+            game.remove_result()
+        else:
+            serializer = GameResultSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            game.set_result_goals(serializer.validated_data['homegoals'], serializer.validated_data['awaygoals'])
+        return Response(GameSerializer(game).data)
+
+    @action(detail=True, url_path='bet-distribution')
+    def bet_distribution(self, request, *args, **kwargs):
+        """
+            How many users bet on which scoreline and tendency. Only available after the deadline,
+            from then on the bets cannot change anymore, so the distribution is cached permanently.
+        """
+        game = self.get_object()
+        if not game.deadline_passed():
+            return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+        return Response(cache.get_or_set(Game.bet_distribution_cache_key(game.pk), game.get_bet_distribution,
+                                         timeout=None))
+
+
+class GameKickoffsViewSet(ConditionalListMixin, TournamentDataCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Game.objects.all()
     serializer_class = GameKickoffsSerializer
     permission_classes = (rtg_permissions.IsAdminOrAuthenticatedReadOnly,)
@@ -253,7 +359,7 @@ class CommentViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user)
 
 
-class StatisticViewSet(viewsets.ReadOnlyModelViewSet):
+class StatisticViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Statistic.objects.filter(user__pk__in=active_users())
     serializer_class = StatisticSerializer
     pagination_class = None
@@ -261,15 +367,177 @@ class StatisticViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (rtgfilters.RelatedOrderingFilter,)
     ordering = ('-points', '-no_volltreffer', 'user__username')
 
+    def is_aggregated(self):
+        return settings.LEADERBOARD_MODE == 'aggregated'
+
+    def get_list_validator(self, request):
+        # statistics are only changed by scoring, which bumps their version, new users have a statistic right away,
+        # changed usernames, avatars or deactivated users bump the version of the user data and logins change the
+        # number of active users
+        statistics = Statistic.objects.aggregate(count=Count('pk'),
+                                                 active=Count('pk', filter=Q(user__in=active_users())))
+        return '%s:%s:%s:%i:%i:%s' % (settings.LEADERBOARD_MODE, utils.get_version(Statistic.VERSION_KEY),
+                                      utils.get_version(USER_DATA_VERSION_KEY), statistics['count'],
+                                      statistics['active'], passed_moments_validator())
+
+    def get_queryset(self):
+        if self.is_aggregated():
+            return aggregated_leaderboard(active_users())
+        return super(StatisticViewSet, self).get_queryset()
+
+    def get_serializer_class(self):
+        return LeaderboardSerializer if self.is_aggregated() else StatisticSerializer
+
+    def filter_queryset(self, queryset):
+        # the aggregated leaderboard is already ordered by its rank
+        if self.is_aggregated():
+            return queryset
+        return super(StatisticViewSet, self).filter_queryset(queryset)
+
+    def get_object(self):
+        if self.is_aggregated():
+            # the rank is computed over all users, so the user must not be filtered before the window is applied
+            user_pk = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            for user in self.get_queryset():
+                if str(user.pk) == user_pk:
+                    return user
+            raise Http404
+        return super(StatisticViewSet, self).get_object()
+
     def list(self, request, *args, **kwargs):
         if not Game.tournament_has_started():
             return Response(status=status.HTTP_412_PRECONDITION_FAILED)
-        return super(StatisticViewSet, self).list(request, *args, **kwargs)
+
+        as_of = get_as_of(request)
+        if as_of is not None:
+            return Response(self.as_of_leaderboard(as_of))
+
+        return self.conditional_response(request, lambda: self.leaderboard_response(request))
+
+    @staticmethod
+    def as_of_leaderboard(as_of):
+        """ The serialized leaderboard as it stood at the given time, always aggregated from the bets """
+        return cache.get_or_set(
+            as_of_leaderboard_cache_key(as_of),
+            lambda: LeaderboardSerializer(aggregated_leaderboard(active_users(), as_of), many=True).data,
+            timeout=AS_OF_LEADERBOARD_CACHE_TIMEOUT)
+
+    @single_flight('leaderboard', lambda view, request: view.get_list_validator(request))
+    def leaderboard_response(self, request):
+        # the list is never paginated, so it contains all users of the leaderboard
+        statistics = list(self.filter_queryset(self.get_queryset()))
+        set_rank_bounds(statistics, [(statistic.points, statistic.max_points) for statistic in statistics])
+        return Response(self.get_serializer(statistics, many=True).data)
 
     def retrieve(self, request, *args, **kwargs):
         if not Game.tournament_has_started():
             return Response(status=status.HTTP_412_PRECONDITION_FAILED)
-        return super(StatisticViewSet, self).retrieve(request, *args, **kwargs)
+
+        as_of = get_as_of(request)
+        if as_of is not None:
+            # the same entry as in the list at that time
+            user_pk = str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+            for entry in self.as_of_leaderboard(as_of):
+                if str(entry['user']) == user_pk:
+                    return Response(entry)
+            raise Http404
+
+        statistic = self.get_object()
+        set_rank_bounds([statistic], Statistic.objects.filter(user__pk__in=active_users())
+                        .values_list('points', 'max_points'))
+        return Response(self.get_serializer(statistic).data)
+
+    @action(detail=False)
+    def provisional(self, request, *args, **kwargs):
+        """
+            The leaderboard as if the running games ended with their current live scores.
+            Cached per live-score state, so polling it during a matchday is cheap.
+        """
+        if not Game.tournament_has_started():
+            return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+
+        scores = live_scores()
+        data = cache.get_or_set(
+            provisional_leaderboard_cache_key(scores),
+            lambda: ProvisionalStatisticSerializer(provisional_leaderboard(
+                Statistic.objects.filter(user__pk__in=active_users()).select_related('user__profile'), scores),
+                many=True).data,
+            timeout=PROVISIONAL_LEADERBOARD_CACHE_TIMEOUT)
+        return Response(data)
+
+    @action(detail=False, methods=['POST'], url_path='what-if')
+    def what_if(self, request, *args, **kwargs):
+        """
+            The leaderboard and the rank of the requesting user if the given unfinished games and extras
+            ended with the given hypothetical results. Computed in memory, nothing is persisted.
+        """
+        serializer = WhatIfSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        snapshot = get_scenario_snapshot()
+        points, ranks, order = snapshot.standings(
+            {game['game']: (game['homegoals'], game['awaygoals']) for game in serializer.validated_data['games']},
+            {extra['extra']: extra['result'] for extra in serializer.validated_data['extras']})
+
+        user_ids, usernames, points, ranks = \
+            snapshot.user_ids.tolist(), snapshot.usernames.tolist(), points.tolist(), ranks.tolist()
+        leaderboard = [{'user': user_ids[i], 'username': usernames[i], 'points': points[i], 'rank': ranks[i]}
+                       for i in order.tolist()]
+        own_position = next((i for i, user_id in enumerate(user_ids) if user_id == request.user.pk), None)
+        return Response({
+            'leaderboard': leaderboard,
+            'rank': ranks[own_position] if own_position is not None else None,
+            'points': points[own_position] if own_position is not None else None,
+        })
+
+    @action(detail=False)
+    def simulation(self, request, *args, **kwargs):
+        """
+            The chances of each user to finish first, within the top 3 or last, by simulating the remaining
+            games and extras. Only stored results are served (cf. the scheduler and the simulate_tournament command),
+            the latest ones until the current bets and results have been simulated.
+        """
+        results = stored_simulation(settings.SIMULATION_SAMPLES)
+        if results is None:
+            return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+        return Response(results)
+
+    @action(detail=False)
+    def history(self, request, *args, **kwargs):
+        """
+            Rank and points after each finished game: the curve of a single user (?user=<id>)
+            or the race chart of all users in one response.
+        """
+        user_id = request.query_params.get('user', None)
+        if user_id is None:
+            return Response(rank_history())
+        if not user_id.isdigit():
+            return Response(status=HTTP_400_BAD_REQUEST)
+        return Response(rank_history(int(user_id)))
+
+
+class RoundStatisticViewSet(viewsets.ReadOnlyModelViewSet):
+    """ Leaderboards of the tournament rounds (filter by round), read from the per round statistics only """
+    queryset = RoundStatistic.objects.filter(user__pk__in=active_users())
+    serializer_class = RoundStatisticSerializer
+
+    filter_backends = (DjangoFilterBackend,)
+    filterset_fields = ('round',)
+
+    def get_queryset(self):
+        return period_leaderboard(super(RoundStatisticViewSet, self).get_queryset(), 'round')
+
+
+class MatchdayStatisticViewSet(viewsets.ReadOnlyModelViewSet):
+    """ Leaderboards of the matchdays (filter by matchday=YYYY-MM-DD), read from the per matchday statistics only """
+    queryset = MatchdayStatistic.objects.filter(user__pk__in=active_users())
+    serializer_class = MatchdayStatisticSerializer
+
+    filter_backends = (DjangoFilterBackend,)
+    filterset_fields = ('matchday',)
+
+    def get_queryset(self):
+        return period_leaderboard(super(MatchdayStatisticViewSet, self).get_queryset(), 'matchday')
 
 
 ################## CONTACT FORM endpoint
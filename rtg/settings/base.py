@@ -241,6 +241,21 @@ LOGGING = {
 ########## END LOGGING CONFIGURATION
 
 
+########## SHARED CACHE CONFIGURATION
+# Cache shared by all app server processes and the scheduler, so that bumped data versions (cf. main.utils.bump_version)
+# invalidate the cached responses of every process. Stored in the database, run `manage.py createcachetable` once.
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'rtg_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+########## END SHARED CACHE CONFIGURATION
+
+
 ########## WSGI CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = 'wsgi.application'
@@ -316,6 +331,15 @@ BET_POINTS = {
     'niete': 0
 }
 
+# how the leaderboard of the statistics endpoint is computed:
+# 'stored' reads the incrementally maintained Statistic rows,
+# 'aggregated' computes it from all bets with one aggregate query (cf. the benchmark_leaderboard command)
+LEADERBOARD_MODE = 'stored'
+
+# number of simulated tournaments behind the chances of the statistics/simulation endpoint,
+# the endpoint only serves the results stored by the scheduler or the simulate_tournament command, which use this number
+SIMULATION_SAMPLES = 10000
+
 # 2.5MB - 2621440
 # 3MB - 3145728
 # 5MB - 5242880
@@ -58,11 +58,7 @@ DATABASES = {
 
 ########## CACHE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
-}
+CACHES = SHARED_CACHES
 ########## END CACHE CONFIGURATION
 
 ########## REST FRAMEWORK CONFIGURATION
@@ -94,6 +94,18 @@ def deploy(ctx, app_env):
             with ctx.cd(app_env['dir']):
                 ctx.run('${HOME}/v/%s/bin/python %s.py migrate' % (app_name, app_env['manage_script'],))
 
+            print("Creating the shared cache table if missing...")
+            with ctx.cd(app_env['dir']):
+                ctx.run('${HOME}/v/%s/bin/python %s.py createcachetable' % (app_name, app_env['manage_script'],))
+
+            print("Rescoring bets if the BET_POINTS rules have changed...")
+            with ctx.cd(app_env['dir']):
+                ctx.run('${HOME}/v/%s/bin/python %s.py rescore_bets --if-changed' % (app_name, app_env['manage_script'],))
+
+            print("Simulating the tournament for the statistics, refreshed by the scheduler afterwards...")
+            with ctx.cd(app_env['dir']):
+                ctx.run('${HOME}/v/%s/bin/python %s.py simulate_tournament' % (app_name, app_env['manage_script'],))
+
             print("Starting " + project_name + " app server...")
             ctx.run('${HOME}/init/%s start' % project_name)
 